@@ -19,6 +19,9 @@ ascmhl_folder_name = "ascmhl"
 ascmhl_file_extension = ".mhl"
 ascmhl_chainfile_name = "ascmhl_chain.xml"
 ascmhl_collectionfile_name = "ascmhl_collection.xml"
+ascmhl_journalfile_name = "ascmhl_journal.ndjson"
+ascmhl_hashcachefile_name = "ascmhl_hash_cache.db"
+ascmhl_manifestcachefile_name = "ascmhl_manifest_cache.ndjson"
 # decreasing priority list for verification
 ascmhl_supported_hashformats = [
     "md5",
@@ -9,11 +9,16 @@ __email__ = "opensource@pomfort.com"
 
 import os
 import shutil
+import sys
+from timeit import default_timer as timer
 
 import click
 from .history import MHLHistory
 from . import chain_xml_parser
 from . import hashlist_xml_parser
+from .engine import HashingEngine
+from .hasher import multiple_format_hash_file
+from .traverse import post_order_lexicographic, post_order_lexicographic_entries
 
 
 @click.command()
@@ -96,3 +101,144 @@ def create_dummy_folder(root_path, prefix, depth):
     for folder in range(0, num_folders):
         folder_name = prefix + chr(ord("A") + folder)
         create_dummy_folder(folder_path, folder_name, depth - 1)
+
+
+@click.command()
+@click.argument("root_path", type=click.Path(exists=True, file_okay=False))
+@click.option("--size", "-s", default=512, help="Size of the benchmark file in MB")
+@click.option("--repetitions", "-r", default=3, help="Number of runs per configuration, the fastest run is reported")
+def benchmark_hashing(root_path, size, repetitions):
+    """
+    compare serial and concurrent (one thread per format) hashing of two and three hash formats
+    """
+    file_path = os.path.join(root_path, "benchmark_hashing.bin")
+    print(f"create benchmark file {file_path} ({size} MB)")
+    chunk = os.urandom(1024 * 1024)
+    with open(file_path, "wb") as file_handle:
+        for _ in range(size):
+            file_handle.write(chunk)
+
+    try:
+        for hash_formats in [["md5", "sha1"], ["md5", "sha1", "c4"]]:
+            serial_duration = _fastest_run(
+                lambda: multiple_format_hash_file(file_path, hash_formats, concurrent=False), repetitions
+            )
+            concurrent_duration = _fastest_run(
+                lambda: multiple_format_hash_file(file_path, hash_formats, concurrent=True), repetitions
+            )
+            print(
+                f"{'+'.join(hash_formats):<12}"
+                f" serial: {size / serial_duration:8.1f} MB/s"
+                f"  threads: {size / concurrent_duration:8.1f} MB/s"
+                f"  speedup: {serial_duration / concurrent_duration:.2f}x"
+            )
+    finally:
+        os.remove(file_path)
+
+
+@click.command()
+@click.argument("root_path", type=click.Path(exists=True, file_okay=False))
+@click.option("--hash_format", "-h", multiple=True, default=["xxh64"], help="Hash format(s) to generate")
+@click.option("--jobs", "-j", default=1, help="Number of files that are hashed in parallel")
+@click.option("--repetitions", "-r", default=3, help="Number of runs per configuration, the fastest run is reported")
+def benchmark_small_files(root_path, hash_format, jobs, repetitions):
+    """
+    compare hashing small files one by one and in batches, e.g. in a tree from create_dummy_file_structure
+    """
+    hash_formats = list(hash_format)
+    configurations = [("files", "auto", False), ("batches", "auto", True)]
+    if jobs > 1:
+        configurations.append(("batches/processes", "processes", True))
+
+    num_files = 0
+    for _, children in post_order_lexicographic(root_path):
+        num_files += len([name for name, is_dir in children if not is_dir])
+    print(f"hash {num_files} files in {root_path} ({'+'.join(hash_formats)}, {jobs} jobs)")
+
+    def hash_all_files(engine):
+        for _ in engine.hash_folders(
+            post_order_lexicographic_entries(root_path), lambda file_path, file_stat: hash_formats
+        ):
+            pass
+
+    durations = {}
+    for name, backend, batch_small_files in configurations:
+        durations[name] = _fastest_run(
+            lambda: hash_all_files(HashingEngine(jobs, backend, batch_small_files=batch_small_files)), repetitions
+        )
+        print(
+            f"{name:<18} {num_files / durations[name]:10.0f} files/s"
+            f"  speedup: {durations['files'] / durations[name]:.2f}x"
+        )
+
+
+@click.command()
+@click.argument("root_path", type=click.Path(exists=True, file_okay=False))
+@click.option("--depth", "-d", default=1500, help="Number of nested folders of the deep tree")
+@click.option("--width", "-w", default=2000, help="Number of folders (with ten files each) of the wide tree")
+@click.option("--jobs", "-j", default=8, help="Number of folders that are listed in parallel")
+@click.option("--repetitions", "-r", default=3, help="Number of runs per configuration, the fastest run is reported")
+def benchmark_traversal(root_path, depth, width, jobs, repetitions):
+    """
+    compare the recursive and the iterative traversal of a deep and a wide synthetic folder hierarchy
+    """
+    deep_path = os.path.join(root_path, "benchmark_traversal_deep")
+    wide_path = os.path.join(root_path, "benchmark_traversal_wide")
+    print(f"create deep tree {deep_path} ({depth} levels) and wide tree {wide_path} ({width} folders)")
+    # os.makedirs recurses per missing level, so the nested folders are created one by one
+    folder_path = deep_path
+    os.mkdir(folder_path)
+    for _ in range(depth):
+        folder_path = os.path.join(folder_path, "d")
+        os.mkdir(folder_path)
+    for folder in range(width):
+        folder_path = os.path.join(wide_path, f"{folder:05}")
+        os.makedirs(folder_path)
+        for file in range(10):
+            with open(os.path.join(folder_path, f"{file:02}.txt"), "w") as file_handle:
+                file_handle.write(str(file))
+
+    configurations = [
+        ("recursive", lambda path: _recursive_post_order(path)),
+        ("iterative", lambda path: post_order_lexicographic(path)),
+        (f"iterative/{jobs} jobs", lambda path: post_order_lexicographic(path, jobs=jobs)),
+    ]
+    try:
+        for tree_name, tree_path in [("deep", deep_path), ("wide", wide_path)]:
+            num_folders = sum(1 for _ in post_order_lexicographic(tree_path))
+            for name, traversal in configurations:
+                try:
+                    duration = _fastest_run(lambda: sum(1 for _ in traversal(tree_path)), repetitions)
+                except RecursionError:
+                    print(f"{tree_name:<5} {name:<18} exceeds the recursion limit of {sys.getrecursionlimit()}")
+                    continue
+                print(f"{tree_name:<5} {name:<18} {num_folders / duration:10.0f} folders/s")
+    finally:
+        # shutil.rmtree recurses per level as well, the post order traversal yields the folders in removable order
+        for tree_path in [deep_path, wide_path]:
+            for folder_path, children in post_order_lexicographic(tree_path):
+                for name, is_dir in children:
+                    if not is_dir:
+                        os.remove(os.path.join(folder_path, name))
+                os.rmdir(folder_path)
+
+
+def _recursive_post_order(top):
+    # the former recursive traversal, as a baseline for benchmark_traversal
+    names = sorted(os.listdir(top))
+    children = [(name, os.path.isdir(os.path.join(top, name))) for name in names]
+    for name, is_dir in children:
+        path = os.path.join(top, name)
+        if is_dir and not os.path.islink(path):
+            for x in _recursive_post_order(path):
+                yield x
+    yield top, children
+
+
+def _fastest_run(function, repetitions):
+    durations = []
+    for _ in range(repetitions):
+        start = timer()
+        function()
+        durations.append(timer() - start)
+    return min(durations)
@@ -10,7 +10,7 @@ __email__ = "opensource@pomfort.com"
 
 import click
 
-from ascmhl import commands
+from ascmhl import commands, manifest_cache
 from ascmhl.cli.update import Updater
 
 updater = Updater()
@@ -23,8 +23,14 @@ class NaturalOrderGroup(click.Group):
 
 @click.group(cls=NaturalOrderGroup)
 @click.version_option()
-def mhldebugtool_cli():
-    pass
+@click.option(
+    "--paranoid",
+    default=False,
+    is_flag=True,
+    help="Hash all manifest files of the histories again instead of trusting the manifest cache",
+)
+def mhldebugtool_cli(paranoid):
+    manifest_cache.shared_manifest_cache.paranoid = paranoid
 
 
 @mhldebugtool_cli.result_callback()
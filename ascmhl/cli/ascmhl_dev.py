@@ -23,6 +23,9 @@ mhldevtool_cli.add_command(_debug_commands.readmhlfile)
 mhldevtool_cli.add_command(_debug_commands.readchainfile)
 mhldevtool_cli.add_command(_debug_commands.readmhlhistory)
 mhldevtool_cli.add_command(_debug_commands.create_dummy_file_structure, "create_dummy_file_structure")
+mhldevtool_cli.add_command(_debug_commands.benchmark_hashing, "benchmark_hashing")
+mhldevtool_cli.add_command(_debug_commands.benchmark_small_files, "benchmark_small_files")
+mhldevtool_cli.add_command(_debug_commands.benchmark_traversal, "benchmark_traversal")
 
 
 if __name__ == "__main__":
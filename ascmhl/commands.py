@@ -10,6 +10,9 @@ __email__ = "opensource@pomfort.com"
 import datetime
 import os
 import platform
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 
 import click
 from lxml import etree
@@ -26,12 +29,21 @@ from .__version__ import (
     ascmhl_tool_name,
     ascmhl_tool_version,
     ascmhl_default_hashformat,
+    ascmhl_hashcachefile_name,
+    ascmhl_journalfile_name,
 )
+from .completeness import MHLCompletenessCheck
+from .engine import HashingEngine, hashing_backends
 from .generator import MHLGenerationCreationSession
-from .hasher import hash_file, DirectoryHashContext, multiple_format_hash_file
+from .hash_cache import MHLHashCache
+from .hasher import hash_file, DirectoryHashContext, ReadOptions, multiple_format_hash_file, page_cache_modes
+from .hasher import hash_strings_from_digests, digests_from_hash_strings
 from .hashlist import MHLMediaHash, MHLCreatorInfo, MHLProcessInfo, MHLTool, MHLProcess, MHLAuthor
 from .history import MHLHistory
-from .traverse import post_order_lexicographic
+from .journal import MHLCreationJournal
+from .offload import StreamingCopier
+from .progress import ProgressWriter
+from .traverse import post_order_lexicographic, post_order_lexicographic_entries
 from typing import Dict
 from collections import namedtuple
 
@@ -122,6 +134,90 @@ from collections import namedtuple
     type=click.Path(exists=True),
     help="A file containing multiple file patterns to ignore.",
 )
+@click.option(
+    "--jobs",
+    "-j",
+    default=1,
+    type=click.IntRange(min=1),
+    help="Number of files that are hashed in parallel per device",
+)
+@click.option(
+    "--rotational_jobs",
+    "-rj",
+    default=1,
+    type=click.IntRange(min=1),
+    help="Number of files that are hashed in parallel per rotational disk (HDD), --jobs applies to other devices",
+)
+@click.option(
+    "--layout_order",
+    "-lo",
+    default=False,
+    is_flag=True,
+    help="Hash files in the order of their physical location on disk, e.g. for HDD archives and LTFS tapes",
+)
+@click.option(
+    "--enumeration_jobs",
+    "-ej",
+    default=1,
+    type=click.IntRange(min=1),
+    help="Number of folders that are listed in parallel, e.g. on network file systems",
+)
+@click.option(
+    "--hash_backend",
+    "-hb",
+    default="auto",
+    type=click.Choice(hashing_backends),
+    help="Backend for generating multiple hash formats per file",
+)
+@click.option(
+    "--use_mmap",
+    "-mm",
+    default=False,
+    is_flag=True,
+    help="Map files into memory for hashing instead of reading them into buffers",
+)
+@click.option(
+    "--read_size",
+    "-rs",
+    default="1",
+    help="Size of each read in MB, or 'auto' to choose it per device by probing the first files",
+)
+@click.option(
+    "--page_cache",
+    "-pc",
+    default="default",
+    type=click.Choice(page_cache_modes),
+    help="Use of the page cache: 'bypass' drops read data from the cache, 'direct' reads with O_DIRECT",
+)
+@click.option(
+    "--resume",
+    "-r",
+    default=False,
+    is_flag=True,
+    help="Resume an interrupted run, files that are unchanged since they were hashed are not hashed again",
+)
+@click.option(
+    "--progress_fd",
+    "-pfd",
+    default=None,
+    type=click.IntRange(min=0),
+    help="File descriptor to which progress events are written as newline delimited JSON",
+)
+@click.option(
+    "--trust_cache",
+    "-tc",
+    default=False,
+    is_flag=True,
+    help="Take the hashes of unchanged files (same device, inode, size, mtime and ctime) from the hash cache",
+)
+@click.option(
+    "--hash_cache",
+    "-hc",
+    "hash_cache_path",
+    default=None,
+    type=click.Path(dir_okay=False),
+    help="Path of the hash cache used with --trust_cache, defaults to the ascmhl folder of the root path",
+)
 def create(
     root_path,
     verbose,
@@ -131,6 +227,18 @@ def create(
     single_file,
     ignore_list,
     ignore_spec_file,
+    jobs,
+    rotational_jobs,
+    layout_order,
+    enumeration_jobs,
+    hash_backend,
+    use_mmap,
+    read_size,
+    page_cache,
+    resume,
+    progress_fd,
+    trust_cache,
+    hash_cache_path,
     author_name,
     author_email,
     author_phone,
@@ -146,8 +254,14 @@ def create(
     mhl-history with records for all hashed files. The command compares the hashes
     against the hashes stored in previous generations if available.
     """
+    read_options = read_options_from_arguments(use_mmap, read_size, page_cache)
+    progress_callback = ProgressWriter(progress_fd) if progress_fd is not None else None
     # distinguish different behavior for entire folder vs single files
     if single_file is not None and len(single_file) > 0:
+        if resume:
+            raise click.UsageError("--resume can only be used when creating a generation for a folder")
+        if trust_cache:
+            raise click.UsageError("--trust_cache can only be used when creating a generation for a folder")
         create_for_single_files_subcommand(
             root_path,
             verbose,
@@ -162,23 +276,39 @@ def create(
             comment,
             ignore_list,
             ignore_spec_file,
+            jobs,
+            hash_backend,
+            read_options,
+            progress_callback,
+            rotational_jobs=rotational_jobs,
+            layout_order=layout_order,
         )
         return
-    create_for_folder_subcommand(
-        root_path,
-        verbose,
-        detect_renaming,
-        hash_format,
-        no_directory_hashes,
-        author_name,
-        author_email,
-        author_phone,
-        author_role,
-        location,
-        comment,
-        ignore_list,
-        ignore_spec_file,
-    )
+    with hash_cache_from_arguments(root_path, trust_cache, hash_cache_path, creates_history=True) as hash_cache:
+        create_for_folder_subcommand(
+            root_path,
+            verbose,
+            detect_renaming,
+            hash_format,
+            no_directory_hashes,
+            author_name,
+            author_email,
+            author_phone,
+            author_role,
+            location,
+            comment,
+            ignore_list,
+            ignore_spec_file,
+            jobs,
+            hash_backend,
+            read_options,
+            resume,
+            progress_callback,
+            hash_cache,
+            rotational_jobs=rotational_jobs,
+            layout_order=layout_order,
+            enumeration_jobs=enumeration_jobs,
+        )
     return
 
 
@@ -196,6 +326,17 @@ def create_for_folder_subcommand(
     comment,
     ignore_list=None,
     ignore_spec_file=None,
+    jobs=1,
+    hash_backend="auto",
+    read_options=None,
+    resume=False,
+    progress_callback=None,
+    hash_cache=None,
+    known_digest_lookups=None,
+    process_type="in-place",
+    rotational_jobs=1,
+    layout_order=False,
+    enumeration_jobs=1,
 ):
     # command formerly known as "seal"
     """
@@ -217,11 +358,9 @@ def create_for_folder_subcommand(
 
     existing_history = MHLHistory.load_from_path(root_path)
 
-    # we collect all paths we expect to find first and remove every path that we actually found while
-    # traversing the file system, so this set will at the end contain the file paths not found in the file system
-    not_found_paths = existing_history.set_of_file_paths()
-    renamed_files = existing_history.renamed_path_with_previous_path()
-    not_found_paths = {p if renamed_files.get(p, None) is None else renamed_files[p] for p in not_found_paths}
+    # the paths found while traversing the file system are joined with the recorded paths of the history, so
+    # the paths that are not recorded yet are known right away and the paths not found in the file system at the end
+    completeness_check = MHLCompletenessCheck(existing_history, root_path)
     new_paths = set()
     missing_asc_mhl_folder = set()
 
@@ -230,86 +369,169 @@ def create_for_folder_subcommand(
 
     # start a verification session on the existing history
     session = MHLGenerationCreationSession(existing_history, ignore_spec)
+    if progress_callback is not None:
+        session.add_progress_callback(progress_callback)
 
     num_failed_verifications = 0
-    # store the directory hashes of sub folders so we can use it when calculating the hash of the parent folder
-    # the mapping lookups will follow the dictionary format of [string: [hash_format: hash_value]] where string
+    # store the directory digests of sub folders so we can use it when calculating the hash of the parent folder
+    # the mapping lookups will follow the dictionary format of [string: [hash_format: digest]] where string
     # is a file sub-path
     dir_content_hash_mapping_lookup = {}
     dir_structure_hash_mapping_lookup = {}
     hash_format_list = sorted(hash_formats)
 
-    for folder_path, children in post_order_lexicographic(root_path, session.ignore_spec.get_path_spec()):
-        # generate directory hashes
-        dir_hash_context_lookup = {}
+    # the files are hashed by the engine, the results are handed back in traversal order
+    engine = HashingEngine(
+        jobs,
+        hash_backend,
+        read_options,
+        progress=session.progress,
+        rotational_jobs=rotational_jobs,
+        layout_order=layout_order,
+    )
 
-        if not no_directory_hashes:
-            # Create a DirectoryHashContext for each hash format and store in the lookup
-            for hash_format in hash_format_list:
-                dir_hash_context_lookup[hash_format] = DirectoryHashContext(hash_format)
-        for item_name, is_dir in children:
-            file_path = os.path.join(folder_path, item_name)
-            not_found_paths.discard(file_path)
-            for hash_list in existing_history.hash_lists:
-                for media_hash in hash_list.media_hashes:
-                    if media_hash.path == existing_history.get_relative_file_path(file_path):
-                        break
-                else:
+    # every completed file is recorded in the journal, a resumed run takes the hashes of unchanged files from it
+    journal = MHLCreationJournal(
+        existing_history.asc_mhl_path, hash_format_list, existing_history.latest_generation_number()
+    )
+    journal_entries = journal.load_entries() if resume else {}
+    if resume:
+        logger.verbose(f"  resuming with {len(journal_entries)} file(s) from the journal")
+    # the journal is closed when all files have been hashed or on an error, it is only removed once the new
+    # generation has been written
+    with journal.open(journal_entries):
+        resumed_hash_lookups = {}
+        # with a hash cache, the digests of unchanged files are taken from the cache, the stat results of all other
+        # files are kept until they are hashed
+        cached_digest_lookups = {}
+        file_stats_to_cache = {}
+
+        def hash_formats_for_file(file_path, file_stat):
+            hash_formats_to_generate = hash_formats_to_generate_for_path(existing_history, file_path, hash_format_list)
+            if file_stat is None:
+                # the file couldn't be stat'ed by the traversal, the error is raised when it is hashed
+                return hash_formats_to_generate
+            journal_entry = journal_entries.get(existing_history.get_relative_file_path(file_path))
+            if journal_entry is not None and set(hash_formats_to_generate) <= journal_entry.hash_lookup.keys():
+                if file_stat.st_size == journal_entry.size and file_stat.st_mtime_ns == journal_entry.mtime_ns:
+                    resumed_hash_lookups[file_path] = {
+                        hash_format: journal_entry.hash_lookup[hash_format] for hash_format in hash_formats_to_generate
+                    }
+                    return None
+            # digests the caller already has, e.g. of copies that were verified by the offload command
+            known_digest_lookup = (known_digest_lookups or {}).get(file_path)
+            if known_digest_lookup is not None and set(hash_formats_to_generate) <= known_digest_lookup.keys():
+                cached_digest_lookups[file_path] = {
+                    hash_format: known_digest_lookup[hash_format] for hash_format in hash_formats_to_generate
+                }
+                return None
+            if hash_cache is not None:
+                cached_digest_lookup = hash_cache.lookup(file_stat, hash_formats_to_generate)
+                if cached_digest_lookup is not None:
+                    cached_digest_lookups[file_path] = cached_digest_lookup
+                    return None
+                file_stats_to_cache[file_path] = file_stat
+            return hash_formats_to_generate
+
+        for folder_path, folder_stat, children, file_digest_lookups in engine.hash_folders(
+            post_order_lexicographic_entries(root_path, session.ignore_spec.get_matcher(), enumeration_jobs),
+            hash_formats_for_file,
+        ):
+            # generate directory hashes
+            dir_hash_context_lookup = {}
+
+            if not no_directory_hashes:
+                # Create a DirectoryHashContext for each hash format and store in the lookup
+                for hash_format in hash_format_list:
+                    dir_hash_context_lookup[hash_format] = DirectoryHashContext(hash_format)
+            for item_name, is_dir, file_stat in children:
+                file_path = os.path.join(folder_path, item_name)
+                if not completeness_check.visit(file_path):
                     new_paths.add(file_path)
-            if is_dir:
-                if not no_directory_hashes:
-                    path_content_hash_lookup = dir_content_hash_mapping_lookup.pop(file_path)
-                    path_structure_hash_lookup = dir_structure_hash_mapping_lookup.pop(file_path)
-
-                    for hash_format, dir_hash_context in dir_hash_context_lookup.items():
-                        dir_hash_context.append_directory_hashes(
-                            file_path,
-                            path_content_hash_lookup[hash_format],
-                            path_structure_hash_lookup[hash_format],
-                        )
-            else:
-                seal_result = seal_file_path(existing_history, file_path, hash_format_list, session)
-
-                for hash_format, result_tuple in seal_result.items():
-                    dir_hash_context = None
-
+                if is_dir:
                     if not no_directory_hashes:
-                        dir_hash_context = dir_hash_context_lookup[hash_format]
-
-                    hash_string = result_tuple.hash_value
-                    success = result_tuple.success
-                    if not success:
-                        num_failed_verifications += 1
-                    if dir_hash_context is not None:
-                        dir_hash_context.append_file_hash(file_path, hash_string)
-
-        # Calculate the directory hashes for each format
-        dir_content_hash_lookup = {}
-        dir_structure_hash_lookup = {}
-
-        if not no_directory_hashes:
-            for hash_format, dir_hash_context in dir_hash_context_lookup.items():
-                dir_content_hash = dir_hash_context.final_content_hash_str()
-                dir_structure_hash = dir_hash_context.final_structure_hash_str()
-
-                if dir_content_hash_mapping_lookup and folder_path in dir_content_hash_mapping_lookup.keys():
-                    dir_content_hash_mapping_lookup[folder_path][hash_format] = dir_content_hash
-                else:
-                    dir_content_hash_mapping_lookup[folder_path] = {hash_format: dir_content_hash}
-
-                if dir_structure_hash_mapping_lookup and folder_path in dir_structure_hash_mapping_lookup.keys():
-                    dir_structure_hash_mapping_lookup[folder_path][hash_format] = dir_structure_hash
+                        path_content_hash_lookup = dir_content_hash_mapping_lookup.pop(file_path)
+                        path_structure_hash_lookup = dir_structure_hash_mapping_lookup.pop(file_path)
+
+                        for hash_format, dir_hash_context in dir_hash_context_lookup.items():
+                            dir_hash_context.append_directory_digests(
+                                file_path,
+                                path_content_hash_lookup[hash_format],
+                                path_structure_hash_lookup[hash_format],
+                            )
                 else:
-                    dir_structure_hash_mapping_lookup[folder_path] = {hash_format: dir_structure_hash}
+                    if file_path in resumed_hash_lookups:
+                        file_hash_lookup = resumed_hash_lookups.pop(file_path)
+                        file_digest_lookup = digests_from_hash_strings(file_hash_lookup)
+                    else:
+                        if file_path in cached_digest_lookups:
+                            file_digest_lookup = cached_digest_lookups.pop(file_path)
+                        else:
+                            file_digest_lookup = file_digest_lookups[file_path]
+                            if file_path in file_stats_to_cache:
+                                hash_cache.store(file_stats_to_cache.pop(file_path), file_digest_lookup)
+                        file_hash_lookup = hash_strings_from_digests(file_digest_lookup)
+                        if file_stat is None:
+                            file_stat = os.stat(file_path)
+                        journal.append(
+                            existing_history.get_relative_file_path(file_path),
+                            file_stat.st_size,
+                            file_stat.st_mtime_ns,
+                            file_hash_lookup,
+                        )
+                    seal_result = seal_file_path(
+                        existing_history,
+                        file_path,
+                        hash_format_list,
+                        session,
+                        file_hash_lookup,
+                        file_stat,
+                    )
 
-                dir_content_hash_lookup[hash_format] = dir_content_hash
-                dir_structure_hash_lookup[hash_format] = dir_structure_hash
+                    for hash_format, result_tuple in seal_result.items():
+                        dir_hash_context = None
 
-        modification_date = datetime.datetime.fromtimestamp(os.path.getmtime(folder_path))
+                        if not no_directory_hashes:
+                            dir_hash_context = dir_hash_context_lookup[hash_format]
 
-        session.append_multiple_format_directory_hashes(
-            folder_path, modification_date, dir_content_hash_lookup, dir_structure_hash_lookup
-        )
+                        success = result_tuple.success
+                        if not success:
+                            num_failed_verifications += 1
+                        if dir_hash_context is not None:
+                            dir_hash_context.append_file_digest(file_path, file_digest_lookup[hash_format])
+
+            # Calculate the directory hashes for each format
+            dir_content_hash_lookup = {}
+            dir_structure_hash_lookup = {}
+
+            if not no_directory_hashes:
+                for hash_format, dir_hash_context in dir_hash_context_lookup.items():
+                    dir_content_hash = dir_hash_context.final_content_digest()
+                    dir_structure_hash = dir_hash_context.final_structure_digest()
+
+                    if dir_content_hash_mapping_lookup and folder_path in dir_content_hash_mapping_lookup.keys():
+                        dir_content_hash_mapping_lookup[folder_path][hash_format] = dir_content_hash
+                    else:
+                        dir_content_hash_mapping_lookup[folder_path] = {hash_format: dir_content_hash}
+
+                    if dir_structure_hash_mapping_lookup and folder_path in dir_structure_hash_mapping_lookup.keys():
+                        dir_structure_hash_mapping_lookup[folder_path][hash_format] = dir_structure_hash
+                    else:
+                        dir_structure_hash_mapping_lookup[folder_path] = {hash_format: dir_structure_hash}
+
+                    dir_content_hash_lookup[hash_format] = dir_content_hash
+                    dir_structure_hash_lookup[hash_format] = dir_structure_hash
+
+            modification_date = datetime.datetime.fromtimestamp(folder_stat.st_mtime)
+
+            # hash strings are only needed for the new generation
+            session.append_multiple_format_directory_hashes(
+                folder_path,
+                modification_date,
+                hash_strings_from_digests(dir_content_hash_lookup),
+                hash_strings_from_digests(dir_structure_hash_lookup),
+            )
+    not_found_paths = completeness_check.finish()
 
     if len(existing_history.hash_lists) > 0:
         for ref in existing_history.hash_lists[-1].hash_list_references:
@@ -378,7 +600,8 @@ def create_for_folder_subcommand(
                         new_path_media_hash.previous_path = relative_not_found_path
                         found_file_paths.add(not_found_path)
         not_found_paths = not_found_paths - found_file_paths
-    commit_session(session, author_name, author_email, author_phone, author_role, location, comment)
+    commit_session(session, author_name, author_email, author_phone, author_role, location, comment, process_type)
+    journal.remove()
 
     exception = test_for_missing_files(not_found_paths, root_path, ignore_spec)
     if num_failed_verifications > 0:
@@ -405,6 +628,12 @@ def create_for_single_files_subcommand(
     comment,
     ignore_list=None,
     ignore_spec_file=None,
+    jobs=1,
+    hash_backend="auto",
+    read_options=None,
+    progress_callback=None,
+    rotational_jobs=1,
+    layout_order=False,
 ):
     # command formerly known as "record"
     """
@@ -433,21 +662,45 @@ def create_for_single_files_subcommand(
     existing_history = MHLHistory.load_from_path(root_path)
     # start a creation session on the existing history
     session = MHLGenerationCreationSession(existing_history)
+    if progress_callback is not None:
+        session.add_progress_callback(progress_callback)
 
     num_failed_verifications = 0
 
     hash_format_list = sorted(hash_formats)
 
+    engine = HashingEngine(
+        jobs,
+        hash_backend,
+        read_options,
+        progress=session.progress,
+        rotational_jobs=rotational_jobs,
+        layout_order=layout_order,
+    )
+
+    def hash_formats_for_file(file_path, file_stat=None):
+        return hash_formats_to_generate_for_path(existing_history, file_path, hash_format_list)
+
     for path in single_file:
         if not os.path.isabs(path):
             path = os.path.join(os.getcwd(), path)
         if os.path.isdir(path):
-            for folder_path, children in post_order_lexicographic(path, session.ignore_spec.get_path_spec()):
-                for item_name, is_dir in children:
+            for folder_path, _, children, file_digest_lookups in engine.hash_folders(
+                post_order_lexicographic_entries(path, session.ignore_spec.get_matcher(), ignore_root=root_path),
+                hash_formats_for_file,
+            ):
+                for item_name, is_dir, file_stat in children:
                     file_path = os.path.join(folder_path, item_name)
                     if is_dir:
                         continue
-                    seal_result = seal_file_path(existing_history, file_path, hash_format_list, session)
+                    seal_result = seal_file_path(
+                        existing_history,
+                        file_path,
+                        hash_format_list,
+                        session,
+                        hash_strings_from_digests(file_digest_lookups[file_path]),
+                        file_stat,
+                    )
                     # Determine success based on the first format in the list
                     # TODO: Consider checking all results.  Would it be practical to do so?
                     # For instance, are we concerned about one format failing while another one succeeds?
@@ -455,17 +708,276 @@ def create_for_single_files_subcommand(
                     if not success:
                         num_failed_verifications += 1
         else:
-            seal_result = seal_file_path(existing_history, path, hash_format_list, session)
+            seal_result = seal_file_path(
+                existing_history,
+                path,
+                hash_format_list,
+                session,
+                engine.hash_file(path, hash_formats_for_file(path)),
+            )
             success = seal_result[hash_format_list[0]].success
             if not success:
                 num_failed_verifications += 1
 
+    engine.close()
+
     commit_session(session, author_name, author_email, author_phone, author_role, location, comment)
 
     if num_failed_verifications > 0:
         raise errors.VerificationFailedException()
 
 
+@click.command()
+@click.argument("source_path", type=click.Path(exists=True, file_okay=False))
+@click.argument("destination_paths", nargs=-1, required=True, type=click.Path(file_okay=False))
+# general options
+@click.option(
+    "--verbose",
+    "-v",
+    default=False,
+    is_flag=True,
+    help="Verbose output",
+)
+@click.option(
+    "--hash_format",
+    "-h",
+    type=click.Choice(ascmhl_supported_hashformats),
+    multiple=True,
+    default=[ascmhl_default_hashformat],
+    help="Algorithm",
+)
+# creatorinfo values
+@click.option(
+    "--author_name",
+    default=None,
+    help="Name value for the <author> element in the <creatorinfo> element",
+)
+@click.option(
+    "--author_email",
+    default=None,
+    help="Email value for the <author> element in the <creatorinfo> element",
+)
+@click.option(
+    "--author_phone",
+    default=None,
+    help="Phone value for the <author> element in the <creatorinfo> element",
+)
+@click.option(
+    "--author_role",
+    default=None,
+    help="Role value for the <author> element in the <creatorinfo> element",
+)
+@click.option(
+    "--location",
+    default=None,
+    help="Value for the <location> element in the <creatorinfo> element",
+)
+@click.option(
+    "--comment",
+    default=None,
+    help="Value for the <comment> element in the <creatorinfo> element",
+)
+@click.option(
+    "ignore_list",
+    "--ignore",
+    "-i",
+    multiple=True,
+    help="A single file pattern to ignore.",
+)
+@click.option(
+    "ignore_spec_file",
+    "--ignore_spec",
+    "-ii",
+    type=click.Path(exists=True),
+    help="A file containing multiple file patterns to ignore.",
+)
+@click.option(
+    "--jobs",
+    "-j",
+    default=1,
+    type=click.IntRange(min=1),
+    help="Number of files per destination that are read back in parallel for verification",
+)
+@click.option(
+    "--read_size",
+    "-rs",
+    default="1",
+    help="Size of each read in MB, or 'auto' to choose it per device by probing the first files",
+)
+def offload(
+    source_path,
+    destination_paths,
+    verbose,
+    hash_format,
+    author_name,
+    author_email,
+    author_phone,
+    author_role,
+    location,
+    comment,
+    ignore_list,
+    ignore_spec_file,
+    jobs,
+    read_size,
+):
+    """
+    Copy a folder to one or more destinations and create new generations there
+
+    \b
+    The offload command reads each file of the source folder once, writes it to all
+    destinations in parallel and hashes it while it is copied. The copies are read
+    back from all destinations concurrently and verified against the hashes of the
+    source, then a new generation is created in each destination. The folder is
+    copied into each destination path, an existing ASC MHL history is copied along.
+    """
+    offload_subcommand(
+        source_path,
+        destination_paths,
+        verbose,
+        hash_format,
+        author_name,
+        author_email,
+        author_phone,
+        author_role,
+        location,
+        comment,
+        ignore_list,
+        ignore_spec_file,
+        jobs,
+        read_options_from_arguments(False, read_size),
+    )
+
+
+def offload_subcommand(
+    source_path,
+    destination_paths,
+    verbose,
+    hash_formats,
+    author_name,
+    author_email,
+    author_phone,
+    author_role,
+    location,
+    comment,
+    ignore_list=None,
+    ignore_spec_file=None,
+    jobs=1,
+    read_options=None,
+):
+    """
+    Copies a folder into one or more destination folders and creates a new generation in each copy.
+
+    SOURCE_PATH: the folder to copy, e.g. a camera card
+    DESTINATION_PATHS: the folders to copy the source folder into
+
+    Each source file is read once, while it is written to all destinations and hashed. Afterwards all destinations
+    are read back concurrently and compared to the hashes of the source. Destinations whose copies could be
+    verified get a new generation with the process type "transfer", the verified hashes are used for it, so the
+    copies aren't read again.
+    """
+    logger.verbose_logging = verbose
+
+    source_path = os.path.abspath(source_path)
+    source_name = os.path.basename(os.path.normpath(source_path))
+    destination_roots = [os.path.join(os.path.abspath(path), source_name) for path in destination_paths]
+    for destination_root in destination_roots:
+        if os.path.exists(destination_root):
+            raise errors.DestinationExistsException(destination_root)
+
+    source_history = MHLHistory.load_from_path(source_path)
+    ignore_spec = ignore.MHLIgnoreSpec(source_history.latest_ignore_patterns(), ignore_list, ignore_spec_file)
+    hash_format_list = sorted(hash_formats)
+
+    # the digests of the source data, keyed by the path relative to the source folder
+    source_digest_lookups = {}
+    logger.verbose(f"Copying {source_path} to {', '.join(destination_roots)} ...")
+    with StreamingCopier(len(destination_roots), hash_format_list, read_options) as copier:
+        for folder_path, children in post_order_lexicographic(source_path, ignore_spec.get_matcher()):
+            relative_folder_path = os.path.relpath(folder_path, source_path)
+            for destination_root in destination_roots:
+                os.makedirs(os.path.normpath(os.path.join(destination_root, relative_folder_path)), exist_ok=True)
+            for item_name, is_dir in children:
+                if is_dir:
+                    # symlinked folders are not traversed, their content would be missing in the copies
+                    if os.path.islink(os.path.join(folder_path, item_name)):
+                        raise errors.SymlinkedFolderException(os.path.join(folder_path, item_name))
+                    continue
+                relative_path = os.path.normpath(os.path.join(relative_folder_path, item_name))
+                digest_lookup = copier.copy_file(
+                    os.path.join(folder_path, item_name),
+                    [os.path.join(destination_root, relative_path) for destination_root in destination_roots],
+                )
+                source_digest_lookups[relative_path] = digest_lookup
+                hash_lookup = hash_strings_from_digests(digest_lookup)
+                logger.verbose(
+                    f"  copied {relative_path}  "
+                    + ", ".join(f"{hash_format}: {hash_lookup[hash_format]}" for hash_format in hash_format_list)
+                )
+            # histories are not part of the traversal, they are copied with the folder they belong to
+            asc_mhl_folder_path = os.path.join(folder_path, ascmhl_folder_name)
+            if os.path.isdir(asc_mhl_folder_path):
+                for destination_root in destination_roots:
+                    shutil.copytree(
+                        asc_mhl_folder_path,
+                        os.path.normpath(os.path.join(destination_root, relative_folder_path, ascmhl_folder_name)),
+                        ignore=shutil.ignore_patterns(ascmhl_journalfile_name, ascmhl_hashcachefile_name),
+                    )
+
+    def verify_destination(destination_root):
+        engine = HashingEngine(jobs, read_options=read_options)
+        verified_digest_lookups = {}
+
+        def hash_formats_for_file(file_path, file_stat):
+            if os.path.relpath(file_path, destination_root) not in source_digest_lookups:
+                return None
+            return hash_format_list
+
+        for _, _, _, file_digest_lookups in engine.hash_folders(
+            post_order_lexicographic_entries(destination_root, ignore_spec.get_matcher()), hash_formats_for_file
+        ):
+            for file_path, digest_lookup in file_digest_lookups.items():
+                relative_path = os.path.relpath(file_path, destination_root)
+                if digest_lookup == source_digest_lookups[relative_path]:
+                    verified_digest_lookups[file_path] = digest_lookup
+                else:
+                    logger.error(f"ERROR: copy of {relative_path} in {destination_root} doesn't match the source")
+        return verified_digest_lookups
+
+    # the destinations are read back concurrently, so the verification takes as long as the slowest device
+    logger.verbose(f"Verifying {len(source_digest_lookups)} file(s) in {len(destination_roots)} destination(s) ...")
+    with ThreadPoolExecutor(max_workers=len(destination_roots), thread_name_prefix="ascmhl-verify") as executor:
+        verified_digest_lookups = list(executor.map(verify_destination, destination_roots))
+
+    num_failed_destinations = 0
+    for destination_root, digest_lookups in zip(destination_roots, verified_digest_lookups):
+        if len(digest_lookups) != len(source_digest_lookups):
+            logger.error(f"ERROR: no generation created for {destination_root}, verification failed")
+            num_failed_destinations += 1
+            continue
+        create_for_folder_subcommand(
+            destination_root,
+            verbose,
+            False,
+            hash_format_list,
+            False,
+            author_name,
+            author_email,
+            author_phone,
+            author_role,
+            location,
+            comment,
+            ignore_list,
+            ignore_spec_file,
+            jobs,
+            read_options=read_options,
+            known_digest_lookups=digest_lookups,
+            process_type="transfer",
+        )
+
+    if num_failed_destinations > 0:
+        raise errors.VerificationFailedException()
+
+
 @click.command()
 @click.argument("root_path", type=click.Path(exists=True))
 @click.option(
@@ -535,6 +1047,76 @@ def create_for_single_files_subcommand(
 @click.option(
     "--packing_list", "-pl", default=None, type=click.Path(exists=True), help="Verify against an external packing list"
 )
+@click.option(
+    "--jobs",
+    "-j",
+    default=1,
+    type=click.IntRange(min=1),
+    help="Number of files that are hashed in parallel per device",
+)
+@click.option(
+    "--rotational_jobs",
+    "-rj",
+    default=1,
+    type=click.IntRange(min=1),
+    help="Number of files that are hashed in parallel per rotational disk (HDD), --jobs applies to other devices",
+)
+@click.option(
+    "--layout_order",
+    "-lo",
+    default=False,
+    is_flag=True,
+    help="Hash files in the order of their physical location on disk, e.g. for HDD archives and LTFS tapes",
+)
+@click.option(
+    "--hash_backend",
+    "-hb",
+    default="auto",
+    type=click.Choice(hashing_backends),
+    help="Backend for generating multiple hash formats per file",
+)
+@click.option(
+    "--use_mmap",
+    "-mm",
+    default=False,
+    is_flag=True,
+    help="Map files into memory for hashing instead of reading them into buffers",
+)
+@click.option(
+    "--read_size",
+    "-rs",
+    default="1",
+    help="Size of each read in MB, or 'auto' to choose it per device by probing the first files",
+)
+@click.option(
+    "--page_cache",
+    "-pc",
+    default="default",
+    type=click.Choice(page_cache_modes),
+    help="Use of the page cache: 'bypass' drops read data from the cache, 'direct' reads with O_DIRECT",
+)
+@click.option(
+    "--progress_fd",
+    "-pfd",
+    default=None,
+    type=click.IntRange(min=0),
+    help="File descriptor to which progress events are written as newline delimited JSON",
+)
+@click.option(
+    "--trust_cache",
+    "-tc",
+    default=False,
+    is_flag=True,
+    help="Take the hashes of unchanged files (same device, inode, size, mtime and ctime) from the hash cache",
+)
+@click.option(
+    "--hash_cache",
+    "-hc",
+    "hash_cache_path",
+    default=None,
+    type=click.Path(dir_okay=False),
+    help="Path of the hash cache used with --trust_cache, defaults to the ascmhl folder of the root path",
+)
 def verify(
     root_path,
     verbose,
@@ -546,6 +1128,16 @@ def verify(
     ignore_spec_file,
     calculate_only,
     root_only,
+    jobs,
+    rotational_jobs,
+    layout_order,
+    hash_backend,
+    use_mmap,
+    read_size,
+    page_cache,
+    progress_fd,
+    trust_cache,
+    hash_cache_path,
 ):
     """
     Verify a folder, single file(s), or a directory hash
@@ -558,24 +1150,80 @@ def verify(
     generation is created.
     """
 
+    read_options = read_options_from_arguments(use_mmap, read_size, page_cache)
+    progress_callback = ProgressWriter(progress_fd) if progress_fd is not None else None
+
     if packing_list is not None:
-        verify_entire_folder(
-            root_path, verbose, single_file, packing_list, ignore_list, ignore_spec_file, calculate_only
-        )
+        with hash_cache_from_arguments(root_path, trust_cache, hash_cache_path) as hash_cache:
+            verify_entire_folder(
+                root_path,
+                verbose,
+                single_file,
+                packing_list,
+                ignore_list,
+                ignore_spec_file,
+                calculate_only,
+                jobs,
+                read_options,
+                progress_callback,
+                hash_cache,
+                rotational_jobs=rotational_jobs,
+                layout_order=layout_order,
+            )
         return
 
     if directory_hash is True:
+        if trust_cache:
+            raise click.UsageError("--trust_cache can't be used for verifying directory hashes")
         verify_directory_hash_subcommand(
-            root_path, verbose, hash_format, ignore_list, ignore_spec_file, calculate_only, root_only
+            root_path,
+            verbose,
+            hash_format,
+            ignore_list,
+            ignore_spec_file,
+            calculate_only,
+            root_only,
+            jobs,
+            hash_backend,
+            read_options,
+            progress_callback,
+            rotational_jobs=rotational_jobs,
+            layout_order=layout_order,
         )
         return
 
-    verify_entire_folder(root_path, verbose, single_file, None, ignore_list, ignore_spec_file)
+    with hash_cache_from_arguments(root_path, trust_cache, hash_cache_path) as hash_cache:
+        verify_entire_folder(
+            root_path,
+            verbose,
+            single_file,
+            None,
+            ignore_list,
+            ignore_spec_file,
+            jobs=jobs,
+            read_options=read_options,
+            progress_callback=progress_callback,
+            hash_cache=hash_cache,
+            rotational_jobs=rotational_jobs,
+            layout_order=layout_order,
+        )
     return
 
 
 def verify_entire_folder(
-    root_path, verbose, single_file, packing_list_path, ignore_list=None, ignore_spec_file=None, calculate_only=None
+    root_path,
+    verbose,
+    single_file,
+    packing_list_path,
+    ignore_list=None,
+    ignore_spec_file=None,
+    calculate_only=None,
+    jobs=1,
+    read_options=None,
+    progress_callback=None,
+    hash_cache=None,
+    rotational_jobs=1,
+    layout_order=False,
 ):
     """
     Checks MHL hashes from all generations / a packing list against all file hashes.
@@ -606,11 +1254,9 @@ def verify_entire_folder(
     if len(existing_history.hash_lists) == 0:
         raise errors.NoMHLHistoryException(root_path)
 
-    # we collect all paths we expect to find first and remove every path that we actually found while
-    # traversing the file system, so this set will at the end contain the file paths not found in the file system
-    not_found_paths = existing_history.set_of_file_paths()
-    renamed_files = existing_history.renamed_path_with_previous_path()
-    not_found_paths = {p if renamed_files.get(p, None) is None else renamed_files[p] for p in not_found_paths}
+    # the paths found while traversing the file system are joined with the recorded paths of the history, so
+    # the paths that are not recorded yet are known right away and the paths not found in the file system at the end
+    completeness_check = MHLCompletenessCheck(existing_history, root_path)
 
     num_failed_verifications = 0
     num_new_files = 0
@@ -619,26 +1265,50 @@ def verify_entire_folder(
 
     found_single_file = False
 
-    for folder_path, children in post_order_lexicographic(root_path, ignore_spec.get_path_spec()):
-        for item_name, is_dir in children:
+    def original_hash_entry_for_file(file_path):
+        relative_path = existing_history.get_relative_file_path(file_path)
+        history, history_relative_path = existing_history.find_history_for_path(relative_path)
+        # check if there is an existing hash in the other generations, also for the previous path of a renamed file
+        return history.find_original_hash_entry_for_path(history.find_previous_path_for_path(history_relative_path))
+
+    # with a hash cache, the digests of unchanged files are taken from the cache, the stat results of all other
+    # files are kept until they are hashed
+    cached_digest_lookups = {}
+    file_stats_to_cache = {}
+
+    def hash_formats_for_file(file_path, file_stat):
+        if single_file is not None and os.path.realpath(single_file) != os.path.realpath(file_path):
+            return None
+        original_hash_entry = original_hash_entry_for_file(file_path)
+        if original_hash_entry is None:
+            return None
+        # without a stat result from the traversal the error is raised when the file is hashed
+        if hash_cache is not None and file_stat is not None:
+            cached_digest_lookup = hash_cache.lookup(file_stat, [original_hash_entry.hash_format])
+            if cached_digest_lookup is not None:
+                cached_digest_lookups[file_path] = cached_digest_lookup
+                return None
+            file_stats_to_cache[file_path] = file_stat
+        return [original_hash_entry.hash_format]
+
+    engine = HashingEngine(jobs, read_options=read_options, rotational_jobs=rotational_jobs, layout_order=layout_order)
+    if progress_callback is not None:
+        engine.add_progress_callback(progress_callback)
+
+    for folder_path, _, children, file_digest_lookups in engine.hash_folders(
+        post_order_lexicographic_entries(root_path, ignore_spec.get_matcher()), hash_formats_for_file
+    ):
+        for item_name, is_dir, _ in children:
             file_path = os.path.join(folder_path, item_name)
-            not_found_paths.discard(file_path)
+            completeness_check.visit(file_path)
             relative_path = existing_history.get_relative_file_path(file_path)
-            history, history_relative_path = existing_history.find_history_for_path(relative_path)
             if is_dir:
                 # TODO: find new directories here
                 continue
 
-            for hash_list in existing_history.hash_lists:
-                for media_hash in hash_list.media_hashes:
-                    if media_hash.path != history_relative_path:
-                        continue
-                    history_relative_path = media_hash.previous_path or history_relative_path
-                    break
-
             if single_file is None or os.path.realpath(single_file) == os.path.realpath(file_path):
                 # check if there is an existing hash in the other generations and verify
-                original_hash_entry = history.find_original_hash_entry_for_path(history_relative_path)
+                original_hash_entry = original_hash_entry_for_file(file_path)
 
                 # in case there is no original hash entry continue
                 if original_hash_entry is None:
@@ -646,8 +1316,15 @@ def verify_entire_folder(
                     num_new_files += 1
                     continue
 
-                # create a new hash and compare it against the original hash entry
-                current_hash = hash_file(file_path, original_hash_entry.hash_format)
+                if file_path in cached_digest_lookups:
+                    file_digest_lookup = cached_digest_lookups.pop(file_path)
+                else:
+                    file_digest_lookup = file_digest_lookups[file_path]
+                    if file_path in file_stats_to_cache:
+                        hash_cache.store(file_stats_to_cache.pop(file_path), file_digest_lookup)
+
+                # compare the new hash against the original hash entry
+                current_hash = hash_strings_from_digests(file_digest_lookup)[original_hash_entry.hash_format]
                 if original_hash_entry.hash_string == current_hash:
                     logger.verbose(f"verification ({original_hash_entry.hash_format}) of file {relative_path}: OK")
                 else:
@@ -660,7 +1337,7 @@ def verify_entire_folder(
 
                 found_single_file = True
 
-    exception = test_for_missing_files(not_found_paths, root_path, ignore_spec)
+    exception = test_for_missing_files(completeness_check.finish(), root_path, ignore_spec)
 
     if not found_single_file:
         exception = errors.SingleFileNotFoundException()
@@ -675,7 +1352,19 @@ def verify_entire_folder(
 
 
 def verify_directory_hash_subcommand(
-    root_path, verbose, hash_format, ignore_list=None, ignore_spec_file=None, calculate_only=False, root_only=False
+    root_path,
+    verbose,
+    hash_format,
+    ignore_list=None,
+    ignore_spec_file=None,
+    calculate_only=False,
+    root_only=False,
+    jobs=1,
+    hash_backend="auto",
+    read_options=None,
+    progress_callback=None,
+    rotational_jobs=1,
+    layout_order=False,
 ):
     """
     Checks MHL directory hashes from all generations against computed directory hashes.
@@ -739,12 +1428,25 @@ def verify_directory_hash_subcommand(
             failures_per_format_lookup = {failed_hash_format: 1}
 
     session = MHLGenerationCreationSession(existing_history)
+    if progress_callback is not None:
+        session.add_progress_callback(progress_callback)
 
     num_failed_verifications = 0
-    # store the directory hashes of sub folders so we can use it when calculating the hash of the parent folder
-    dir_content_hash_mappings = {}
-    dir_structure_hash_mappings = {}
-    for folder_path, children in post_order_lexicographic(root_path, ignore_spec.get_path_spec()):
+    # store the directory digests of sub folders so we can use it when calculating the hash of the parent folder
+    dir_content_digest_mappings = {}
+    dir_structure_digest_mappings = {}
+    engine = HashingEngine(
+        jobs,
+        hash_backend,
+        read_options,
+        progress=session.progress,
+        rotational_jobs=rotational_jobs,
+        layout_order=layout_order,
+    )
+    for folder_path, folder_stat, children, file_digest_lookups in engine.hash_folders(
+        post_order_lexicographic_entries(root_path, ignore_spec.get_matcher()),
+        lambda file_path, file_stat: hash_format_list,
+    ):
         # generate directory hashes - will match the format dict[str, DirectoryHashContext]
         dir_hash_context_lookup = {}
 
@@ -752,7 +1454,7 @@ def verify_directory_hash_subcommand(
         for hash_format in hash_format_list:
             dir_hash_context_lookup[hash_format] = DirectoryHashContext(hash_format)
 
-        for item_name, is_dir in children:
+        for item_name, is_dir, _ in children:
             file_path = os.path.join(folder_path, item_name)
             if is_dir:
                 relative_path = existing_history.get_relative_file_path(file_path)
@@ -760,20 +1462,18 @@ def verify_directory_hash_subcommand(
                 # check if there are directory hashes in the generations
                 directory_hash_entries = history.find_directory_hash_entries_for_path(history_relative_path)
 
-                content_hash_lookup = dir_content_hash_mappings.pop(file_path)
-                structure_hash_lookup = dir_structure_hash_mappings.pop(file_path)
+                content_digest_lookup = dir_content_digest_mappings.pop(file_path)
+                structure_digest_lookup = dir_structure_digest_mappings.pop(file_path)
 
-                # Add the content and hash values to the appropriate context
-                if dir_hash_context_lookup:
-                    for hash_format, dir_hash_context in dir_hash_context_lookup.items():
-                        content_hash = None
-                        structure_hash = None
-                        if content_hash_lookup:
-                            content_hash = content_hash_lookup[hash_format]
-                        if structure_hash_lookup:
-                            structure_hash = structure_hash_lookup[hash_format]
+                # Add the content and structure digests to the appropriate context
+                for hash_format, dir_hash_context in dir_hash_context_lookup.items():
+                    dir_hash_context.append_directory_digests(
+                        file_path, content_digest_lookup[hash_format], structure_digest_lookup[hash_format]
+                    )
 
-                        dir_hash_context.append_directory_hashes(file_path, content_hash, structure_hash)
+                # hash strings are only needed to compare them with the records of the history
+                content_hash_lookup = hash_strings_from_digests(content_digest_lookup)
+                structure_hash_lookup = hash_strings_from_digests(structure_digest_lookup)
 
                 num_successful_verifications = 0
                 for directory_hash_entry in directory_hash_entries:
@@ -811,30 +1511,26 @@ def verify_directory_hash_subcommand(
                             num_failed_verifications += 1
                             add_detected_failure_for_format(directory_hash_entry.hash_format)
             else:
-                # generate the hashes for the file
-                file_hash_lookup = multiple_format_hash_file(file_path, hash_format_list)
-                # add each hash to the appropriate context
-                for hash_format, hash_value in file_hash_lookup.items():
-                    dir_hash_context_lookup[hash_format].append_file_hash(file_path, hash_value)
-
-        # all children have been handled.  create the directory hashes
-        dir_content_hash_lookup = {}
-        dir_structure_hash_lookup = {}
-
-        if dir_hash_context_lookup:
-            for hash_format, dir_hash_context in dir_hash_context_lookup.items():
-                dir_content_hash = dir_hash_context.final_content_hash_str()
-                dir_structure_hash = dir_hash_context.final_structure_hash_str()
-                # add the hashes to the appropriate hash lookups to be added to the session
-                dir_content_hash_lookup[hash_format] = dir_content_hash
-                dir_structure_hash_lookup[hash_format] = dir_structure_hash
-            # add the hash lookups to the appropriate mappings for the folder
-            if dir_content_hash_lookup:
-                dir_content_hash_mappings[folder_path] = dir_content_hash_lookup
-            if dir_structure_hash_lookup:
-                dir_structure_hash_mappings[folder_path] = dir_structure_hash_lookup
-
-        modification_date = datetime.datetime.fromtimestamp(os.path.getmtime(folder_path))
+                # add each hash of the file to the appropriate context
+                for hash_format, digest in file_digest_lookups[file_path].items():
+                    dir_hash_context_lookup[hash_format].append_file_digest(file_path, digest)
+
+        # all children have been handled.  create the directory digests
+        dir_content_digest_lookup = {}
+        dir_structure_digest_lookup = {}
+
+        for hash_format, dir_hash_context in dir_hash_context_lookup.items():
+            dir_content_digest_lookup[hash_format] = dir_hash_context.final_content_digest()
+            dir_structure_digest_lookup[hash_format] = dir_hash_context.final_structure_digest()
+        # add the digest lookups to the appropriate mappings for the folder
+        dir_content_digest_mappings[folder_path] = dir_content_digest_lookup
+        dir_structure_digest_mappings[folder_path] = dir_structure_digest_lookup
+
+        # hash strings are only needed for the session and to compare them with the records of the history
+        dir_content_hash_lookup = hash_strings_from_digests(dir_content_digest_lookup)
+        dir_structure_hash_lookup = hash_strings_from_digests(dir_structure_digest_lookup)
+
+        modification_date = datetime.datetime.fromtimestamp(folder_stat.st_mtime)
 
         logger.verbose_logging = calculate_only
         relative_path = session.root_history.get_relative_file_path(folder_path)
@@ -954,11 +1650,31 @@ def _compare_and_log_directory_hashes(
     required=True,
     help="Algorithm",
 )
-def hash(file_path, hash_format):
+@click.option(
+    "--use_mmap",
+    "-mm",
+    default=False,
+    is_flag=True,
+    help="Map the file into memory for hashing instead of reading it into buffers",
+)
+@click.option(
+    "--read_size",
+    "-rs",
+    default="1",
+    help="Size of each read in MB, or 'auto' to choose it by probing",
+)
+@click.option(
+    "--page_cache",
+    "-pc",
+    default="default",
+    type=click.Choice(page_cache_modes),
+    help="Use of the page cache: 'bypass' drops read data from the cache, 'direct' reads with O_DIRECT",
+)
+def hash(file_path, hash_format, use_mmap, read_size, page_cache):
     """
     Create and print a hash value for a file
     """
-    result = hash_file(file_path, hash_format)
+    result = hash_file(file_path, hash_format, read_options_from_arguments(use_mmap, read_size, page_cache))
     logger.info(hash_format + " (" + file_path + ") = " + result)
 
 
@@ -985,7 +1701,14 @@ def hash(file_path, hash_format):
     type=click.Path(exists=True),
     help="A file containing multiple file patterns to ignore.",
 )
-def diff(root_path, verbose, ignore_list, ignore_spec_file):
+@click.option(
+    "--enumeration_jobs",
+    "-ej",
+    default=1,
+    type=click.IntRange(min=1),
+    help="Number of folders that are listed in parallel, e.g. on network file systems",
+)
+def diff(root_path, verbose, ignore_list, ignore_spec_file, enumeration_jobs):
     """
     Diff an entire folder structure
 
@@ -996,11 +1719,15 @@ def diff(root_path, verbose, ignore_list, ignore_spec_file):
     in the file system are reported as errors. No new ASC MHL file / generation
     is created.
     """
-    diff_entire_folder_against_full_history_subcommand(root_path, verbose, ignore_list, ignore_spec_file)
+    diff_entire_folder_against_full_history_subcommand(
+        root_path, verbose, ignore_list, ignore_spec_file, enumeration_jobs
+    )
     return
 
 
-def diff_entire_folder_against_full_history_subcommand(root_path, verbose, ignore_list=None, ignore_spec_file=None):
+def diff_entire_folder_against_full_history_subcommand(
+    root_path, verbose, ignore_list=None, ignore_spec_file=None, enumeration_jobs=1
+):
     """
     Checks MHL hashes from all generations against all file hash entries.
 
@@ -1022,36 +1749,29 @@ def diff_entire_folder_against_full_history_subcommand(root_path, verbose, ignor
     if len(existing_history.hash_lists) == 0:
         raise errors.NoMHLHistoryException(root_path)
 
-    # we collect all paths we expect to find first and remove every path that we actually found while
-    # traversing the file system, so this set will at the end contain the file paths not found in the file system
-    not_found_paths = existing_history.set_of_file_paths()
-    renamed_files = existing_history.renamed_path_with_previous_path()
-    not_found_paths = {p if renamed_files.get(p, None) is None else renamed_files[p] for p in not_found_paths}
+    # the paths found while traversing the file system are joined with the recorded paths of the history, so
+    # the paths that are not recorded yet are known right away and the paths not found in the file system at the end
+    completeness_check = MHLCompletenessCheck(existing_history, root_path)
 
     num_failed_verifications = 0
     num_new_files = 0
 
     ignore_spec = ignore.MHLIgnoreSpec(existing_history.latest_ignore_patterns(), ignore_list, ignore_spec_file)
 
-    for folder_path, children in post_order_lexicographic(root_path, ignore_spec.get_path_spec()):
+    for folder_path, children in post_order_lexicographic(root_path, ignore_spec.get_matcher(), enumeration_jobs):
         for item_name, is_dir in children:
             file_path = os.path.join(folder_path, item_name)
-            not_found_paths.discard(file_path)
+            completeness_check.visit(file_path)
             relative_path = existing_history.get_relative_file_path(file_path)
             history, history_relative_path = existing_history.find_history_for_path(relative_path)
             if is_dir:
                 # TODO: find new directories here
                 continue
 
-            for hash_list in existing_history.hash_lists:
-                for media_hash in hash_list.media_hashes:
-                    if media_hash.path != history_relative_path:
-                        continue
-                    history_relative_path = media_hash.previous_path or history_relative_path
-                    break
-
-            # check if there is an existing hash in the other generations and verify
-            original_hash_entry = history.find_original_hash_entry_for_path(history_relative_path)
+            # check if there is an existing hash in the other generations, also for the previous path of a renamed file
+            original_hash_entry = history.find_original_hash_entry_for_path(
+                history.find_previous_path_for_path(history_relative_path)
+            )
 
             # in case there is no original hash entry continue
             if original_hash_entry is None:
@@ -1059,7 +1779,7 @@ def diff_entire_folder_against_full_history_subcommand(root_path, verbose, ignor
                 num_new_files += 1
                 continue
 
-    exception = test_for_missing_files(not_found_paths, root_path, ignore_spec)
+    exception = test_for_missing_files(completeness_check.finish(), root_path, ignore_spec)
     if num_failed_verifications > 0:
         exception = errors.VerificationFailedException()
     if not exception and num_new_files > 0:
@@ -1422,9 +2142,11 @@ def xsd_schema_check(file_path, directory_file, xsd_file):
 
 
 def test_for_missing_files(not_found_paths, root_path, ignore_spec: MHLIgnoreSpec = MHLIgnoreSpec()):
-    ignore_path_spec = ignore_spec.get_path_spec()
+    ignore_matcher = ignore_spec.get_matcher()
     # update to exclude our ignored files
-    not_found_paths = [x for x in not_found_paths if not ignore_path_spec.match_file(x)]
+    not_found_paths = [
+        x for x in not_found_paths if not ignore_matcher.match(os.path.relpath(x, root_path).replace(os.sep, "/"))
+    ]
     if len(not_found_paths) == 0:
         return None
     # test our not_found_paths against our ignore spec to ensure these weren't explicitly ignored.
@@ -1434,7 +2156,9 @@ def test_for_missing_files(not_found_paths, root_path, ignore_spec: MHLIgnoreSpe
     return errors.CompletenessCheckFailedException()
 
 
-def commit_session(session, author_name, author_email, author_phone, author_role, location, comment):
+def commit_session(
+    session, author_name, author_email, author_phone, author_role, location, comment, process_type="in-place"
+):
     creator_info = MHLCreatorInfo()
     creator_info.tool = MHLTool(ascmhl_tool_name, ascmhl_tool_version)
     creator_info.creation_date = utils.datetime_now_isostring()
@@ -1446,7 +2170,7 @@ def commit_session(session, author_name, author_email, author_phone, author_role
         creator_info.authors.append(author_object)
 
     process_info = MHLProcessInfo()
-    process_info.process = MHLProcess("in-place")
+    process_info.process = MHLProcess(process_type)
 
     session.commit(creator_info, process_info)
 
@@ -1483,21 +2207,65 @@ success -- boolean value, indicates if the update was successful
 SealPathResult = namedtuple("SealPathResult", ["hash_value", "success"])
 
 
-def seal_file_path(existing_history, file_path, hash_formats: [str], session) -> Dict[str, SealPathResult]:
+def read_options_from_arguments(use_mmap: bool, read_size: str, page_cache_mode: str = "default") -> ReadOptions:
     """
-    Generates hashes for a file path.
-    Compares the generated hashes to any existing hash records
-    Adds the generated hashes to the hash history of the file path
+    creates the read options for the hashing of files from the command line arguments
+
+    arguments:
+    use_mmap -- map files into memory instead of reading them into buffers
+    read_size -- size of each read in MB, 'auto' for choosing the size per device
+    page_cache_mode -- one of the page cache modes, e.g. 'bypass'
+    """
+    if use_mmap and page_cache_mode != "default":
+        raise click.UsageError("--use_mmap can't be combined with --page_cache")
+    if read_size == "auto":
+        return ReadOptions(use_mmap=use_mmap, auto_tune_read_size=True, page_cache_mode=page_cache_mode)
+    try:
+        read_size_in_mb = float(read_size)
+    except ValueError:
+        read_size_in_mb = 0
+    if read_size_in_mb <= 0:
+        raise click.BadParameter(f"'{read_size}' is neither a positive number nor 'auto'", param_hint="'--read_size'")
+    return ReadOptions(
+        chunk_size=max(1, int(read_size_in_mb * 1024 * 1024)), use_mmap=use_mmap, page_cache_mode=page_cache_mode
+    )
+
+
+@contextmanager
+def hash_cache_from_arguments(
+    root_path: str, trust_cache: bool, hash_cache_path: str = None, creates_history: bool = False
+):
+    """
+    yields the hash cache that is opened for --trust_cache, or None, and closes it afterwards
+
+    the default hash cache is kept in the ascmhl folder of the root path, commands that don't create a history only
+    use it if the ascmhl folder exists already, so they don't leave a new folder behind e.g. for a missing history
+    """
+    if not trust_cache:
+        if hash_cache_path is not None:
+            raise click.UsageError("--hash_cache can only be used together with --trust_cache")
+        yield None
+        return
+    if hash_cache_path is None:
+        asc_mhl_folder_path = os.path.join(root_path, ascmhl_folder_name)
+        if not creates_history and not os.path.isdir(asc_mhl_folder_path):
+            yield None
+            return
+        hash_cache_path = os.path.join(asc_mhl_folder_path, ascmhl_hashcachefile_name)
+    with MHLHashCache(hash_cache_path) as hash_cache:
+        yield hash_cache
+
+
+def hash_formats_to_generate_for_path(existing_history, file_path, hash_formats: [str]) -> [str]:
+    """
+    Determines the hash formats that need to be generated for a file path.
+    Formats already recorded in the history are verified prior to any new formats.
     :param existing_history: The existing hash record
     :param file_path: The path for which to generate hashes
-    :param hash_formats: The hash formats to generate
-    :param session: The session to which the generated hashes will be added
-    :return: A dictionary keyed by hash_format strings.
-    Each entry contains the hash value and a boolean indicating if updating was successful
+    :param hash_formats: The requested hash formats
+    :return: A list of hash format strings
     """
     relative_path = existing_history.get_relative_file_path(file_path)
-    file_size = os.path.getsize(file_path)
-    file_modification_date = datetime.datetime.fromtimestamp(os.path.getmtime(file_path))
 
     # find in the according child history the already available hash formats
     existing_child_history, existing_history_relative_path = existing_history.find_history_for_path(relative_path)
@@ -1523,8 +2291,44 @@ def seal_file_path(existing_history, file_path, hash_formats: [str], session) ->
         if hash_format not in hash_formats_to_generate:
             hash_formats_to_generate.append(hash_format)
 
+    return hash_formats_to_generate
+
+
+def seal_file_path(
+    existing_history,
+    file_path,
+    hash_formats: [str],
+    session,
+    current_hash_lookup: Dict[str, str] = None,
+    file_stat: os.stat_result = None,
+) -> Dict[str, SealPathResult]:
+    """
+    Generates hashes for a file path.
+    Compares the generated hashes to any existing hash records
+    Adds the generated hashes to the hash history of the file path
+    :param existing_history: The existing hash record
+    :param file_path: The path for which to generate hashes
+    :param hash_formats: The hash formats to generate
+    :param session: The session to which the generated hashes will be added
+    :param current_hash_lookup: Already generated hashes for the formats from hash_formats_to_generate_for_path,
+    the file is hashed if not given
+    :param file_stat: The stat result of the file, e.g. from the traversal, the file is stat'ed if not given
+    :return: A dictionary keyed by hash_format strings.
+    Each entry contains the hash value and a boolean indicating if updating was successful
+    """
+    relative_path = existing_history.get_relative_file_path(file_path)
+    if file_stat is None:
+        file_stat = os.stat(file_path)
+    file_size = file_stat.st_size
+    file_modification_date = datetime.datetime.fromtimestamp(file_stat.st_mtime)
+
+    existing_child_history, existing_history_relative_path = existing_history.find_history_for_path(relative_path)
+    existing_hash_formats = existing_child_history.find_existing_hash_formats_for_path(existing_history_relative_path)
+    hash_formats_to_generate = hash_formats_to_generate_for_path(existing_history, file_path, hash_formats)
+
     # generate the file hashes
-    current_hash_lookup = multiple_format_hash_file(file_path, hash_formats_to_generate)
+    if current_hash_lookup is None:
+        current_hash_lookup = multiple_format_hash_file(file_path, hash_formats_to_generate)
 
     # the lookup where the results will be stored
     hash_result_lookup = {}
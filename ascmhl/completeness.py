@@ -0,0 +1,67 @@
+"""
+__author__ = "Patrick Renner, Alexander Sahm"
+__copyright__ = "Copyright 2024, Pomfort GmbH"
+
+__license__ = "MIT"
+__maintainer__ = "Patrick Renner, Alexander Sahm"
+__email__ = "opensource@pomfort.com"
+"""
+
+import os
+from typing import Set
+
+from .history import MHLHistory
+from .traverse import post_order_sort_key
+
+
+class MHLCompletenessCheck:
+    """
+    class for comparing the paths found by a traversal with the paths recorded in a history
+
+    the recorded paths (of all generations and child histories, renamed files with their current path) are sorted
+    once in the order of the traversal, the traversed paths are then joined with them as they are found. each
+    traversed path is classified in constant time, without looking at the generations, and every recorded path that
+    the traversal passed without finding it is missing.
+
+    - public interface
+        * initialized with the history and the root path of the traversal
+        * visiting the paths of a traversal in its order (post_order_lexicographic), returning whether each path
+          is recorded in the history
+        * finishing, which returns the recorded paths that weren't found
+    """
+
+    def __init__(self, history: MHLHistory, root_path: str):
+        self.root_path = root_path
+        self._root_prefix = os.path.join(root_path, "")
+        renamed_files = history.renamed_path_with_previous_path()
+        recorded_paths = {renamed_files.get(path, path) for path in history.set_of_file_paths()}
+        self._recorded_paths = sorted(
+            ((post_order_sort_key(os.path.relpath(path, root_path)), path) for path in recorded_paths),
+            key=lambda recorded_path: recorded_path[0],
+        )
+        self._position = 0
+        self._missing_paths = set()
+
+    def visit(self, file_path: str) -> bool:
+        """
+        returns whether a path found by the traversal is recorded in the history, the paths have to be visited in
+        the order of the traversal
+        """
+        sort_key = post_order_sort_key(file_path[len(self._root_prefix) :])
+        # recorded paths before the visited path in traversal order weren't found
+        while self._position < len(self._recorded_paths) and self._recorded_paths[self._position][0] < sort_key:
+            self._missing_paths.add(self._recorded_paths[self._position][1])
+            self._position += 1
+        if self._position < len(self._recorded_paths) and self._recorded_paths[self._position][0] == sort_key:
+            self._position += 1
+            return True
+        return False
+
+    def finish(self) -> Set[str]:
+        """
+        returns the recorded paths that weren't found by the traversal
+        """
+        for _, path in self._recorded_paths[self._position :]:
+            self._missing_paths.add(path)
+        self._position = len(self._recorded_paths)
+        return self._missing_paths
@@ -0,0 +1,504 @@
+"""
+__author__ = "Patrick Renner, Alexander Sahm"
+__copyright__ = "Copyright 2024, Pomfort GmbH"
+
+__license__ = "MIT"
+__maintainer__ = "Patrick Renner, Alexander Sahm"
+__email__ = "opensource@pomfort.com"
+"""
+
+import multiprocessing
+import os
+import queue
+import struct
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from timeit import default_timer as timer
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:
+    # not available on Windows, files are ordered by inode there
+    fcntl = None
+
+from .hasher import (
+    ReadOptions,
+    hash_strings_from_digests,
+    multiple_format_hash_file_digests,
+    multiple_format_hash_small_files,
+)
+from .progress import ProgressEvent, ProgressTracker
+from .shared_memory_hasher import SharedMemoryAggregateHasher
+from .traverse import TraversalEntry
+
+# backends for generating multiple hash formats of one file
+# auto -- threads for multiple formats of files larger than one chunk, serial otherwise
+# serial -- one thread feeds all hashers in turn
+# threads -- each hash format is generated in its own thread from a shared read-ahead queue
+# processes -- each hash format is generated in its own worker process from a shared memory ring buffer
+hashing_backends = ["auto", "serial", "threads", "processes"]
+
+
+class HashingEngine:
+    """
+    class for hashing the files of a folder hierarchy, optionally with multiple worker threads
+
+    files are handed to the workers in the order they are enumerated, but the results are always handed back in the
+    post-order of the traversal. directory hashes and new generations therefore don't depend on the number of workers.
+
+    small files of a folder are hashed in batches, each file is read with a single read call. with the processes
+    backend the batches are hashed in a pool of worker processes.
+
+    with multiple jobs the files are scheduled per device (st_dev): every device gets its own workers, so a traversal
+    that spans several volumes keeps all of them busy. rotational disks get rotational_jobs workers (one by default,
+    parallel reads would make the heads seek between the files), all other devices get jobs workers.
+
+    in layout order, the whole traversal is enumerated first and the files of each device are hashed in the order
+    of their physical location (see physical_file_offset), which avoids seeking on rotational disks and tapes. the
+    results are still handed back in the post-order of the traversal.
+
+    - public interface
+        * initialized with the number of files that are hashed in parallel (per device, and per rotational device),
+          the hashing backend and the read options
+        * hashing of single files
+        * hashing of all files of a traversal, yielding the traversed folders together with their file hashes
+        * closing, to stop worker processes of the backend
+        * progress callbacks, called with a ProgressEvent whenever files were found or hashed during a traversal
+    """
+
+    # number of tasks (files or batches of small files) per worker that are queued ahead of the folder that is
+    # currently handed back
+    files_queued_per_job = 4
+    # files up to this size are read at once and hashed in batches
+    small_file_size = 256 * 1024
+    # maximum number of small files in one batch
+    small_files_per_batch = 64
+
+    jobs: int
+    rotational_jobs: int
+    layout_order: bool
+    backend: str
+    read_options: ReadOptions
+    batch_small_files: bool
+    progress: ProgressTracker
+
+    def __init__(
+        self,
+        jobs: int = 1,
+        backend: str = "auto",
+        read_options: ReadOptions = None,
+        batch_small_files: bool = True,
+        progress: ProgressTracker = None,
+        rotational_jobs: int = 1,
+        layout_order: bool = False,
+    ):
+        if jobs < 1:
+            raise ValueError(f"invalid number of jobs: {jobs}")
+        if rotational_jobs < 1:
+            raise ValueError(f"invalid number of jobs for rotational devices: {rotational_jobs}")
+        if backend not in hashing_backends:
+            raise ValueError(f"invalid hashing backend: {backend}")
+        self.jobs = jobs
+        self.rotational_jobs = rotational_jobs
+        self.layout_order = layout_order
+        self.backend = backend
+        self.read_options = read_options or ReadOptions()
+        # O_DIRECT needs aligned buffers, so files are always read in chunks
+        self.batch_small_files = batch_small_files and self.read_options.page_cache_mode != "direct"
+        # the tracker can be shared, e.g. with a session that reports the progress of a whole command
+        self.progress = progress or ProgressTracker()
+        # each hashing thread uses its own shared memory hasher, idle ones are kept for reuse
+        self._shared_memory_hashers = []
+        self._idle_shared_memory_hashers = queue.SimpleQueue()
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def add_progress_callback(self, callback: Callable[[ProgressEvent], None]):
+        self.progress.add_callback(callback)
+
+    def hash_file(self, file_path: str, hash_formats: [str]) -> Dict[str, str]:
+        """
+        computes and returns new hash strings for a file in the calling thread
+
+        arguments:
+        file_path -- string value, path of file to generate hash for.
+        hash_formats -- string values, each entry is one of the supported hash formats, e.g. 'md5', 'xxh64'
+        """
+        return hash_strings_from_digests(self.hash_file_digests(file_path, hash_formats))
+
+    def hash_file_digests(self, file_path: str, hash_formats: [str]) -> Dict[str, bytes]:
+        """
+        computes and returns the raw digests for a file in the calling thread, see hash_file for the arguments
+        """
+        # a single format doesn't benefit from worker processes
+        if self.backend == "processes" and len(hash_formats) > 1:
+            shared_memory_hasher = self._acquire_shared_memory_hasher()
+            try:
+                return shared_memory_hasher.hash_file_digests(file_path, hash_formats)
+            finally:
+                self._idle_shared_memory_hashers.put(shared_memory_hasher)
+        if self.backend == "serial":
+            return multiple_format_hash_file_digests(file_path, hash_formats, False, self.read_options)
+        if self.backend == "threads":
+            return multiple_format_hash_file_digests(file_path, hash_formats, len(hash_formats) > 1, self.read_options)
+        return multiple_format_hash_file_digests(file_path, hash_formats, read_options=self.read_options)
+
+    def close(self):
+        """
+        stops the worker processes of the hashing backend, they are restarted if the engine is used again
+        """
+        with self._lock:
+            for shared_memory_hasher in self._shared_memory_hashers:
+                shared_memory_hasher.close()
+            self._shared_memory_hashers = []
+            self._idle_shared_memory_hashers = queue.SimpleQueue()
+
+    def hash_folders(
+        self,
+        folders: Iterable[Tuple[str, os.stat_result, List[TraversalEntry]]],
+        hash_formats_for_file: Callable[[str, Optional[os.stat_result]], Optional[List[str]]],
+    ):
+        """
+        hashes all files of a traversal and hands the results back in the order of the traversal
+
+        :param folders: the folders, their stat results and their children as yielded by
+            post_order_lexicographic_entries
+        :param hash_formats_for_file: returns the hash formats to generate for a file path and the stat result of the
+            file from the traversal (None if the file couldn't be stat'ed), None skips the file
+        :return: yields (folder_path, folder_stat, children, digest_lookups) tuples, digest_lookups maps the paths
+            of the hashed files in the folder to a dictionary of raw digests keyed by the respective hash format
+        """
+        if self.layout_order:
+            yield from self._hash_folders_in_layout_order(folders, hash_formats_for_file)
+            return
+        if self.jobs == 1:
+            try:
+                for folder_path, folder_stat, children in folders:
+                    small_files, files = self._files_to_hash(folder_path, children, hash_formats_for_file)
+                    digest_lookups = {}
+                    for batch in self._small_file_batches(small_files):
+                        batch = [
+                            (file_path, file_size, hash_formats) for file_path, file_size, hash_formats, _, _ in batch
+                        ]
+                        batch_digest_lookups, _, _ = _hash_small_files(
+                            batch, self.read_options.bypasses_page_cache, self.progress
+                        )
+                        for (file_path, _, _), digest_lookup in zip(batch, batch_digest_lookups):
+                            digest_lookups[file_path] = digest_lookup
+                    for file_path, file_size, hash_formats, _, _ in files:
+                        digest_lookups[file_path] = self._hash_file_task(file_path, file_size, hash_formats)
+                    yield folder_path, folder_stat, children, digest_lookups
+                self.progress.finish_enumeration()
+                self.progress.finish()
+            finally:
+                self.close()
+            return
+
+        # each device gets its own pool of hashing threads, the number of queued tasks grows with the workers
+        executors = _DeviceExecutors(self.jobs_for_device)
+        small_file_executor = None
+        if self.backend == "processes" and self.batch_small_files:
+            small_file_executor = ProcessPoolExecutor(
+                max_workers=self.jobs, mp_context=multiprocessing.get_context("spawn")
+            )
+        # folders whose files have been submitted to the workers, but that haven't been handed back yet
+        pending_folders = deque()
+        num_queued_tasks = 0
+        try:
+            for folder_path, folder_stat, children in folders:
+                small_files, files = self._files_to_hash(folder_path, children, hash_formats_for_file)
+                # the futures are keyed by file path, batches of small files share one future
+                futures = {}
+                num_tasks = 0
+                for device, device_small_files in _group_by_device(small_files).items():
+                    for batch in self._small_file_batches(device_small_files):
+                        batch = [
+                            (file_path, file_size, hash_formats) for file_path, file_size, hash_formats, _, _ in batch
+                        ]
+                        if small_file_executor is None:
+                            future = executors.executor(device).submit(
+                                _hash_small_files, batch, self.read_options.bypasses_page_cache, self.progress
+                            )
+                        else:
+                            # the progress of worker processes is reported when their results arrive
+                            future = small_file_executor.submit(
+                                _hash_small_files, batch, self.read_options.bypasses_page_cache
+                            )
+                            future.add_done_callback(self._report_small_files_progress(batch))
+                        for index, (file_path, _, _) in enumerate(batch):
+                            futures[file_path] = (future, index)
+                        num_tasks += 1
+                for file_path, file_size, hash_formats, device, _ in files:
+                    futures[file_path] = (
+                        executors.executor(device).submit(self._hash_file_task, file_path, file_size, hash_formats),
+                        None,
+                    )
+                    num_tasks += 1
+                pending_folders.append((folder_path, folder_stat, children, futures, num_tasks))
+                num_queued_tasks += num_tasks
+
+                # hand back the oldest folders as soon as enough tasks are queued to keep all workers busy
+                while pending_folders and (
+                    num_queued_tasks >= executors.num_workers * self.files_queued_per_job or not pending_folders[0][3]
+                ):
+                    folder_path, folder_stat, children, futures, num_tasks = pending_folders.popleft()
+                    num_queued_tasks -= num_tasks
+                    yield folder_path, folder_stat, children, self._results(futures)
+
+            self.progress.finish_enumeration()
+            while pending_folders:
+                folder_path, folder_stat, children, futures, _ = pending_folders.popleft()
+                yield folder_path, folder_stat, children, self._results(futures)
+            self.progress.finish()
+        finally:
+            executors.shutdown()
+            if small_file_executor is not None:
+                small_file_executor.shutdown(wait=True, cancel_futures=True)
+            self.close()
+
+    def _hash_folders_in_layout_order(self, folders, hash_formats_for_file):
+        # the complete traversal is needed to order the files, only the children of the folders are kept
+        folders = list(folders)
+        files_of_folders = []
+        files = []
+        for folder_path, _, children in folders:
+            small_files, other_files = self._files_to_hash(folder_path, children, hash_formats_for_file)
+            files_of_folders.append(small_files + other_files)
+            files += small_files + other_files
+        self.progress.finish_enumeration()
+        files.sort(key=lambda file: _layout_order_key(file[0], file[3], file[4]))
+
+        executors = _DeviceExecutors(self.jobs_for_device)
+        try:
+            if self.jobs == 1:
+                digest_lookups = {
+                    file_path: self._hash_file_task(file_path, file_size, hash_formats)
+                    for file_path, file_size, hash_formats, _, _ in files
+                }
+            else:
+                # the workers of a device take the files in submission order
+                futures = {
+                    file_path: (
+                        executors.executor(device).submit(self._hash_file_task, file_path, file_size, hash_formats),
+                        None,
+                    )
+                    for file_path, file_size, hash_formats, device, _ in files
+                }
+                digest_lookups = self._results(futures)
+        finally:
+            executors.shutdown()
+            self.close()
+
+        for (folder_path, folder_stat, children), folder_files in zip(folders, files_of_folders):
+            yield folder_path, folder_stat, children, {file[0]: digest_lookups.pop(file[0]) for file in folder_files}
+        self.progress.finish()
+
+    def jobs_for_device(self, device: Optional[int]) -> int:
+        """
+        returns the number of files that are hashed in parallel on a device, given by its st_dev
+        """
+        if device is not None and is_rotational_device(device):
+            return self.rotational_jobs
+        return self.jobs
+
+    def _acquire_shared_memory_hasher(self) -> SharedMemoryAggregateHasher:
+        try:
+            return self._idle_shared_memory_hashers.get_nowait()
+        except queue.Empty:
+            shared_memory_hasher = SharedMemoryAggregateHasher(
+                chunk_size=self.read_options.chunk_size, page_cache_mode=self.read_options.page_cache_mode
+            )
+            with self._lock:
+                self._shared_memory_hashers.append(shared_memory_hasher)
+            return shared_memory_hasher
+
+    def _hash_file_task(self, file_path: str, file_size: Optional[int], hash_formats: [str]) -> Dict[str, bytes]:
+        start = timer()
+        digest_lookup = self.hash_file_digests(file_path, hash_formats)
+        self.progress.files_hashed([(file_path, file_size or 0)], timer() - start, threading.current_thread().name)
+        return digest_lookup
+
+    def _report_small_files_progress(self, batch):
+        def report(future):
+            if not future.cancelled() and future.exception() is None:
+                _, seconds, worker = future.result()
+                self.progress.files_hashed(
+                    [(file_path, file_size) for file_path, file_size, _ in batch], seconds, worker
+                )
+
+        return report
+
+    def _files_to_hash(self, folder_path, children, hash_formats_for_file):
+        """
+        returns the files of a folder that need to be hashed, as a list of (file path, file size, hash formats,
+        device, inode) tuples of small files and a list of such tuples of all other files
+        """
+        small_files = []
+        files = []
+        num_bytes = 0
+        for item_name, is_dir, file_stat in children:
+            if is_dir:
+                continue
+            file_path = os.path.join(folder_path, item_name)
+            hash_formats = hash_formats_for_file(file_path, file_stat)
+            if not hash_formats:
+                continue
+            if file_stat is not None:
+                file_size, device, inode = file_stat.st_size, file_stat.st_dev, file_stat.st_ino
+                num_bytes += file_size
+            else:
+                # the error is raised when the file is hashed
+                file_size, device, inode = None, None, None
+            if self.batch_small_files and file_size is not None and file_size <= self.small_file_size:
+                small_files.append((file_path, file_size, hash_formats, device, inode))
+                continue
+            files.append((file_path, file_size, hash_formats, device, inode))
+        if small_files or files:
+            self.progress.files_enumerated(len(small_files) + len(files), num_bytes)
+        return small_files, files
+
+    def _small_file_batches(self, small_files):
+        for index in range(0, len(small_files), self.small_files_per_batch):
+            yield small_files[index : index + self.small_files_per_batch]
+
+    @staticmethod
+    def _results(futures) -> Dict[str, Dict[str, bytes]]:
+        # results are collected in submission order, so the first failing task raises its exception
+        return {
+            file_path: future.result() if index is None else future.result()[0][index]
+            for file_path, (future, index) in futures.items()
+        }
+
+
+class _DeviceExecutors:
+    """
+    thread pools per device (st_dev), created when the first file of a device is submitted
+    """
+
+    def __init__(self, jobs_for_device: Callable[[Optional[int]], int]):
+        self.jobs_for_device = jobs_for_device
+        self.executors = {}
+        self.num_workers = 0
+
+    def executor(self, device: Optional[int]) -> ThreadPoolExecutor:
+        if device not in self.executors:
+            num_workers = self.jobs_for_device(device)
+            name = "ascmhl-hash" if device is None else f"ascmhl-hash-{_device_name(device)}"
+            self.executors[device] = ThreadPoolExecutor(max_workers=num_workers, thread_name_prefix=name)
+            self.num_workers += num_workers
+        return self.executors[device]
+
+    def shutdown(self):
+        for executor in self.executors.values():
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+# ioctl to query the extents of a file on Linux, see linux/fiemap.h
+_fs_ioc_fiemap = 0xC020660B
+_fiemap_header = struct.Struct("=QQLLLL")
+_fiemap_extent = struct.Struct("=QQQQQLLLL")
+
+
+def physical_file_offset(file_path: str) -> Optional[int]:
+    """
+    returns the physical offset of the first extent of a file on its device, or None if it isn't known, e.g. for
+    file systems without FIEMAP support (such as LTFS and network file systems), empty files and on other platforms
+    than Linux
+    """
+    if fcntl is None:
+        return None
+    try:
+        fd = os.open(file_path, os.O_RDONLY)
+    except OSError:
+        return None
+    try:
+        # ask for the first extent only
+        request = bytearray(_fiemap_header.pack(0, 0xFFFFFFFFFFFFFFFF, 0, 0, 1, 0) + bytes(_fiemap_extent.size))
+        fcntl.ioctl(fd, _fs_ioc_fiemap, request)
+    except OSError:
+        return None
+    finally:
+        os.close(fd)
+    num_mapped_extents = _fiemap_header.unpack_from(request)[3]
+    if num_mapped_extents == 0:
+        return None
+    return _fiemap_extent.unpack_from(request, _fiemap_header.size)[1]
+
+
+def _layout_order_key(file_path: str, device: Optional[int], inode: Optional[int]):
+    # files without a known physical offset follow in inode order, which often matches the order of allocation
+    physical_offset = physical_file_offset(file_path)
+    if physical_offset is not None:
+        return device or 0, 0, physical_offset
+    if inode is not None:
+        return device or 0, 1, inode
+    return device or 0, 2, 0
+
+
+def _group_by_device(files) -> Dict[Optional[int], list]:
+    groups = {}
+    for file in files:
+        groups.setdefault(file[3], []).append(file)
+    return groups
+
+
+# rotational flags of the devices, keyed by st_dev
+_rotational_devices = {}
+
+
+def is_rotational_device(device: int) -> bool:
+    """
+    returns whether a device (st_dev) is a rotational disk, as reported by the kernel. False where this isn't known,
+    e.g. on other platforms than Linux, for network and virtual file systems
+    """
+    if not hasattr(os, "major"):
+        # e.g. on Windows, device numbers can't be split into major and minor numbers
+        return False
+    if device not in _rotational_devices:
+        rotational = False
+        block_device_path = f"/sys/dev/block/{_device_name(device)}"
+        # partitions don't have a queue, it belongs to the parent device
+        for queue_path in [block_device_path, os.path.join(block_device_path, "..")]:
+            try:
+                with open(os.path.join(queue_path, "queue", "rotational"), "r") as rotational_file:
+                    rotational = rotational_file.read().strip() == "1"
+                break
+            except OSError:
+                continue
+        _rotational_devices[device] = rotational
+    return _rotational_devices[device]
+
+
+def _device_name(device: int) -> str:
+    """
+    returns the major and minor number of a device (st_dev) like "8:1", or the device number where the platform
+    doesn't split it (e.g. Windows)
+    """
+    if hasattr(os, "major"):
+        return f"{os.major(device)}:{os.minor(device)}"
+    return str(device)
+
+
+def _hash_small_files(batch, drop_from_page_cache: bool, progress: ProgressTracker = None):
+    """
+    hashes a batch of small files, returns the digest lookups, the time it took and the name of the worker
+
+    runs in a worker thread or a worker process, in the latter case the progress is reported by the caller
+    """
+    start = timer()
+    digest_lookups = multiple_format_hash_small_files(batch, drop_from_page_cache)
+    seconds = timer() - start
+    if multiprocessing.parent_process() is not None:
+        worker = f"process-{os.getpid()}"
+    else:
+        worker = threading.current_thread().name
+    if progress is not None:
+        progress.files_hashed([(file_path, file_size) for file_path, file_size, _ in batch], seconds, worker)
+    return digest_lookups, seconds, worker
@@ -71,3 +71,17 @@ class MissingMHLManifestException(click.ClickException):
 
     def __init__(self, path):
         super().__init__(f"Missing ASC MHL manifest in history at path {path}")
+
+
+class DestinationExistsException(click.ClickException):
+    exit_code = 40
+
+    def __init__(self, path):
+        super().__init__(f"Destination folder already exists at path {path}")
+
+
+class SymlinkedFolderException(click.ClickException):
+    exit_code = 41
+
+    def __init__(self, path):
+        super().__init__(f"Symlinked folders can't be offloaded, found one at path {path}")
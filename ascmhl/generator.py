@@ -8,13 +8,14 @@ __email__ = "opensource@pomfort.com"
 """
 
 from collections import defaultdict
-from typing import Dict, List
+from typing import Callable, Dict, List
 
 from . import chain_xml_parser
 from . import logger
 from .ignore import MHLIgnoreSpec
 from .hashlist import MHLHashList, MHLHashEntry, MHLCreatorInfo, MHLProcessInfo
 from .history import MHLHistory
+from .progress import ProgressEvent, ProgressTracker
 
 
 class MHLGenerationCreationSession:
@@ -30,16 +31,22 @@ class MHLGenerationCreationSession:
         * initialized with a MHLHistory object
         * adding hashes generated from certain files
         * committing of a session to write the new generation to disk
+        * progress callbacks, the progress tracker of the session is handed to the hashing engine
     """
 
     root_history: MHLHistory
     new_hash_lists: Dict[MHLHistory, MHLHashList]
     ignore_spec: MHLIgnoreSpec
+    progress: ProgressTracker
 
     def __init__(self, history: MHLHistory, ignore_spec: MHLIgnoreSpec = MHLIgnoreSpec()):
         self.root_history = history
         self.new_hash_lists = defaultdict(MHLHashList)
         self.ignore_spec = ignore_spec
+        self.progress = ProgressTracker()
+
+    def add_progress_callback(self, callback: Callable[[ProgressEvent], None]):
+        self.progress.add_callback(callback)
 
     def append_multiple_format_file_hashes(
         self, file_path, file_size, hash_lookup: Dict[str, str], file_modification_date, action=None, hash_date=None
@@ -0,0 +1,155 @@
+"""
+__author__ = "Patrick Renner, Alexander Sahm"
+__copyright__ = "Copyright 2024, Pomfort GmbH"
+
+__license__ = "MIT"
+__maintainer__ = "Patrick Renner, Alexander Sahm"
+__email__ = "opensource@pomfort.com"
+"""
+
+import os
+import sqlite3
+import time
+from typing import Dict, Optional
+
+from . import logger
+from .hasher import hasher_registration
+
+
+class MHLHashCache:
+    """
+    class for caching the digests of files across runs in an SQLite database
+
+    a file is identified by its device and inode, the cached digests are only used as long as the size, the
+    modification time and the change time of the file are the same as when it was hashed. a file that was
+    written, truncated, renamed over or had its metadata changed is therefore hashed again. the cache trusts
+    the file system metadata, it doesn't detect changes of the content that leave the metadata untouched (e.g.
+    bit rot), so it is only used when explicitly requested.
+
+    the hash formats are looked up in the hasher registry, so formats of plugins can be cached as well. cached
+    digests that don't have the digest size of their registered format (e.g. of a plugin that was replaced by
+    another one with the same name) are not used.
+
+    - public interface
+        * initialized with the path of the database file and the maximum number of cached digests
+        * looking up the digests of a file by its stat result, counted as hit or miss
+        * storing the digests of a file together with the stat result from before it was hashed
+        * closing, which evicts the least recently used digests above the limit
+    """
+
+    default_max_entries = 1000000
+    # changes are committed in transactions of this many files
+    files_per_transaction = 1000
+
+    def __init__(self, file_path: str, max_entries: int = default_max_entries):
+        if max_entries < 1:
+            raise ValueError(f"invalid maximum number of cache entries: {max_entries}")
+        self.file_path = file_path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._num_uncommitted_files = 0
+        # entries are stamped with the start of the run in which they were last used
+        self._run_time = int(time.time())
+        os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
+        self.connection = sqlite3.connect(file_path)
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS file_digests ("
+            " device INTEGER NOT NULL, inode INTEGER NOT NULL, size INTEGER NOT NULL,"
+            " mtime_ns INTEGER NOT NULL, ctime_ns INTEGER NOT NULL, hash_format TEXT NOT NULL,"
+            " digest BLOB NOT NULL, last_used INTEGER NOT NULL,"
+            " PRIMARY KEY (device, inode, hash_format))"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS file_digests_last_used ON file_digests (last_used)")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def lookup(self, file_stat: os.stat_result, hash_formats: [str]) -> Optional[Dict[str, bytes]]:
+        """
+        returns the cached digests of a file in all given formats, or None if any of them isn't cached
+        """
+        digest_sizes = {hash_format: hasher_registration(hash_format).digest_size for hash_format in hash_formats}
+        rows = self.connection.execute(
+            "SELECT hash_format, digest FROM file_digests"
+            " WHERE device = ? AND inode = ? AND size = ? AND mtime_ns = ? AND ctime_ns = ?",
+            self._file_key(file_stat),
+        ).fetchall()
+        cached_digests = dict(rows)
+        if not all(
+            len(cached_digests.get(hash_format, b"")) == digest_sizes[hash_format] for hash_format in hash_formats
+        ):
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.connection.execute(
+            "UPDATE file_digests SET last_used = ? WHERE device = ? AND inode = ?",
+            (self._run_time, _signed_integer(file_stat.st_dev), _signed_integer(file_stat.st_ino)),
+        )
+        self._file_changed()
+        return {hash_format: cached_digests[hash_format] for hash_format in hash_formats}
+
+    def store(self, file_stat: os.stat_result, digest_lookup: Dict[str, bytes]):
+        """
+        stores the digests of a file, file_stat must be taken before the file was hashed, so a file that
+        changes while it is hashed doesn't match the entry afterwards
+        """
+        for hash_format, digest in digest_lookup.items():
+            if len(digest) != hasher_registration(hash_format).digest_size:
+                raise ValueError(f"invalid {hash_format} digest of {len(digest)} bytes")
+        file_key = self._file_key(file_stat)
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO file_digests"
+            " (device, inode, size, mtime_ns, ctime_ns, hash_format, digest, last_used)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [file_key + (hash_format, digest, self._run_time) for hash_format, digest in digest_lookup.items()],
+        )
+        # digests of the previous content of the file can't be used any more
+        self.connection.execute(
+            "DELETE FROM file_digests WHERE device = ? AND inode = ?"
+            " AND (size != ? OR mtime_ns != ? OR ctime_ns != ?)",
+            file_key,
+        )
+        self._file_changed()
+
+    def close(self):
+        if self.connection is None:
+            return
+        num_entries = self.connection.execute("SELECT COUNT(*) FROM file_digests").fetchone()[0]
+        if num_entries > self.max_entries:
+            self.evictions = num_entries - self.max_entries
+            self.connection.execute(
+                "DELETE FROM file_digests WHERE rowid IN"
+                " (SELECT rowid FROM file_digests ORDER BY last_used LIMIT ?)",
+                (self.evictions,),
+            )
+        self.connection.commit()
+        self.connection.close()
+        self.connection = None
+        logger.verbose(f"hash cache: {self.hits} hit(s), {self.misses} miss(es), {self.evictions} evicted digest(s)")
+
+    def _file_changed(self):
+        self._num_uncommitted_files += 1
+        if self._num_uncommitted_files >= self.files_per_transaction:
+            self.connection.commit()
+            self._num_uncommitted_files = 0
+
+    @staticmethod
+    def _file_key(file_stat: os.stat_result):
+        return (
+            _signed_integer(file_stat.st_dev),
+            _signed_integer(file_stat.st_ino),
+            file_stat.st_size,
+            file_stat.st_mtime_ns,
+            file_stat.st_ctime_ns,
+        )
+
+
+def _signed_integer(value: int) -> int:
+    # SQLite integers are signed 64 bit values, device and inode numbers are unsigned
+    return value - (1 << 64) if value >= (1 << 63) else value
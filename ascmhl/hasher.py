@@ -8,13 +8,226 @@ __email__ = "opensource@pomfort.com"
 """
 
 import binascii
+import errno
 import hashlib
+import mmap
+import queue
+import threading
 
 import xxhash
 import os
+from contextlib import contextmanager
+from functools import cached_property
 from enum import Enum, unique
+from importlib.metadata import entry_points
 from abc import ABC, abstractmethod
-from typing import Dict
+from timeit import default_timer as timer
+from typing import Dict, List, Optional, Tuple
+
+from . import logger
+
+try:
+    import fcntl
+except ImportError:
+    # e.g. on Windows, where there is no O_DIRECT either
+    fcntl = None
+
+# modes for the use of the page cache while reading files for hashing
+# default -- files are read through the page cache
+# bypass -- the page cache is advised that files are read sequentially once, read pages are dropped behind the cursor
+# direct -- files are read with O_DIRECT into aligned buffers, files on file systems that don't support O_DIRECT
+#           are read with regular reads and the advice of bypass
+page_cache_modes = ["default", "bypass", "direct"]
+
+
+class ReadOptions:
+    """
+    ReadOptions wraps how files are read for hashing.
+
+    attribute member variables:
+    chunk_size -- number of bytes read (and handed to the hashers) at once
+    use_mmap -- map local files into memory instead of reading them into buffers
+    read_size_tuner -- picks the chunk size per device instead of using chunk_size, None if disabled
+    page_cache_mode -- one of page_cache_modes
+    """
+
+    default_chunk_size = 1024 * 1024  # chunk size 1MB
+    # alignment of buffers, offsets and sizes for O_DIRECT
+    direct_io_alignment = 4096
+    # number of chunks the kernel is asked to read ahead of the cursor when bypassing the page cache
+    read_ahead_chunks = 4
+
+    chunk_size: int
+    use_mmap: bool
+    read_size_tuner: Optional["ReadSizeTuner"]
+    page_cache_mode: str
+
+    def __init__(
+        self,
+        chunk_size: int = default_chunk_size,
+        use_mmap: bool = False,
+        auto_tune_read_size: bool = False,
+        page_cache_mode: str = "default",
+    ):
+        if chunk_size < 1:
+            raise ValueError(f"invalid read size: {chunk_size}")
+        if page_cache_mode not in page_cache_modes:
+            raise ValueError(f"invalid page cache mode: {page_cache_mode}")
+        if use_mmap and page_cache_mode != "default":
+            raise ValueError("memory mapped files are always read through the page cache")
+        if page_cache_mode == "direct":
+            # round up to the next multiple of the alignment
+            chunk_size = -(-chunk_size // self.direct_io_alignment) * self.direct_io_alignment
+        self.chunk_size = chunk_size
+        self.use_mmap = use_mmap
+        self.read_size_tuner = ReadSizeTuner(chunk_size) if auto_tune_read_size else None
+        self.page_cache_mode = page_cache_mode
+
+    @property
+    def bypasses_page_cache(self) -> bool:
+        return self.page_cache_mode != "default"
+
+    @contextmanager
+    def open_file(self, file_path: str):
+        """
+        context manager for reading a file, yields the opened file object and the chunk size to read the file with
+
+        with auto-tuning the chunk size is chosen for the device of the file, and the time until the context is left
+        (the file has been read and hashed) is measured for the device
+        """
+        with self._open(file_path) as fd:
+            if self.bypasses_page_cache:
+                _advise(fd, 0, 0, "POSIX_FADV_SEQUENTIAL")
+            if self.read_size_tuner is None:
+                yield fd, self.chunk_size
+                return
+            file_stat = os.fstat(fd.fileno())
+            chunk_size = self.read_size_tuner.chunk_size_for_file(file_stat.st_dev, file_stat.st_size)
+            start = timer()
+            yield fd, chunk_size
+            self.read_size_tuner.add_measurement(file_stat.st_dev, chunk_size, file_stat.st_size, timer() - start)
+
+    def allocate_buffer(self, size: int) -> memoryview:
+        """
+        returns a writable buffer for reading chunks of the given size, aligned for O_DIRECT if needed
+        """
+        if self.page_cache_mode == "direct":
+            # anonymous memory maps are page aligned
+            return memoryview(mmap.mmap(-1, size))
+        return memoryview(bytearray(size))
+
+    def chunks_consumed(self, fd, offset: int, chunk_size: int):
+        """
+        called once all bytes of the file up to offset have been hashed. when bypassing the page cache, the cached
+        pages behind offset are dropped and the kernel is asked to read ahead of it
+        """
+        if not self._reads_through_page_cache(fd):
+            return
+        _advise(fd, 0, offset, "POSIX_FADV_DONTNEED")
+        _advise(fd, offset, chunk_size * self.read_ahead_chunks, "POSIX_FADV_WILLNEED")
+
+    def _reads_through_page_cache(self, fd) -> bool:
+        if self.page_cache_mode == "bypass":
+            return True
+        if self.page_cache_mode != "direct":
+            return False
+        # files that were opened without O_DIRECT (see _open) are read like with bypass
+        if fcntl is None or not hasattr(os, "O_DIRECT"):
+            return True
+        return not fcntl.fcntl(fd.fileno(), fcntl.F_GETFL) & os.O_DIRECT
+
+    def _open(self, file_path: str):
+        if self.page_cache_mode != "direct" or not hasattr(os, "O_DIRECT"):
+            return open(file_path, "rb")
+        try:
+            file_descriptor = os.open(file_path, os.O_RDONLY | os.O_DIRECT)
+        except OSError as error:
+            # e.g. tmpfs doesn't support O_DIRECT
+            if error.errno != errno.EINVAL:
+                raise
+            return open(file_path, "rb")
+        # reads have to go directly into the aligned buffers, so the file object must not be buffered
+        return open(file_descriptor, "rb", buffering=0)
+
+
+def _advise(fd, offset: int, length: int, advice: str):
+    """
+    gives the kernel advice about the access pattern of a file, ignored on platforms without posix_fadvise
+    """
+    if not hasattr(os, "posix_fadvise"):
+        return
+    try:
+        os.posix_fadvise(fd.fileno(), offset, length, getattr(os, advice))
+    except OSError:
+        # the advice is only a hint, e.g. pipes and some network file systems don't support it
+        pass
+
+
+class ReadSizeTuner:
+    """
+    class for choosing the read size per device (st_dev) by probing the throughput on the first files of a run
+
+    while a device is probed, large enough files are read with the candidate sizes in turn. once each candidate has
+    been measured on probe_files_per_size files, the size with the highest throughput is used for all following files
+    of the device. files that are too small for probing are read with the default size (or the size chosen so far).
+    """
+
+    candidate_sizes = [1024 * 1024, 4 * 1024 * 1024, 16 * 1024 * 1024, 64 * 1024 * 1024]
+    probe_files_per_size = 2
+    # only files with at least this many chunks of a candidate size are used for probing that size
+    min_chunks_per_probe_file = 4
+
+    def __init__(self, default_chunk_size: int = ReadOptions.default_chunk_size):
+        self.default_chunk_size = default_chunk_size
+        # device -> {candidate size: [measured bytes, measured seconds, number of files]}
+        self._measurements = {}
+        # device -> chosen size
+        self._chosen_sizes = {}
+        self._lock = threading.Lock()
+
+    def chunk_size_for_file(self, device: int, file_size: int) -> int:
+        with self._lock:
+            chosen_size = self._chosen_sizes.get(device)
+            if chosen_size is not None:
+                return chosen_size
+            measurements = self._measurements.setdefault(device, {size: [0, 0.0, 0] for size in self.candidate_sizes})
+            probe_sizes = [
+                size
+                for size, (_, _, num_files) in measurements.items()
+                if num_files < self.probe_files_per_size and file_size >= size * self.min_chunks_per_probe_file
+            ]
+            if not probe_sizes:
+                return self.default_chunk_size
+            # probe the candidate with the fewest measurements, so concurrent workers probe different sizes
+            return min(probe_sizes, key=lambda size: measurements[size][2])
+
+    def add_measurement(self, device: int, chunk_size: int, num_bytes: int, seconds: float):
+        with self._lock:
+            if device in self._chosen_sizes or chunk_size not in self._measurements.get(device, {}):
+                return
+            if num_bytes < chunk_size * self.min_chunks_per_probe_file:
+                return
+            measurement = self._measurements[device][chunk_size]
+            measurement[0] += num_bytes
+            measurement[1] += seconds
+            measurement[2] += 1
+            if any(num_files < self.probe_files_per_size for _, _, num_files in self._measurements[device].values()):
+                return
+            chosen_size, (num_bytes, seconds, _) = max(
+                self._measurements[device].items(), key=lambda item: item[1][0] / max(item[1][1], 1e-9)
+            )
+            self._chosen_sizes[device] = chosen_size
+            logger.verbose(
+                f"  read size for device {device}: {chosen_size // (1024 * 1024)} MB "
+                f"({num_bytes / max(seconds, 1e-9) / (1024 * 1024):.1f} MB/s)"
+            )
+
+    def chosen_sizes(self) -> Dict[int, int]:
+        """
+        returns the read sizes chosen so far, keyed by device
+        """
+        with self._lock:
+            return dict(self._chosen_sizes)
 
 
 class Hasher(ABC):
@@ -23,6 +236,11 @@ class Hasher(ABC):
     This abstraction is primarily necessary due to some discrepancies in the hash encoding of C4ID.
     """
 
+    # the wrapped hasher type is a hashlib constructor that can be passed to hashlib.file_digest
+    supports_file_digest = False
+    # rough single core throughput in MB/s, used to choose the fastest of several formats (None if unknown)
+    throughput: Optional[float] = None
+
     def __init__(self):
         # instantiate our internal hash generator. such as: hashlib.md5 or xxhash.xxh64
         self.hasher = self.hashlib_type()()
@@ -33,6 +251,22 @@ class Hasher(ABC):
         """
         self.hasher.update(data)
 
+    def digest(self) -> bytes:
+        """
+        get the raw digest of the current state of the internal hasher
+        """
+        return self.hasher.digest()
+
+    def reset(self) -> None:
+        """
+        resets the internal hasher, so the hasher can be reused for new data
+        """
+        if hasattr(self.hasher, "reset"):
+            # xxhash supports resetting in place
+            self.hasher.reset()
+        else:
+            self.hasher = self.hashlib_type()()
+
     @abstractmethod
     def string_digest(self) -> str:
         """
@@ -48,6 +282,30 @@ class Hasher(ABC):
         """
         pass
 
+    @classmethod
+    @abstractmethod
+    def string_digest_from_bytes(cls, digest: bytes) -> str:
+        """
+        helper to convert the byte representation of a hash to its string adhering to the encoding of the hash_type.
+        """
+        pass
+
+    @classmethod
+    def bytes_from_string_digests(cls, hash_strings: [str]) -> [bytes]:
+        """
+        batch version of bytes_from_string_digest
+        """
+        bytes_from_string_digest = cls.bytes_from_string_digest
+        return [bytes_from_string_digest(hash_string) for hash_string in hash_strings]
+
+    @classmethod
+    def string_digests_from_bytes(cls, digests: [bytes]) -> [str]:
+        """
+        batch version of string_digest_from_bytes
+        """
+        string_digest_from_bytes = cls.string_digest_from_bytes
+        return [string_digest_from_bytes(digest) for digest in digests]
+
     @staticmethod
     @abstractmethod
     def hashlib_type():
@@ -70,28 +328,37 @@ class Hasher(ABC):
 
         # sort lexicographically
         hash_list.sort()
-        for hash_string in hash_list:
-            hasher.update(cls.bytes_from_string_digest(hash_string))
+        # feeding the concatenated digests is the same as feeding them one by one
+        hasher.update(b"".join(cls.bytes_from_string_digests(hash_list)))
 
         return hasher.string_digest()
 
     @classmethod
-    def hash_file(cls, filepath: str) -> str:
+    def hash_file(cls, filepath: str, read_options: ReadOptions = None) -> str:
         """
         computes and returns a new hash string for a file
 
         arguments:
         filepath -- string value, path of file to generate hash for.
-        hash_format -- string value, one of the supported hash formats, e.g. 'md5', 'xxh64'
+        read_options -- how the file is read, defaults to reading chunks of 1MB into a reused buffer
         """
+        read_options = read_options or ReadOptions()
         hasher = cls()
-        with open(filepath, "rb") as fd:
-            # process files in chunks so that large files won't cause excessive memory consumption.
-            size = 1024 * 1024  # chunk size 1MB
-            chunk = fd.read(size)
-            while chunk:
-                hasher.update(chunk)
-                chunk = fd.read(size)
+        with read_options.open_file(filepath) as (fd, size):
+            if read_options.use_mmap:
+                for chunk in read_mapped_chunks(fd, size):
+                    hasher.update(chunk)
+            elif (
+                cls.supports_file_digest
+                and size == ReadOptions.default_chunk_size
+                and not read_options.bypasses_page_cache
+            ):
+                # hashlib reads into a reused buffer itself
+                hasher.hasher = hashlib.file_digest(fd, cls.hashlib_type())
+            else:
+                # process files in chunks so that large files won't cause excessive memory consumption.
+                for chunk in read_chunks(fd, size, read_options):
+                    hasher.update(chunk)
 
         return hasher.string_digest()
 
@@ -122,12 +389,19 @@ class HexHasher(Hasher, ABC):
     def bytes_from_string_digest(cls, hash_string: str) -> bytes:
         return binascii.unhexlify(hash_string)
 
+    @classmethod
+    def string_digest_from_bytes(cls, digest: bytes) -> str:
+        return digest.hex()
+
 
 class MD5(HexHasher):
     """
     md5 checksum generator.
     """
 
+    supports_file_digest = True
+    throughput = 700
+
     @staticmethod
     def hashlib_type():
         return hashlib.md5
@@ -138,6 +412,9 @@ class SHA1(HexHasher):
     sha1 checksum generator.
     """
 
+    supports_file_digest = True
+    throughput = 1000
+
     @staticmethod
     def hashlib_type():
         return hashlib.sha1
@@ -148,6 +425,8 @@ class XXH32(HexHasher):
     xxh32 checksum generator.
     """
 
+    throughput = 6000
+
     @staticmethod
     def hashlib_type():
         return xxhash.xxh32
@@ -158,6 +437,8 @@ class XXH64(HexHasher):
     xxh64 checksum generator.
     """
 
+    throughput = 12000
+
     @staticmethod
     def hashlib_type():
         return xxhash.xxh64
@@ -168,6 +449,8 @@ class XXH3(HexHasher):
     xxh3 checksum generator.
     """
 
+    throughput = 20000
+
     @staticmethod
     def hashlib_type():
         return xxhash.xxh3_64
@@ -178,11 +461,39 @@ class XXH128(HexHasher):
     xxh128 checksum generator.
     """
 
+    throughput = 20000
+
     @staticmethod
     def hashlib_type():
         return xxhash.xxh3_128
 
 
+class SHA256(HexHasher):
+    """
+    sha256 checksum generator, not part of the ASC MHL specification and only used internally.
+    """
+
+    supports_file_digest = True
+    throughput = 600
+
+    @staticmethod
+    def hashlib_type():
+        return hashlib.sha256
+
+
+class BLAKE2B(HexHasher):
+    """
+    blake2b checksum generator, not part of the ASC MHL specification and only used internally.
+    """
+
+    supports_file_digest = True
+    throughput = 1000
+
+    @staticmethod
+    def hashlib_type():
+        return hashlib.blake2b
+
+
 class C4(Hasher):
     """
     C4 checksum generator.
@@ -191,42 +502,86 @@ class C4(Hasher):
 
     # c4 has a different character set than the usual hex char set of other checksum types. encoding is different.
     charset = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"  # C4ID character set
+    supports_file_digest = True
+    throughput = 900
 
     @staticmethod
     def hashlib_type():
         return hashlib.sha512
 
     def string_digest(self) -> str:
-        sha512_string = self.hasher.hexdigest()
-
-        base58 = 58  # the encoding basis
-        c4id_length = 90  # the guaranteed length
-        zero = "1"  # '0' is not in the C4ID alphabet so '1' is zero
+        return _c4_encode(self.hasher.digest())
 
-        hash_value = int(sha512_string, 16)
-        c4_string = ""
-        while hash_value != 0:
-            modulo = hash_value % base58
-            hash_value = hash_value // base58
-            c4_string = C4.charset[modulo] + c4_string
-
-        c4_string = "c4" + c4_string.rjust(c4id_length - 2, zero)
-        return c4_string
+    @classmethod
+    def string_digest_from_bytes(cls, digest: bytes) -> str:
+        return _c4_encode(digest)
 
     @classmethod
     def bytes_from_string_digest(cls, hash_string: str) -> bytes:
-        base58 = 58  # the encoding basis
-        c4id_length = 90  # the guaranteed length
-        result = 0
-        i = 2
+        return _c4_decode(hash_string)
 
-        while i < c4id_length:
-            temp = C4.charset.index(hash_string[i])
-            result = result * base58 + temp
-            i = i + 1
+    @classmethod
+    def bytes_from_string_digests(cls, hash_strings: [str]) -> [bytes]:
+        return [_c4_decode(hash_string) for hash_string in hash_strings]
 
-        data = result.to_bytes(64, byteorder="big")
-        return data
+    @classmethod
+    def string_digests_from_bytes(cls, digests: [bytes]) -> [str]:
+        return [_c4_encode(digest) for digest in digests]
+
+
+# C4 ids are encoded with lookup tables for pairs of base58 digits (58 * 58 entries) instead of single digits.
+# the 512 bit value is split into 9 groups of 5 pairs, so only 9 divisions operate on the large integer.
+_c4id_length = 90  # the guaranteed length
+_c4_pair_base = 58 * 58
+_c4_group_base = _c4_pair_base**5
+_c4_pair_strings = [high + low for high in C4.charset for low in C4.charset]
+_c4_pair_values = {pair_string: value for value, pair_string in enumerate(_c4_pair_strings)}
+
+
+def _c4_encode(digest: bytes, pair_strings=_c4_pair_strings, pair_base=_c4_pair_base, group_base=_c4_group_base) -> str:
+    hash_value = int.from_bytes(digest, byteorder="big")
+    if hash_value.bit_length() > 512:
+        raise ValueError(f"digest is too long for a c4 id: {len(digest)} bytes")
+    pairs = []
+    for _ in range(9):
+        hash_value, group = divmod(hash_value, group_base)
+        group, pair_1 = divmod(group, pair_base)
+        group, pair_2 = divmod(group, pair_base)
+        group, pair_3 = divmod(group, pair_base)
+        pair_5, pair_4 = divmod(group, pair_base)
+        pairs += (
+            pair_strings[pair_1],
+            pair_strings[pair_2],
+            pair_strings[pair_3],
+            pair_strings[pair_4],
+            pair_strings[pair_5],
+        )
+    pairs.reverse()
+    # 90 digits are zero padded ('0' is not in the C4ID alphabet so '1' is zero), the first two are always zero
+    # and are replaced by the prefix
+    return "c4" + "".join(pairs)[2:]
+
+
+def _c4_decode(
+    hash_string: str, pair_values=_c4_pair_values, pair_base=_c4_pair_base, group_base=_c4_group_base
+) -> bytes:
+    if len(hash_string) != _c4id_length:
+        raise ValueError(f"invalid c4 id length: {hash_string}")
+    try:
+        values = [pair_values[hash_string[index : index + 2]] for index in range(2, _c4id_length, 2)]
+    except KeyError:
+        raise ValueError(f"invalid character in c4 id: {hash_string}") from None
+    # 44 pairs: 8 groups of 5 pairs and a last group of 4 pairs
+    result = 0
+    for index in range(0, 40, 5):
+        group = (
+            ((values[index] * pair_base + values[index + 1]) * pair_base + values[index + 2]) * pair_base
+            + values[index + 3]
+        ) * pair_base + values[index + 4]
+        result = result * group_base + group
+    group = ((values[40] * pair_base + values[41]) * pair_base + values[42]) * pair_base + values[43]
+    result = result * pair_base**4 + group
+    return result.to_bytes(64, byteorder="big")
 
 
 @unique
@@ -244,6 +599,123 @@ class HashType(Enum):
     c4 = C4
 
 
+# entry point group for hasher plugins, the name of an entry point is the hash format and its object a Hasher subclass
+hasher_plugin_entry_point_group = "ascmhl.hashers"
+
+
+class HasherRegistration:
+    """
+    HasherRegistration wraps a hash format that is known to ascmhl.
+
+    attribute member variables:
+    hash_format -- name of the format, e.g. 'xxh64'
+    hasher_class -- the Hasher subclass that generates the format
+    in_specification -- the format is defined by the ASC MHL specification and can be recorded in manifests,
+                        other formats are only used internally
+    """
+
+    hash_format: str
+    hasher_class: type
+    in_specification: bool
+
+    def __init__(self, hash_format: str, hasher_class: type, in_specification: bool):
+        self.hash_format = hash_format
+        self.hasher_class = hasher_class
+        self.in_specification = in_specification
+
+    @property
+    def throughput(self) -> Optional[float]:
+        return self.hasher_class.throughput
+
+    @cached_property
+    def digest_size(self) -> int:
+        """
+        the number of bytes of the raw digests of the format, e.g. to check digests that were cached
+        """
+        return len(self.hasher_class().digest())
+
+
+_hasher_registrations: Dict[str, HasherRegistration] = {}
+_hasher_plugins_loaded = False
+_hasher_plugins_lock = threading.Lock()
+
+
+def register_hasher(hash_format: str, hasher_class: type, in_specification: bool = False) -> None:
+    """
+    registers a Hasher subclass for a hash format
+
+    arguments:
+    hash_format -- name of the format, e.g. 'blake2b'
+    hasher_class -- the Hasher subclass that generates the format, its throughput attribute should be set
+    in_specification -- the format is defined by the ASC MHL specification, False for formats only used internally
+    """
+    if not isinstance(hasher_class, type) or not issubclass(hasher_class, Hasher):
+        raise TypeError(f"hasher for {hash_format} is not a Hasher subclass: {hasher_class}")
+    registration = _hasher_registrations.get(hash_format)
+    if registration is not None and registration.hasher_class is not hasher_class:
+        raise ValueError(f"hash format {hash_format} is already registered")
+    _hasher_registrations[hash_format] = HasherRegistration(hash_format, hasher_class, in_specification)
+
+
+def load_hasher_plugins() -> None:
+    """
+    registers the hashers of all installed plugins, plugins are only loaded once
+    """
+    global _hasher_plugins_loaded
+    with _hasher_plugins_lock:
+        if _hasher_plugins_loaded:
+            return
+        _hasher_plugins_loaded = True
+        for entry_point in entry_points(group=hasher_plugin_entry_point_group):
+            try:
+                register_hasher(entry_point.name, entry_point.load())
+            except Exception as error:
+                logger.error(f"ERROR: failed to load hash format plugin {entry_point.name}: {error}")
+
+
+def hasher_registration(hash_format: str) -> HasherRegistration:
+    """
+    returns the registration of a hash format, raises a KeyError for unknown formats
+
+    arguments:
+    hash_format -- string value, e.g. 'md5', 'xxh64'
+    """
+    registration = _hasher_registrations.get(hash_format)
+    if registration is None:
+        load_hasher_plugins()
+        registration = _hasher_registrations[hash_format]
+    return registration
+
+
+def registered_hash_formats(in_specification_only: bool = False) -> [str]:
+    """
+    returns the names of all registered hash formats, including the ones of plugins
+    """
+    load_hasher_plugins()
+    return [
+        hash_format
+        for hash_format, registration in _hasher_registrations.items()
+        if registration.in_specification or not in_specification_only
+    ]
+
+
+def fastest_hash_format(hash_formats: [str]) -> str:
+    """
+    returns the hash format with the highest throughput, the first one for formats with the same or unknown throughput
+
+    arguments:
+    hash_formats -- string values, each entry is one of the registered hash formats
+    """
+    return max(hash_formats, key=lambda hash_format: hasher_registration(hash_format).throughput or 0)
+
+
+# the formats of the specification, and internal formats e.g. for caches
+for _hash_type in HashType:
+    register_hasher(_hash_type.name, _hash_type.value, in_specification=True)
+register_hasher("sha256", SHA256)
+register_hasher("blake2b", BLAKE2B)
+
+
 class AggregateHasher:
     def __init__(self, hash_formats: [str]):
         # Build a hasher for each format
@@ -258,15 +730,33 @@ class AggregateHasher:
     Handles multiple hashing to facilitate a read-once create-many hashing paradigm
     """
 
+    # number of chunks each hashing thread may fall behind the reading thread
+    read_ahead_chunks = 4
+
     @classmethod
-    def hash_file(cls, file_path: str, hash_formats: [str]) -> Dict[str, str]:
+    def hash_file(
+        cls, file_path: str, hash_formats: [str], concurrent: Optional[bool] = None, read_options: ReadOptions = None
+    ) -> Dict[str, str]:
         """
         computes and returns new hash strings for a file
 
         arguments:
         file_path -- string value, path of file to generate hash for.
         hash_formats -- array string values, each entry should be one of the supported hash formats, e.g. 'md5', 'xxh64'
+        concurrent -- update each hasher in its own thread, None decides automatically (for multiple formats and files
+                      larger than one chunk)
+        read_options -- how the file is read, defaults to reading chunks of 1MB into reused buffers
+        """
+        return hash_strings_from_digests(cls.hash_file_digests(file_path, hash_formats, concurrent, read_options))
+
+    @classmethod
+    def hash_file_digests(
+        cls, file_path: str, hash_formats: [str], concurrent: Optional[bool] = None, read_options: ReadOptions = None
+    ) -> Dict[str, bytes]:
         """
+        computes and returns the raw digests for a file, see hash_file for the arguments
+        """
+        read_options = read_options or ReadOptions()
 
         # Build a hasher for each supplied format
         hasher_lookup = {}
@@ -275,23 +765,98 @@ class AggregateHasher:
             hasher_lookup[hash_format] = hasher
 
         # Open the file
-        with open(file_path, "rb") as fd:
-            # process files in chunks so that large files won't cause excessive memory consumption.
-            size = 1024 * 1024  # chunk size 1MB
-            chunk = fd.read(size)
-            while chunk:
-                # Update each stored hasher with the read chunk
-                for hash_format in hasher_lookup:
-                    hasher_lookup[hash_format].update(chunk)
-
-                chunk = fd.read(size)
+        with read_options.open_file(file_path) as (fd, size):
+            if concurrent is None:
+                concurrent = len(hasher_lookup) > 1 and os.fstat(fd.fileno()).st_size > size
+            if read_options.use_mmap:
+                cls._update_hashers_from_mapped_file(fd, size, hasher_lookup.values(), concurrent)
+            elif concurrent:
+                cls._update_hashers_concurrently(fd, size, hasher_lookup.values(), read_options)
+            else:
+                # process files in chunks so that large files won't cause excessive memory consumption.
+                for chunk in read_chunks(fd, size, read_options):
+                    # Update each stored hasher with the read chunk
+                    for hash_format in hasher_lookup:
+                        hasher_lookup[hash_format].update(chunk)
 
         # Get the digest from each hasher
-        hash_output_lookup = {}
+        digest_lookup = {}
         for hash_format in hasher_lookup:
-            hash_output_lookup[hash_format] = hasher_lookup[hash_format].string_digest()
+            digest_lookup[hash_format] = hasher_lookup[hash_format].digest()
 
-        return hash_output_lookup
+        return digest_lookup
+
+    @classmethod
+    def _update_hashers_concurrently(cls, fd, size, hashers, read_options: ReadOptions):
+        """
+        reads the file in the calling thread and updates each hasher in its own thread.
+        hashlib and xxhash release the GIL while hashing large buffers, so the hashers work on the same chunk at the
+        same time. chunks are read into a ring of reused buffers, a buffer is overwritten once all threads hashed it.
+        """
+        buffers = [read_options.allocate_buffer(size) for _ in range(cls.read_ahead_chunks)]
+        buffer_semaphores = [threading.Semaphore(0) for _ in buffers]
+        # number of threads that still need to hash the chunk in a buffer
+        pending_threads = [0] * len(buffers)
+        # file offset of the end of the chunk in a buffer
+        end_offsets = [0] * len(buffers)
+        chunk_queues = [queue.SimpleQueue() for _ in hashers]
+        threads = [
+            threading.Thread(
+                target=_update_hasher_from_queue, args=(hasher, chunk_queue, buffer_semaphores), daemon=True
+            )
+            for hasher, chunk_queue in zip(hashers, chunk_queues)
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            sequence_number = 0
+            offset = 0
+            while True:
+                index = sequence_number % len(buffers)
+                if pending_threads[index]:
+                    for _ in range(pending_threads[index]):
+                        buffer_semaphores[index].acquire()
+                    pending_threads[index] = 0
+                    # the threads hash the chunks in order, so everything up to this chunk has been hashed
+                    read_options.chunks_consumed(fd, end_offsets[index], size)
+                length = fd.readinto(buffers[index])
+                if not length:
+                    break
+                chunk = buffers[index][:length]
+                for chunk_queue in chunk_queues:
+                    chunk_queue.put((index, chunk))
+                pending_threads[index] = len(threads)
+                offset += length
+                end_offsets[index] = offset
+                sequence_number += 1
+        finally:
+            # tell the threads to stop, also if reading failed
+            for chunk_queue in chunk_queues:
+                chunk_queue.put(None)
+            for thread in threads:
+                thread.join()
+        read_options.chunks_consumed(fd, offset, size)
+
+    @classmethod
+    def _update_hashers_from_mapped_file(cls, fd, size, hashers, concurrent):
+        """
+        maps the file into memory, concurrent hashers each walk through the mapped file in their own thread
+        """
+        if not concurrent:
+            for chunk in read_mapped_chunks(fd, size):
+                for hasher in hashers:
+                    hasher.update(chunk)
+            return
+
+        # each thread needs its own file object, the mappings share the same pages of the page cache
+        threads = [
+            threading.Thread(target=_update_hasher_from_mapped_file, args=(hasher, fd.fileno(), size), daemon=True)
+            for hasher in hashers
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
 
     @classmethod
     def hash_data(cls, input_data: bytes, hash_formats: [str]) -> Dict[str, str]:
@@ -314,52 +879,145 @@ class AggregateHasher:
         return hash_output_lookup
 
 
+def _update_hasher_from_queue(hasher: Hasher, chunk_queue: queue.SimpleQueue, buffer_semaphores):
+    item = chunk_queue.get()
+    while item is not None:
+        index, chunk = item
+        hasher.update(chunk)
+        buffer_semaphores[index].release()
+        item = chunk_queue.get()
+
+
+def _update_hasher_from_mapped_file(hasher: Hasher, fileno: int, size: int):
+    with open(fileno, "rb", closefd=False) as fd:
+        for chunk in read_mapped_chunks(fd, size):
+            hasher.update(chunk)
+
+
+def read_chunks(fd, size: int, read_options: ReadOptions = None):
+    """
+    reads a file in chunks into one reused buffer instead of allocating a new bytes object for each chunk.
+    the yielded memoryview is only valid until the next chunk is read.
+
+    arguments:
+    fd -- file object opened in binary mode
+    size -- chunk size in bytes
+    read_options -- how the buffer is allocated and whether read pages are dropped from the page cache
+    """
+    read_options = read_options or ReadOptions()
+    offset = 0
+    with read_options.allocate_buffer(size) as buffer:
+        length = fd.readinto(buffer)
+        while length:
+            with buffer[:length] as chunk:
+                yield chunk
+            offset += length
+            read_options.chunks_consumed(fd, offset, size)
+            length = fd.readinto(buffer)
+
+
+def read_mapped_chunks(fd, size: int):
+    """
+    maps a file into memory and yields it in chunks without copying.
+    the yielded memoryview is only valid until the next chunk is requested.
+
+    arguments:
+    fd -- file object opened in binary mode
+    size -- chunk size in bytes
+    """
+    file_size = os.fstat(fd.fileno()).st_size
+    # empty files cannot be mapped
+    if file_size == 0:
+        return
+    with mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+        with memoryview(mapped_file) as view:
+            for offset in range(0, file_size, size):
+                with view[offset : offset + size] as chunk:
+                    yield chunk
+
+
 class DirectoryHashContext:
     """
     DirectoryHashContext wraps the data necessary to compute directory checksums.
+
+    the context works on the raw digests of the children, hash strings are only decoded and encoded by the
+    string based methods. one hasher is reused for all structure hashes of the children.
     """
 
     def __init__(self, hash_format: str):
         self.hash_format = hash_format
         self.hasher = new_hasher_for_hash_type(hash_format)
-        self.content_hash_strings = []
-        self.structure_hash_strings = []
+        self.content_digests = []
+        self.structure_digests = []
 
     def append_file_hash(self, path: str, content_hash_string: str):
         """
         append child file data to this directory context.
         """
-        self.content_hash_strings.append(content_hash_string)
+        self.append_file_digest(path, self.hasher.bytes_from_string_digest(content_hash_string))
 
-        # structure hashes are computed from lists of children name+hash strings
-        path_bytes = os.path.basename(os.path.normpath(path)).encode("utf8")
-        hash_bytes = self.hasher.bytes_from_string_digest(content_hash_string)
-        structure_hash = self.hasher.hash_data(path_bytes + hash_bytes)
-        self.structure_hash_strings.append(structure_hash)
+    def append_file_digest(self, path: str, content_digest: bytes):
+        """
+        append child file data to this directory context.
+        """
+        self.content_digests.append(content_digest)
+        self.structure_digests.append(self._structure_digest(path, content_digest))
 
     def append_directory_hashes(self, path: str, content_hash_string: str, structure_hash_string: str):
         """
         append child directory data to this directory context.
         """
-        self.content_hash_strings.append(content_hash_string)
+        self.append_directory_digests(
+            path,
+            self.hasher.bytes_from_string_digest(content_hash_string),
+            self.hasher.bytes_from_string_digest(structure_hash_string),
+        )
 
-        # structure hashes are computed from lists of children name+hash strings
-        path_bytes = os.path.basename(os.path.normpath(path)).encode("utf8")
-        hash_bytes = self.hasher.bytes_from_string_digest(structure_hash_string)
-        structure_hash = self.hasher.hash_data(path_bytes + hash_bytes)
-        self.structure_hash_strings.append(structure_hash)
+    def append_directory_digests(self, path: str, content_digest: bytes, structure_digest: bytes):
+        """
+        append child directory data to this directory context.
+        """
+        self.content_digests.append(content_digest)
+        self.structure_digests.append(self._structure_digest(path, structure_digest))
+
+    def final_content_digest(self) -> bytes:
+        """
+        compute and return the content digest of this directory context by hashing the child content digests.
+        """
+        return self._digest_of_digest_list(self.content_digests)
+
+    def final_structure_digest(self) -> bytes:
+        """
+        compute and return the structure digest of this directory context by hashing the child structure digests.
+        """
+        return self._digest_of_digest_list(self.structure_digests)
 
     def final_content_hash_str(self):
         """
         compute and return the content hash of this directory context by hashing the child content hash list.
         """
-        return self.hasher.hash_of_hash_list(self.content_hash_strings)
+        return self.hasher.string_digest_from_bytes(self.final_content_digest())
 
     def final_structure_hash_str(self):
         """
         compute and return the structure hash of this directory context by hashing the child structure hash list.
         """
-        return self.hasher.hash_of_hash_list(self.structure_hash_strings)
+        return self.hasher.string_digest_from_bytes(self.final_structure_digest())
+
+    def _structure_digest(self, path: str, digest: bytes) -> bytes:
+        # structure hashes are computed from lists of children name+hash
+        path_bytes = os.path.basename(os.path.normpath(path)).encode("utf8")
+        self.hasher.reset()
+        self.hasher.update(path_bytes)
+        self.hasher.update(digest)
+        return self.hasher.digest()
+
+    def _digest_of_digest_list(self, digests: [bytes]) -> bytes:
+        # the hash strings of a format have a fixed length and an alphabet in ascending ASCII order, so sorting the
+        # digests gives the same order as sorting the hash strings lexicographically
+        self.hasher.reset()
+        self.hasher.update(b"".join(sorted(digests)))
+        return self.hasher.digest()
 
 
 def new_hasher_for_hash_type(hash_format: str) -> Hasher:
@@ -367,15 +1025,13 @@ def new_hasher_for_hash_type(hash_format: str) -> Hasher:
     creates a new instance of the appropriate Hasher class based on the hash_format argument
 
     arguments:
-    hash_format -- string value, one of the supported hash formats, e.g. 'md5', 'xxh64'
+    hash_format -- string value, one of the registered hash formats, e.g. 'md5', 'xxh64'
     """
     if not hash_format:
         raise ValueError
-    hash_type = HashType[hash_format]
-    if not hash_type:
-        raise ValueError
 
-    return hash_type.value()  # instantiate and return a new Hasher of the specified HashType
+    # instantiate and return a new Hasher of the registered class
+    return hasher_registration(hash_format).hasher_class()
 
 
 def hash_of_hash_list(hash_list: [str], hash_format: str) -> str:
@@ -390,27 +1046,125 @@ def hash_of_hash_list(hash_list: [str], hash_format: str) -> str:
     return hasher.hash_of_hash_list(hash_list)
 
 
-def multiple_format_hash_file(file_path: str, hash_formats: [str]) -> Dict[str, str]:
+def multiple_format_hash_file(
+    file_path: str, hash_formats: [str], concurrent: Optional[bool] = None, read_options: ReadOptions = None
+) -> Dict[str, str]:
     """
     computes and returns a new hash strings for a file
 
     arguments:
     file_path -- string value, path of file to generate hash for.
     hash_formats -- string values, each entry is one of the supported hash formats, e.g. 'md5', 'xxh64'
+    concurrent -- update each hasher in its own thread, None decides automatically
+    read_options -- how the file is read, see ReadOptions
+    """
+    return AggregateHasher.hash_file(file_path, hash_formats, concurrent, read_options)
+
+
+def multiple_format_hash_file_digests(
+    file_path: str, hash_formats: [str], concurrent: Optional[bool] = None, read_options: ReadOptions = None
+) -> Dict[str, bytes]:
+    """
+    computes and returns the raw digests for a file, see multiple_format_hash_file for the arguments
+    """
+    return AggregateHasher.hash_file_digests(file_path, hash_formats, concurrent, read_options)
+
+
+def multiple_format_hash_small_files(
+    files: [Tuple[str, int, List[str]]], drop_from_page_cache: bool = False
+) -> List[Dict[str, bytes]]:
+    """
+    computes and returns the raw digests for a batch of small files
+
+    each file is read with a single read call and hashed in one go, without chunking and without Hasher objects.
+
+    arguments:
+    files -- (file path, file size, hash formats) tuples, the file size is the expected size of the file
+    drop_from_page_cache -- drop the read data from the page cache
+    """
+    digest_functions = {}
+    results = []
+    for file_path, file_size, hash_formats in files:
+        file_descriptor = os.open(file_path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+        try:
+            # asking for one byte more detects files that have grown since their size was determined
+            data = os.read(file_descriptor, file_size + 1)
+            if len(data) > file_size:
+                chunks = [data]
+                while chunk := os.read(file_descriptor, ReadOptions.default_chunk_size):
+                    chunks.append(chunk)
+                data = b"".join(chunks)
+            if drop_from_page_cache and hasattr(os, "posix_fadvise"):
+                try:
+                    os.posix_fadvise(file_descriptor, 0, 0, os.POSIX_FADV_DONTNEED)
+                except OSError:
+                    # the advice is only a hint, the file has been read already
+                    pass
+        finally:
+            os.close(file_descriptor)
+
+        digest_lookup = {}
+        for hash_format in hash_formats:
+            digest_function = digest_functions.get(hash_format)
+            if digest_function is None:
+                digest_function = _digest_function(hasher_registration(hash_format).hasher_class)
+                digest_functions[hash_format] = digest_function
+            digest_lookup[hash_format] = digest_function(data)
+        results.append(digest_lookup)
+    return results
+
+
+def _digest_function(hasher_class):
+    # the wrapped hasher type can be used directly, unless the Hasher subclass changes how data is hashed
+    if hasher_class.update is Hasher.update and hasher_class.digest is Hasher.digest:
+        hashlib_type = hasher_class.hashlib_type()
+        return lambda data: hashlib_type(data).digest()
+
+    def digest_function(data):
+        hasher = hasher_class()
+        hasher.update(data)
+        return hasher.digest()
+
+    return digest_function
+
+
+def hash_strings_from_digests(digest_lookup: Dict[str, bytes]) -> Dict[str, str]:
+    """
+    encodes raw digests to hash strings
+
+    arguments:
+    digest_lookup -- dictionary of raw digests keyed by the respective hash format
+    """
+    return {
+        hash_format: hasher_registration(hash_format).hasher_class.string_digest_from_bytes(digest)
+        for hash_format, digest in digest_lookup.items()
+    }
+
+
+def digests_from_hash_strings(hash_lookup: Dict[str, str]) -> Dict[str, bytes]:
+    """
+    decodes hash strings to raw digests, the inverse of hash_strings_from_digests
+
+    arguments:
+    hash_lookup -- dictionary of hash strings keyed by the respective hash format
     """
-    return AggregateHasher.hash_file(file_path, hash_formats)
+    return {
+        hash_format: hasher_registration(hash_format).hasher_class.bytes_from_string_digest(hash_string)
+        for hash_format, hash_string in hash_lookup.items()
+    }
 
 
-def hash_file(filepath: str, hash_format: str) -> str:
+def hash_file(filepath: str, hash_format: str, read_options: ReadOptions = None) -> str:
     """
     computes and returns a new hash string for a file
 
     arguments:
     filepath -- string value, path of file to generate hash for.
     hash_format -- string value, one of the supported hash formats, e.g. 'md5', 'xxh64'
+    read_options -- how the file is read, see ReadOptions
     """
     hasher = new_hasher_for_hash_type(hash_format)
-    return hasher.hash_file(filepath)
+    return hasher.hash_file(filepath, read_options)
 
 
 def hash_data(input_data: bytes, hash_format: str) -> str:
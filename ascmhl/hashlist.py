@@ -15,7 +15,7 @@ import os
 from . import logger
 from .ignore import MHLIgnoreSpec
 from .__version__ import ascmhl_reference_hash_format
-from .hasher import hash_file
+from . import manifest_cache
 
 
 class MHLHashList:
@@ -97,7 +97,7 @@ class MHLHashList:
         return os.path.dirname(os.path.dirname(self.file_path))
 
     def generate_reference_hash(self):
-        return hash_file(self.file_path, ascmhl_reference_hash_format)
+        return manifest_cache.shared_manifest_cache.hash_file(self.file_path, ascmhl_reference_hash_format)
 
     # build
     def append_hash(self, media_hash: MHLMediaHash):
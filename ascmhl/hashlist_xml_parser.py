@@ -9,13 +9,15 @@ __email__ = "opensource@pomfort.com"
 
 import os
 import textwrap
+from typing import Tuple
 from timeit import default_timer as timer
 import dateutil.parser
 
 from lxml import etree
 from lxml.builder import E
 
-from . import logger
+from . import errors, logger
+from .hasher import ReadOptions, new_hasher_for_hash_type
 from .hashlist import *
 from .utils import datetime_isostring
 from .__version__ import ascmhl_supported_hashformats
@@ -38,17 +40,71 @@ def parse(file_path):
 
     start = timer()
 
+    # use iterparse to prevent large memory usage when parsing large files
+    # pass a file handle to iterparse instead of the path directly to support the fake filesystem used in the tests
+    with open(file_path, "rb") as file:
+        hash_list = _parse_events(file_path, etree.iterparse(file, events=("start", "end")))
+    logger.debug(f"parsing took: {timer() - start}")
+
+    return hash_list
+
+
+def parse_and_hash(
+    file_path, hash_format: str, expected_hash_string: str = None
+) -> Tuple[MHLHashList, str, os.stat_result]:
+    """parsing the MHL XML file like parse() while hashing it, the file is read only once
+
+    the chunks read from the file are fed to the hasher and to an incremental parser. returns the hash list, the
+    hash string of the file and the stat result of the file from before it was read (e.g. for the manifest cache).
+
+    if expected_hash_string is given and the file has a different hash, ModifiedMHLManifestFileException is raised,
+    also if the modified file can't be parsed any more."""
+    logger.debug(f"parsing and hashing {file_path}...")
+
+    start = timer()
+
+    hasher = new_hasher_for_hash_type(hash_format)
+    with open(file_path, "rb") as file:
+        file_stat = os.fstat(file.fileno())
+        try:
+            hash_list = _parse_events(file_path, _hashed_pull_events(file, hasher))
+        except Exception:
+            # hash the rest of the file, a modified manifest is reported as such and not as a broken file (which
+            # might also be well-formed XML with invalid values)
+            for chunk in iter(lambda: file.read(ReadOptions.default_chunk_size), b""):
+                hasher.update(chunk)
+            if expected_hash_string is not None and hasher.string_digest() != expected_hash_string:
+                raise errors.ModifiedMHLManifestFileException(file_path)
+            raise
+    hash_string = hasher.string_digest()
+    if expected_hash_string is not None and hash_string != expected_hash_string:
+        raise errors.ModifiedMHLManifestFileException(file_path)
+    logger.debug(f"parsing and hashing took: {timer() - start}")
+
+    return hash_list, hash_string, file_stat
+
+
+def _hashed_pull_events(file, hasher):
+    """yields the parser events of a file like iterparse, every chunk is hashed before it is parsed"""
+    parser = etree.XMLPullParser(events=("start", "end"))
+    for chunk in iter(lambda: file.read(ReadOptions.default_chunk_size), b""):
+        hasher.update(chunk)
+        parser.feed(chunk)
+        yield from parser.read_events()
+    parser.close()
+    yield from parser.read_events()
+
+
+def _parse_events(file_path, events) -> MHLHashList:
+    """building the MHLHashList from the start and end events of the elements of an MHL XML file"""
     hash_list = MHLHashList()
     hash_list.file_path = file_path
     object_stack = []
     current_object = None
     is_directory_structure = False
 
-    # use iterparse to prevent large memory usage when parsing large files
-    # pass a file handle to iterparse instead of the path directly to support the fake filesystem used in the tests
-    file = open(file_path, "rb")
     existing_ignore_patterns = []
-    for event, element in etree.iterparse(file, events=("start", "end")):
+    for event, element in events:
         # check if we need to create a new container
         if event == "start":
             # the tag might contain the namespace like {urn:ASC:MHL:v2.0}hash, so we need to strip the namespace part
@@ -207,8 +263,6 @@ def parse(file_path):
                     del element.getparent()[0]
 
     hash_list.process_info.ignore_spec = MHLIgnoreSpec(existing_ignore_patterns)
-    logger.debug(f"parsing took: {timer() - start}")
-    file.close()
 
     return hash_list
 
@@ -12,8 +12,16 @@ import os
 import re
 from datetime import datetime, date, time
 
-from . import hasher
-from .__version__ import ascmhl_folder_name, ascmhl_file_extension, ascmhl_chainfile_name, ascmhl_collectionfile_name
+from . import manifest_cache
+from .manifest_loader import MHLManifestLoader
+from .__version__ import (
+    ascmhl_folder_name,
+    ascmhl_file_extension,
+    ascmhl_chainfile_name,
+    ascmhl_collectionfile_name,
+    ascmhl_journalfile_name,
+    ascmhl_hashcachefile_name,
+)
 from . import hashlist_xml_parser, chain_xml_parser
 from .utils import datetime_now_filename_string
 from typing import Tuple, List, Dict, Optional, Set
@@ -63,9 +71,22 @@ class MHLHistory:
         self.child_history_mappings = {}
         self.parent_history = None
         self.asc_mhl_path = None
+        # index of the records of all generations by path, built with the first query
+        self._path_index = None
+        # paths and generation numbers of the manifests that are found but not loaded yet
+        self._manifest_generation_numbers: List[Tuple[str, int]] = []
 
     def append_hash_list(self, hash_list):
         self.hash_lists.append(hash_list)
+        if self._path_index is not None:
+            self._path_index.add_hash_list(hash_list, len(self.hash_lists) - 1)
+
+    def _get_path_index(self) -> _MHLPathIndex:
+        if self._path_index is None:
+            self._path_index = _MHLPathIndex()
+            for position, hash_list in enumerate(self.hash_lists):
+                self._path_index.add_hash_list(hash_list, position)
+        return self._path_index
 
     def get_root_path(self):
         if not self.asc_mhl_path:
@@ -105,14 +126,8 @@ class MHLHistory:
         starts with the first generation, if we don't find it there we continue to look in all other generations
         until we've found the first appearance of the give file.
         """
-        for hash_list in self.hash_lists:
-            media_hash = hash_list.find_media_hash_for_path(relative_path)
-            if media_hash is None:
-                continue
-            for hash_entry in media_hash.hash_entries:
-                if hash_entry.action == "original":
-                    return hash_entry
-        return None
+        path_record = self._get_path_index().records.get(relative_path)
+        return path_record.original_hash_entry if path_record is not None else None
 
     # methods to query and compare hashes
     def find_directory_hash_entries_for_path(self, relative_path: str) -> List[MHLHashEntry]:
@@ -122,15 +137,9 @@ class MHLHistory:
         and collects all directory hashes found for the given folder.
         """
         directory_hash_entries = []
-        for hash_list in self.hash_lists:
-            media_hash = hash_list.find_media_hash_for_path(relative_path)
-            if media_hash is None:
-                continue
-            if media_hash.is_directory:
-                for hash_entry in media_hash.hash_entries:
-                    # FIXME is there a better way of accessing the generation from a hash entry?
-                    hash_entry.temp_generation_number = hash_list.generation_number
-                directory_hash_entries = directory_hash_entries + media_hash.hash_entries
+        path_record = self._get_path_index().records.get(relative_path)
+        if path_record is not None:
+            directory_hash_entries = list(path_record.directory_hash_entries)
 
         # also search the root directory hashes from all child histories
         if relative_path == ".":
@@ -150,28 +159,28 @@ class MHLHistory:
         starts with the first generation, if we don't find it there we continue to look in all other generations
         until we've found the first appearance of the give file.
         """
-        for hash_list in self.hash_lists:
-            media_hash = hash_list.find_media_hash_for_path(relative_path)
-            if media_hash is None:
-                continue
-            for hash_entry in media_hash.hash_entries:
-                if hash_format is not None and hash_entry.hash_format == hash_format:
-                    return hash_entry
-                elif hash_format is None:
-                    return hash_entry
-        return None
+        path_record = self._get_path_index().records.get(relative_path)
+        if path_record is None:
+            return None
+        if hash_format is None:
+            return path_record.first_hash_entry
+        return path_record.first_hash_entry_by_format.get(hash_format)
 
     def find_existing_hash_formats_for_path(self, relative_path: str) -> List[str]:
         """Searches through the history to find all existing hash formats we might want to compare against"""
-        hash_formats = []
-        for hash_list in self.hash_lists:
-            media_hash = hash_list.find_media_hash_for_path(relative_path)
-            if media_hash is None:
-                continue
-            for hash_entry in media_hash.hash_entries:
-                if hash_entry.hash_format not in hash_formats:
-                    hash_formats.append(hash_entry.hash_format)
-        return hash_formats
+        path_record = self._get_path_index().records.get(relative_path)
+        if path_record is None:
+            return []
+        # the formats in the order of their first appearance
+        return list(path_record.first_hash_entry_by_format.keys())
+
+    def find_previous_path_for_path(self, relative_path: str) -> str:
+        """Follows the renames recorded for a path through the generations
+
+        starts with the first generation, whenever a generation records the path as renamed, the search continues
+        in the following generations with the previous path. returns the path itself if it was never renamed.
+        """
+        return self._get_path_index().previous_path(relative_path)
 
     # def handling of child histories
     def find_history_for_path(self, relative_path: str) -> Tuple[MHLHistory, str]:
@@ -217,8 +226,24 @@ class MHLHistory:
     # loading history and child histories from path
 
     @classmethod
-    def load_from_path(cls, root_path):
-        """finds all MHL files in the asc-mhl folder, returns the mhl_history instance with all mhl_hashlists"""
+    def load_from_path(cls, root_path, jobs: int = None):
+        """finds all MHL files in the asc-mhl folder, returns the mhl_history instance with all mhl_hashlists
+
+        the manifests of the history and of all child histories are found first, so they can be parsed in parallel
+        by a MHLManifestLoader while the hash lists are added to the histories in order. jobs is the maximum number
+        of worker processes for parsing, by default the number of CPUs"""
+
+        with MHLManifestLoader(jobs) as manifest_loader:
+            history = cls._find_history_at_path(root_path, manifest_loader)
+            manifest_loader.start()
+            history._load_hash_lists(manifest_loader)
+
+        return history
+
+    @classmethod
+    def _find_history_at_path(cls, root_path, manifest_loader: MHLManifestLoader):
+        """returns the mhl_history instance with its chain and child histories, the manifests are added to the
+        manifest loader and not loaded yet"""
 
         asc_mhl_folder_path = os.path.join(root_path, ascmhl_folder_name)
         history = cls()
@@ -226,19 +251,18 @@ class MHLHistory:
 
         file_path = os.path.join(asc_mhl_folder_path, ascmhl_chainfile_name)
         if os.path.exists(asc_mhl_folder_path) and not os.path.exists(file_path):
-            raise errors.NoMHLChainException(file_path)
+            # the journal of an interrupted first create run and the hash cache may exist without a chain
+            if set(os.listdir(asc_mhl_folder_path)) - {ascmhl_journalfile_name, ascmhl_hashcachefile_name}:
+                raise errors.NoMHLChainException(file_path)
         history.chain = chain_xml_parser.parse(file_path)
-        if history.chain.generations:
-            for generation in history.chain.generations:
-                expected_file = os.path.join(asc_mhl_folder_path, generation.ascmhl_filename)
-                if os.path.exists(expected_file):
-                    hash = hasher.hash_file(expected_file, generation.hash_format)
-                    if hash != generation.hash_string:
-                        raise errors.ModifiedMHLManifestFileException(expected_file)
-                else:
-                    raise errors.MissingMHLManifestException(expected_file)
+        # the manifests of the generations in the chain are checked against their hashes while they are parsed
+        unchecked_generations = {}
+        for generation in history.chain.generations:
+            expected_file = os.path.join(asc_mhl_folder_path, generation.ascmhl_filename)
+            if not os.path.exists(expected_file):
+                raise errors.MissingMHLManifestException(expected_file)
+            unchecked_generations[os.path.normpath(expected_file)] = generation
 
-        hash_lists = []
         for root, directories, filenames in os.walk(asc_mhl_folder_path):
             for filename in filenames:
                 # file name example: 0001_root_2020-01-15_130000.mhl
@@ -249,24 +273,43 @@ class MHLHistory:
                 parts = re.findall(MHLHistory.history_file_name_regex, filename_no_extension)
                 if len(parts) == 1 and len(parts[0]) == 2:
                     file_path = os.path.join(asc_mhl_folder_path, filename)
-                    hash_list = hashlist_xml_parser.parse(file_path)
-                    generation_number = int(parts[0][0])
-                    hash_list.generation_number = generation_number
-                    # FIXME is there a better way of accessing the generation from a hash entry?
-                    if hash_list.process_info.root_media_hash is not None:
-                        for hash_entry in hash_list.process_info.root_media_hash.hash_entries:
-                            hash_entry.temp_generation_number = hash_list.generation_number
-                    hash_lists.append(hash_list)
+                    generation = unchecked_generations.pop(os.path.normpath(file_path), None)
+                    manifest_loader.add(file_path, generation)
+                    history._manifest_generation_numbers.append((file_path, int(parts[0][0])))
                 else:
                     logger.error(f"name of ascmhl file {filename} does not conform to naming convention")
+        # manifests that are not parsed (e.g. because of their name) are still checked
+        for expected_file, generation in unchecked_generations.items():
+            if manifest_cache.shared_manifest_cache.hash_file(expected_file, generation.hash_format) != (
+                generation.hash_string
+            ):
+                raise errors.ModifiedMHLManifestFileException(expected_file)
+
+        history._find_child_histories(manifest_loader)
+
+        return history
+
+    def _load_hash_lists(self, manifest_loader: MHLManifestLoader) -> None:
+        """takes the parsed manifests of the history and of all child histories from the manifest loader"""
+        hash_lists = []
+        for file_path, generation_number in self._manifest_generation_numbers:
+            hash_list = manifest_loader.hash_list(file_path)
+            hash_list.generation_number = generation_number
+            # FIXME is there a better way of accessing the generation from a hash entry?
+            if hash_list.process_info.root_media_hash is not None:
+                for hash_entry in hash_list.process_info.root_media_hash.hash_entries:
+                    hash_entry.temp_generation_number = hash_list.generation_number
+            hash_lists.append(hash_list)
+        self._manifest_generation_numbers = []
+
         # sort all found hash lists by generation number first to make sure we add them to the history in order
         hash_lists.sort(key=lambda x: x.generation_number)
         for hash_list in hash_lists:
-            history.append_hash_list(hash_list)
-
-        history._find_and_load_child_histories()
+            self.append_hash_list(hash_list)
 
-        return history
+        for child_history in self.child_histories:
+            child_history._load_hash_lists(manifest_loader)
+        self._resolve_hash_list_references()
 
     @classmethod
     def load_from_packing_list_path(cls, packing_list_path, root_path):
@@ -307,21 +350,20 @@ class MHLHistory:
 
         return history
 
-    def _find_and_load_child_histories(self) -> None:
+    def _find_child_histories(self, manifest_loader: MHLManifestLoader) -> None:
         """traverses the whole file system tree inside the history to find all sub histories"""
         history_root = self.get_root_path()
         for root, directories, _ in os.walk(history_root):
             if root != history_root and ascmhl_folder_name in directories:
-                # we parse the mhl folder and clear the directories so we are not going deeper
+                # we find the mhl folder and clear the directories so we are not going deeper
                 # everything beneath is handled by the child history
-                child_history = MHLHistory.load_from_path(root)
+                child_history = MHLHistory._find_history_at_path(root, manifest_loader)
                 child_history.parent_history = self
                 self.append_child_history(child_history)
                 directories.clear()
 
         # update parent children mapping with the found children
         self._update_child_history_mapping()
-        self._resolve_hash_list_references()
 
     def _update_child_history_mapping(self) -> None:
         self.child_history_mappings = {}
@@ -412,3 +454,70 @@ class MHLHistory:
         for hash_list in self.hash_lists:
             logger.info("")
             hash_list.log()
+
+
+class _MHLPathRecord:
+    """
+    the records of one path in all generations of a history, see _MHLPathIndex
+    """
+
+    __slots__ = ["original_hash_entry", "first_hash_entry", "first_hash_entry_by_format", "directory_hash_entries"]
+
+    def __init__(self):
+        self.original_hash_entry = None
+        self.first_hash_entry = None
+        # the dictionary keeps the order in which the formats appear
+        self.first_hash_entry_by_format = {}
+        self.directory_hash_entries = []
+
+
+class _MHLPathIndex:
+    """
+    index of the records of all generations of a history by path, so queries for a path don't need to look at
+    every generation. hash lists are added in the order of their generations.
+
+    a path is indexed with the same media hashes a hash list finds for it (find_media_hash_for_path), which includes
+    the previous paths of renamed files.
+    """
+
+    def __init__(self):
+        self.records: Dict[str, _MHLPathRecord] = {}
+        # positions of the hash lists that record a path as renamed, with the previous path, keyed by path
+        self.renames: Dict[str, List[Tuple[int, str]]] = {}
+
+    def add_hash_list(self, hash_list: MHLHashList, position: int):
+        for relative_path, media_hash in hash_list.media_hashes_path_map.items():
+            path_record = self.records.get(relative_path)
+            if path_record is None:
+                path_record = self.records[relative_path] = _MHLPathRecord()
+            for hash_entry in media_hash.hash_entries:
+                if path_record.original_hash_entry is None and hash_entry.action == "original":
+                    path_record.original_hash_entry = hash_entry
+                if path_record.first_hash_entry is None:
+                    path_record.first_hash_entry = hash_entry
+                path_record.first_hash_entry_by_format.setdefault(hash_entry.hash_format, hash_entry)
+            if media_hash.is_directory:
+                for hash_entry in media_hash.hash_entries:
+                    # FIXME is there a better way of accessing the generation from a hash entry?
+                    hash_entry.temp_generation_number = hash_list.generation_number
+                path_record.directory_hash_entries.extend(media_hash.hash_entries)
+
+        seen_paths = set()
+        for media_hash in hash_list.media_hashes:
+            # only the first media hash of a path in a hash list counts
+            if media_hash.path in seen_paths:
+                continue
+            seen_paths.add(media_hash.path)
+            if media_hash.previous_path:
+                self.renames.setdefault(media_hash.path, []).append((position, media_hash.previous_path))
+
+    def previous_path(self, relative_path: str) -> str:
+        position = 0
+        while True:
+            rename = next(
+                (rename for rename in self.renames.get(relative_path, []) if rename[0] >= position),
+                None,
+            )
+            if rename is None:
+                return relative_path
+            position, relative_path = rename[0] + 1, rename[1]
@@ -8,6 +8,7 @@ __email__ = "opensource@jonwaggoner.com"
 """
 
 import pathspec
+from typing import Optional
 from . import logger
 
 
@@ -22,6 +23,10 @@ class MHLIgnoreSpec:
 
     def __init__(self, existing_pattern_list=None, new_pattern_list=None, new_pattern_file=None):
         self._ignore_list = []
+        self._ignore_set = set()
+        # compiled when first used, reset when the patterns change
+        self._path_spec = None
+        self._matcher = None
         self.set_patterns(existing_pattern_list, new_pattern_list, new_pattern_file)
 
     def set_patterns(self, existing_pattern_list=None, new_pattern_list=None, new_pattern_file=None):
@@ -33,6 +38,9 @@ class MHLIgnoreSpec:
         no duplicates will be added.
         """
         self._ignore_list = []
+        self._ignore_set = set()
+        self._path_spec = None
+        self._matcher = None
         if existing_pattern_list:
             self._append_patterns_list(existing_pattern_list)
         else:
@@ -47,7 +55,18 @@ class MHLIgnoreSpec:
         get_path_spec will return a pathspec.PathSpec instance filled with the contents of self.ignore_list
         the returned pathspec.PathSpec instance can be used to match against filepaths.
         """
-        return pathspec.PathSpec.from_lines("gitwildmatch", iter(self._ignore_list))
+        if self._path_spec is None:
+            self._path_spec = pathspec.PathSpec.from_lines("gitwildmatch", iter(self._ignore_list))
+        return self._path_spec
+
+    def get_matcher(self):
+        """
+        get_matcher will return a MHLIgnoreMatcher for the contents of self.ignore_list, for matching paths relative
+        to the root of a history.
+        """
+        if self._matcher is None:
+            self._matcher = MHLIgnoreMatcher(self._ignore_list)
+        return self._matcher
 
     def get_pattern_list(self):
         return self._ignore_list.copy()
@@ -58,7 +77,12 @@ class MHLIgnoreSpec:
         duplicates are ignored.
         """
         if patterns_to_append:
-            self._ignore_list.extend(line for line in patterns_to_append if line not in self._ignore_list)
+            for line in patterns_to_append:
+                if line not in self._ignore_set:
+                    self._ignore_set.add(line)
+                    self._ignore_list.append(line)
+            self._path_spec = None
+            self._matcher = None
 
     def _append_patterns_from_file(self, filepath):
         """
@@ -77,3 +101,86 @@ class MHLIgnoreSpec:
     # For call to str().
     def __str__(self):
         return str(self._ignore_list)
+
+
+class MHLIgnoreMatcher:
+    """
+    MHLIgnoreMatcher matches paths relative to the root of a history against ignore patterns.
+
+    literal patterns (without wildcards) are looked up in sets, names (e.g. ".DS_Store", "ascmhl") per path
+    component and anchored paths (e.g. "/Clips/cache" or "Clips/cache") per leading path, only the remaining patterns
+    are matched with a pathspec.PathSpec. with negated patterns ("!pattern") the order of the patterns matters, then
+    all patterns are matched with the pathspec.PathSpec.
+    directories are matched with is_dir, so patterns with a trailing "/" match the directory itself, not only the
+    paths in it.
+    """
+
+    def __init__(self, patterns):
+        self._names = set()
+        self._directory_names = set()
+        self._paths = set()
+        self._directory_paths = set()
+        other_patterns = []
+        if any(pattern.startswith("!") for pattern in patterns):
+            other_patterns = list(patterns)
+        else:
+            for pattern in patterns:
+                literal_path = _literal_path(pattern)
+                if literal_path is None:
+                    other_patterns.append(pattern)
+                    continue
+                is_directory = pattern.endswith("/")
+                if "/" in literal_path or pattern.startswith("/"):
+                    (self._directory_paths if is_directory else self._paths).add(literal_path)
+                else:
+                    (self._directory_names if is_directory else self._names).add(literal_path)
+        self._path_spec = None
+        if other_patterns:
+            self._path_spec = pathspec.PathSpec.from_lines("gitwildmatch", other_patterns)
+
+    def match(self, relative_path: str, is_dir: bool = False) -> bool:
+        """
+        returns whether a path relative to the root of the history (with "/" as separator) is ignored, either
+        itself or because one of its parent directories is ignored
+        """
+        components = relative_path.split("/")
+        last_index = len(components) - 1
+        path = None
+        for index, name in enumerate(components):
+            is_directory = index < last_index or is_dir
+            if name in self._names or (is_directory and name in self._directory_names):
+                return True
+            path = name if path is None else path + "/" + name
+            if path in self._paths or (is_directory and path in self._directory_paths):
+                return True
+        return self._path_spec is not None and self._path_spec.match_file(
+            relative_path + "/" if is_dir else relative_path
+        )
+
+    def match_child(self, parent_relative_path: str, name: str, is_dir: bool = False) -> bool:
+        """
+        returns whether the child of a directory that isn't ignored is ignored, as while traversing a directory
+        hierarchy. the parent directory is "." for the root of the history.
+        """
+        if name in self._names or (is_dir and name in self._directory_names):
+            return True
+        relative_path = name if parent_relative_path == "." else parent_relative_path + "/" + name
+        if relative_path in self._paths or (is_dir and relative_path in self._directory_paths):
+            return True
+        return self._path_spec is not None and self._path_spec.match_file(
+            relative_path + "/" if is_dir else relative_path
+        )
+
+
+def _literal_path(pattern: str) -> Optional[str]:
+    # returns the path a pattern matches literally (without leading and trailing "/"), or None if the pattern
+    # contains wildcards, escapes or other syntax that needs the full pattern matching
+    if not pattern or pattern.startswith(("#", "!")) or pattern != pattern.rstrip():
+        return None
+    if any(character in pattern for character in "*?[\\"):
+        return None
+    literal_path = pattern.strip("/")
+    components = literal_path.split("/")
+    if any(component in ("", ".", "..") for component in components):
+        return None
+    return literal_path
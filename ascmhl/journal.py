@@ -0,0 +1,112 @@
+"""
+__author__ = "Patrick Renner, Alexander Sahm"
+__copyright__ = "Copyright 2024, Pomfort GmbH"
+
+__license__ = "MIT"
+__maintainer__ = "Patrick Renner, Alexander Sahm"
+__email__ = "opensource@pomfort.com"
+"""
+
+import json
+import os
+from typing import Dict, NamedTuple, Optional
+
+from . import logger
+from .__version__ import ascmhl_journalfile_name
+
+# version of the journal format, journals with a different version are not replayed
+journal_format_version = 1
+
+
+class JournalEntry(NamedTuple):
+    size: int
+    mtime_ns: int
+    hash_lookup: Dict[str, str]
+
+
+class MHLCreationJournal:
+    """
+    class for recording the progress of a create command, so an interrupted run can be resumed
+
+    the journal is a file in the ascmhl folder of the root history with one JSON object per line. the first line
+    describes the run (hash formats and the generation the run is based on), every following line records the
+    hashes, size and modification time of one completed file. lines are flushed as soon as they are written, so
+    a journal of a killed process contains all files up to the last one that was completed.
+
+    the journal is removed when the new generation has been written, the file of a failed run is closed and kept.
+    """
+
+    def __init__(self, asc_mhl_path: str, hash_formats: [str], generation_number: int):
+        self.file_path = os.path.join(asc_mhl_path, ascmhl_journalfile_name)
+        self.hash_formats = sorted(hash_formats)
+        self.generation_number = generation_number
+        self.file = None
+
+    def _header(self) -> dict:
+        return {
+            "journal": journal_format_version,
+            "hash_formats": self.hash_formats,
+            "generation": self.generation_number,
+        }
+
+    def load_entries(self) -> Dict[str, JournalEntry]:
+        """
+        reads the entries of an existing journal, keyed by the path relative to the root folder
+
+        returns an empty dictionary if there is no journal or if it was written for different hash formats or
+        for another generation. a truncated last line (the process was killed while writing it) is ignored.
+        """
+        if not os.path.exists(self.file_path):
+            return {}
+        entries = {}
+        with open(self.file_path, "r", encoding="utf-8") as journal_file:
+            try:
+                header = json.loads(journal_file.readline())
+            except ValueError:
+                header = None
+            if header != self._header():
+                logger.verbose(f"  ignoring journal {self.file_path}, it was written for a different run")
+                return {}
+            for line in journal_file:
+                try:
+                    record = json.loads(line)
+                    entries[record["path"]] = JournalEntry(record["size"], record["mtime_ns"], record["hashes"])
+                except (ValueError, KeyError):
+                    break
+        return entries
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # the file of an interrupted run is kept, so the run can be resumed
+        self.close()
+
+    def open(self, entries: Optional[Dict[str, JournalEntry]] = None):
+        """
+        starts a new journal that contains the given entries (e.g. the entries of the run that is resumed), returns
+        the journal so it can be used as a context manager that closes the file
+        """
+        os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+        self.file = open(self.file_path, "w", encoding="utf-8")
+        self._write_line(self._header())
+        for relative_path, entry in (entries or {}).items():
+            self.append(relative_path, entry.size, entry.mtime_ns, entry.hash_lookup)
+        return self
+
+    def append(self, relative_path: str, size: int, mtime_ns: int, hash_lookup: Dict[str, str]):
+        self._write_line({"path": relative_path, "size": size, "mtime_ns": mtime_ns, "hashes": hash_lookup})
+
+    def _write_line(self, record: dict):
+        self.file.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def remove(self):
+        self.close()
+        if os.path.exists(self.file_path):
+            os.remove(self.file_path)
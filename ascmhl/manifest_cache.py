@@ -0,0 +1,210 @@
+"""
+__author__ = "Patrick Renner, Alexander Sahm"
+__copyright__ = "Copyright 2024, Pomfort GmbH"
+
+__license__ = "MIT"
+__maintainer__ = "Patrick Renner, Alexander Sahm"
+__email__ = "opensource@pomfort.com"
+"""
+
+import json
+import os
+from typing import Dict, NamedTuple, Optional
+
+from . import logger
+from .__version__ import ascmhl_manifestcachefile_name
+from .hasher import hash_file, hasher_registration
+
+
+class ManifestCacheEntry(NamedTuple):
+    device: int
+    inode: int
+    size: int
+    mtime_ns: int
+    hash_lookup: Dict[str, str]
+
+    def matches(self, file_stat: os.stat_result) -> bool:
+        return (self.device, self.inode, self.size, self.mtime_ns) == (
+            file_stat.st_dev,
+            file_stat.st_ino,
+            file_stat.st_size,
+            file_stat.st_mtime_ns,
+        )
+
+
+class MHLManifestCache:
+    """
+    class for remembering the hashes of manifest files (the ascmhl files of the generations of a history), so
+    unchanged manifests are not hashed again every time a history is loaded
+
+    a manifest is identified by its absolute path, the cached hashes are only used as long as the device, the inode,
+    the size and the modification time of the file are the same as when it was hashed. each manifest is hashed at
+    most once per process, the hashes are also kept in a file in the cache folder of the user so later runs can use
+    them. the file has one JSON object per line, lines are appended as manifests are hashed and the file is
+    rewritten without the outdated lines when it is loaded.
+
+    in paranoid mode the file is neither read nor written, all manifests are hashed again once per process.
+
+    the hash formats are looked up in the hasher registry, hashes of formats that aren't registered (e.g. of a
+    plugin that was uninstalled) are dropped when the file is loaded.
+
+    - public interface
+        * initialized with the path of the cache file (None to only keep the hashes in memory)
+        * hashing a manifest file, using the cached hash if the file is unchanged
+        * looking up and storing the hashes of a manifest file by its stat result, e.g. for manifests that were
+          hashed while they were read
+    """
+
+    default_max_entries = 100000
+
+    def __init__(self, file_path: Optional[str], max_entries: int = default_max_entries):
+        self.file_path = file_path
+        self.max_entries = max_entries
+        self.paranoid = False
+        self.hits = 0
+        self.misses = 0
+        self._entries: Dict[str, ManifestCacheEntry] = {}
+        self._loaded = False
+
+    def hash_file(self, file_path: str, hash_format: str) -> str:
+        """
+        returns the hash of a manifest file, the file is only hashed if it changed since it was last hashed
+        """
+        file_stat = os.stat(file_path)
+        hash_string = self.lookup(file_path, file_stat, hash_format)
+        if hash_string is None:
+            hash_string = hash_file(file_path, hash_format)
+            self.store(file_path, file_stat, {hash_format: hash_string})
+        return hash_string
+
+    def lookup(self, file_path: str, file_stat: os.stat_result, hash_format: str) -> Optional[str]:
+        """
+        returns the cached hash of a manifest file, or None if the file changed or wasn't hashed in that format
+        """
+        # raises a KeyError for unknown formats, like hashing the file would
+        hasher_registration(hash_format)
+        self._load()
+        entry = self._entries.get(os.path.abspath(file_path))
+        if entry is None or not entry.matches(file_stat) or hash_format not in entry.hash_lookup:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry.hash_lookup[hash_format]
+
+    def store(self, file_path: str, file_stat: os.stat_result, hash_lookup: Dict[str, str]):
+        """
+        stores the hashes of a manifest file, file_stat must be taken before the file was hashed, so a file that
+        changes while it is hashed doesn't match the entry afterwards
+        """
+        self._load()
+        absolute_path = os.path.abspath(file_path)
+        entry = self._entries.pop(absolute_path, None)
+        # hashes of the previous content of the file can't be used any more
+        hashes = dict(entry.hash_lookup) if entry is not None and entry.matches(file_stat) else {}
+        hashes.update(hash_lookup)
+        entry = ManifestCacheEntry(file_stat.st_dev, file_stat.st_ino, file_stat.st_size, file_stat.st_mtime_ns, hashes)
+        self._entries[absolute_path] = entry
+        if self._uses_file():
+            try:
+                os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+                with open(self.file_path, "a", encoding="utf-8") as cache_file:
+                    cache_file.write(_entry_line(absolute_path, entry))
+            except OSError as error:
+                logger.verbose(f"  could not write manifest cache {self.file_path}: {error}")
+
+    def clear(self):
+        """
+        forgets all hashes, including the ones that were loaded from the cache file
+        """
+        self._entries = {}
+        self._loaded = False
+
+    def _uses_file(self) -> bool:
+        return self.file_path is not None and not self.paranoid
+
+    def _load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        if not self._uses_file() or not os.path.exists(self.file_path):
+            return
+        loaded_entries: Dict[str, ManifestCacheEntry] = {}
+        num_lines = 0
+        try:
+            with open(self.file_path, "r", encoding="utf-8") as cache_file:
+                for line in cache_file:
+                    num_lines += 1
+                    try:
+                        record = json.loads(line)
+                        path = record["path"]
+                        entry = ManifestCacheEntry(
+                            record["device"],
+                            record["inode"],
+                            record["size"],
+                            record["mtime_ns"],
+                            {
+                                hash_format: hash_string
+                                for hash_format, hash_string in record["hashes"].items()
+                                if _is_registered(hash_format)
+                            },
+                        )
+                    except (ValueError, KeyError, TypeError):
+                        # e.g. a truncated last line of a process that was killed while writing it
+                        continue
+                    loaded_entries.pop(path, None)
+                    loaded_entries[path] = entry
+        except OSError as error:
+            logger.verbose(f"  could not read manifest cache {self.file_path}: {error}")
+            return
+        # the least recently stored entries are dropped first
+        for path in list(loaded_entries)[: max(0, len(loaded_entries) - self.max_entries)]:
+            del loaded_entries[path]
+        # entries that were stored in this process before the file was loaded are newer
+        loaded_entries.update(self._entries)
+        self._entries = loaded_entries
+        if num_lines > 2 * len(loaded_entries):
+            self._rewrite()
+
+    def _rewrite(self):
+        temporary_file_path = self.file_path + ".tmp"
+        try:
+            with open(temporary_file_path, "w", encoding="utf-8") as cache_file:
+                for path, entry in self._entries.items():
+                    cache_file.write(_entry_line(path, entry))
+            os.replace(temporary_file_path, self.file_path)
+        except OSError as error:
+            logger.verbose(f"  could not write manifest cache {self.file_path}: {error}")
+
+
+def _is_registered(hash_format: str) -> bool:
+    try:
+        hasher_registration(hash_format)
+    except KeyError:
+        return False
+    return True
+
+
+def _entry_line(path: str, entry: ManifestCacheEntry) -> str:
+    record = {
+        "path": path,
+        "device": entry.device,
+        "inode": entry.inode,
+        "size": entry.size,
+        "mtime_ns": entry.mtime_ns,
+        "hashes": entry.hash_lookup,
+    }
+    return json.dumps(record, separators=(",", ":")) + "\n"
+
+
+def default_cache_folder_path() -> str:
+    """
+    returns the folder for cache files of the user, e.g. ~/.cache/ascmhl
+    """
+    if os.name == "nt" and os.environ.get("LOCALAPPDATA"):
+        return os.path.join(os.environ["LOCALAPPDATA"], "ascmhl")
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "ascmhl")
+
+
+# the cache that is used when histories are loaded, commands can set it to paranoid mode
+shared_manifest_cache = MHLManifestCache(os.path.join(default_cache_folder_path(), ascmhl_manifestcachefile_name))
@@ -0,0 +1,209 @@
+"""
+__author__ = "Patrick Renner, Alexander Sahm"
+__copyright__ = "Copyright 2024, Pomfort GmbH"
+
+__license__ = "MIT"
+__maintainer__ = "Patrick Renner, Alexander Sahm"
+__email__ = "opensource@pomfort.com"
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Dict, NamedTuple, Optional
+
+from . import errors, hashlist_xml_parser, logger, manifest_cache
+from .chain import MHLChainGeneration
+from .hashlist import MHLHashEntry, MHLHashList, MHLHashListReference, MHLMediaHash
+from .ignore import MHLIgnoreSpec
+
+
+class _Manifest(NamedTuple):
+    # the generation in the chain the manifest is checked against, None for manifests that are only parsed
+    generation: Optional[MHLChainGeneration]
+    # the manifest cache has the hash of the unchanged manifest, it doesn't need to be hashed again
+    is_cached: bool
+    size: int
+
+
+class MHLManifestLoader:
+    """
+    class for parsing the manifests of one or more histories, in worker processes if there is enough to parse
+
+    the manifests are added first (e.g. for a history and all its child histories), then the loader is started and
+    the hash lists are taken from the loader in any order. started loaders submit all manifests to a pool of worker
+    processes if the manifests are large enough to make up for starting the processes. the workers return a compact
+    form of the parsed hash lists that is turned into MHLHashList objects again when a hash list is taken.
+
+    manifests of generations in a chain are checked against the hash in the chain while they are parsed, unless the
+    manifest cache has their hash. a manifest that fails in a worker is parsed again in the calling process, so
+    errors are raised the same way as without workers.
+
+    - public interface
+        * initialized with the maximum number of worker processes
+        * adding manifests, with the generation of the chain to check them against
+        * starting to parse the added manifests
+        * taking the hash list of a manifest, which waits until it is parsed
+        * closing, to stop the worker processes
+    """
+
+    # manifests are only parsed in worker processes if they have at least this many bytes in total
+    min_parallel_bytes = 32 * 1024 * 1024
+
+    def __init__(self, jobs: Optional[int] = None):
+        self.jobs = jobs or os.cpu_count() or 1
+        self._manifests: Dict[str, _Manifest] = {}
+        self._futures: Dict[str, Future] = {}
+        self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def add(self, file_path: str, generation: Optional[MHLChainGeneration] = None):
+        file_stat = os.stat(file_path)
+        is_cached = False
+        if generation is not None:
+            cached_hash_string = manifest_cache.shared_manifest_cache.lookup(
+                file_path, file_stat, generation.hash_format
+            )
+            if cached_hash_string is not None:
+                if cached_hash_string != generation.hash_string:
+                    raise errors.ModifiedMHLManifestFileException(file_path)
+                is_cached = True
+        self._manifests[file_path] = _Manifest(generation, is_cached, file_stat.st_size)
+
+    def start(self):
+        total_size = sum(manifest.size for manifest in self._manifests.values())
+        if self.jobs < 2 or len(self._manifests) < 2 or total_size < self.min_parallel_bytes:
+            return
+        logger.verbose(f"  parsing {len(self._manifests)} manifest(s) in {self.jobs} worker process(es)")
+        self._executor = ProcessPoolExecutor(
+            max_workers=min(self.jobs, len(self._manifests)), mp_context=multiprocessing.get_context("spawn")
+        )
+        # the largest manifests first, so the workers finish at about the same time
+        for file_path, manifest in sorted(self._manifests.items(), key=lambda item: -item[1].size):
+            self._futures[file_path] = self._executor.submit(_parse_manifest, file_path, *_hash_arguments(manifest))
+
+    def hash_list(self, file_path: str) -> MHLHashList:
+        manifest = self._manifests.pop(file_path)
+        future = self._futures.pop(file_path, None)
+        if future is not None:
+            try:
+                compact_hash_list, hash_string, file_stat = future.result()
+            except Exception:
+                # parsed again below to raise the error of the manifest
+                pass
+            else:
+                self._store_hash(file_path, manifest, hash_string, file_stat)
+                return _hash_list_from_compact(compact_hash_list)
+        hash_list, hash_string, file_stat = _parse(file_path, *_hash_arguments(manifest))
+        self._store_hash(file_path, manifest, hash_string, file_stat)
+        return hash_list
+
+    def close(self):
+        if self._executor is not None:
+            for future in self._futures.values():
+                future.cancel()
+            self._executor.shutdown()
+            self._executor = None
+        self._futures = {}
+
+    @staticmethod
+    def _store_hash(file_path: str, manifest: _Manifest, hash_string: Optional[str], file_stat: os.stat_result):
+        if hash_string is not None:
+            manifest_cache.shared_manifest_cache.store(
+                file_path, file_stat, {manifest.generation.hash_format: hash_string}
+            )
+
+
+def _hash_arguments(manifest: _Manifest):
+    if manifest.generation is None or manifest.is_cached:
+        return None, None
+    return manifest.generation.hash_format, manifest.generation.hash_string
+
+
+def _parse(file_path: str, hash_format: Optional[str], expected_hash_string: Optional[str]):
+    """
+    parses a manifest, and hashes it while it is parsed if a hash format is given
+    """
+    if hash_format is None:
+        return hashlist_xml_parser.parse(file_path), None, None
+    return hashlist_xml_parser.parse_and_hash(file_path, hash_format, expected_hash_string)
+
+
+def _parse_manifest(file_path: str, hash_format: Optional[str], expected_hash_string: Optional[str]):
+    """
+    parses a manifest in a worker process and returns the compact form of the hash list
+    """
+    hash_list, hash_string, file_stat = _parse(file_path, hash_format, expected_hash_string)
+    return _compact_hash_list(hash_list), hash_string, file_stat
+
+
+def _compact_hash_list(hash_list: MHLHashList) -> tuple:
+    """
+    returns the hash list as nested tuples, which are much smaller and faster to pickle than the objects
+    """
+    media_hashes = list(hash_list.media_hashes)
+    if hash_list.process_info.root_media_hash is not None:
+        media_hashes.insert(0, hash_list.process_info.root_media_hash)
+    return (
+        hash_list.file_path,
+        hash_list.creator_info,
+        hash_list.process_info.process,
+        hash_list.process_info.hashlist_custom_basename,
+        hash_list.process_info.ignore_spec.get_pattern_list(),
+        [
+            (
+                media_hash.path,
+                media_hash.file_size,
+                media_hash.last_modification_date,
+                media_hash.is_directory,
+                media_hash.previous_path,
+                [
+                    (entry.hash_format, entry.hash_string, entry.structure_hash_string, entry.action, entry.hash_date)
+                    for entry in media_hash.hash_entries
+                ],
+            )
+            for media_hash in media_hashes
+        ],
+        [(reference.path, reference.reference_hash) for reference in hash_list.hash_list_references],
+    )
+
+
+def _hash_list_from_compact(compact_hash_list: tuple) -> MHLHashList:
+    (
+        file_path,
+        creator_info,
+        process,
+        hashlist_custom_basename,
+        ignore_patterns,
+        media_hashes,
+        references,
+    ) = compact_hash_list
+    hash_list = MHLHashList()
+    hash_list.file_path = file_path
+    hash_list.creator_info = creator_info
+    hash_list.process_info.process = process
+    hash_list.process_info.hashlist_custom_basename = hashlist_custom_basename
+    hash_list.process_info.ignore_spec = MHLIgnoreSpec(ignore_patterns)
+    for path, file_size, last_modification_date, is_directory, previous_path, hash_entries in media_hashes:
+        media_hash = MHLMediaHash()
+        media_hash.path = path
+        media_hash.file_size = file_size
+        media_hash.last_modification_date = last_modification_date
+        media_hash.is_directory = is_directory
+        media_hash.previous_path = previous_path
+        for hash_format, hash_string, structure_hash_string, action, hash_date in hash_entries:
+            entry = MHLHashEntry(hash_format, hash_string, action, hash_date)
+            entry.structure_hash_string = structure_hash_string
+            media_hash.append_hash_entry(entry)
+        hash_list.append_hash(media_hash)
+    for path, reference_hash in references:
+        reference = MHLHashListReference()
+        reference.path = path
+        reference.reference_hash = reference_hash
+        hash_list.append_hash_list_reference(reference)
+    return hash_list
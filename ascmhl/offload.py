@@ -0,0 +1,165 @@
+"""
+__author__ = "Patrick Renner, Alexander Sahm"
+__copyright__ = "Copyright 2024, Pomfort GmbH"
+
+__license__ = "MIT"
+__maintainer__ = "Patrick Renner, Alexander Sahm"
+__email__ = "opensource@pomfort.com"
+"""
+
+import os
+import queue
+import shutil
+import threading
+from concurrent.futures import Future
+from typing import Dict, List
+
+from .hasher import ReadOptions, _advise, new_hasher_for_hash_type
+
+
+class StreamingCopier:
+    """
+    class for copying files to several destinations at once while hashing them, each source file is read once
+
+    the chunks read from a source file are handed to one writer thread per destination and one hashing thread per
+    hash format. the threads are kept for all files that are copied, the queues between the reading thread and
+    the workers are bounded, so the throughput is limited by the slowest device or hash format.
+
+    written files are flushed to their device and dropped from the page cache, so reading them back for
+    verification reads the data from the device and not the data that was just written to memory.
+
+    - public interface
+        * initialized with the number of destinations, the hash formats and the read options
+        * copying a file to its destination paths, returning the raw digests of the source data
+        * closing, to stop the worker threads
+    """
+
+    # number of chunks per worker that can be queued ahead of the slowest worker
+    queued_chunks = 4
+
+    def __init__(self, num_destinations: int, hash_formats: [str], read_options: ReadOptions = None):
+        self.hash_formats = hash_formats
+        self.read_options = read_options or ReadOptions()
+        self._writer_queues = [queue.Queue(self.queued_chunks) for _ in range(num_destinations)]
+        self._hasher_queues = [queue.Queue(self.queued_chunks) for _ in hash_formats]
+        self._threads = [
+            threading.Thread(target=_write_chunks, args=(chunk_queue,), name=f"ascmhl-write_{index}", daemon=True)
+            for index, chunk_queue in enumerate(self._writer_queues)
+        ] + [
+            threading.Thread(
+                target=_hash_chunks, args=(chunk_queue, hash_format), name=f"ascmhl-{hash_format}", daemon=True
+            )
+            for hash_format, chunk_queue in zip(hash_formats, self._hasher_queues)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def copy_file(self, source_path: str, destination_paths: List[str]) -> Dict[str, bytes]:
+        """
+        copies a file to all destination paths and returns the raw digests of the data read from the source,
+        keyed by hash format. the modification time of the source is set on the copies.
+        """
+        if len(destination_paths) != len(self._writer_queues):
+            raise ValueError(f"expected {len(self._writer_queues)} destination paths, got {len(destination_paths)}")
+        writer_futures = [Future() for _ in self._writer_queues]
+        hasher_futures = [Future() for _ in self._hasher_queues]
+        for chunk_queue, destination_path, future in zip(self._writer_queues, destination_paths, writer_futures):
+            chunk_queue.put(("open", destination_path, future))
+        for chunk_queue, future in zip(self._hasher_queues, hasher_futures):
+            chunk_queue.put(("open", None, future))
+
+        chunk_queues = self._writer_queues + self._hasher_queues
+        try:
+            with self.read_options.open_file(source_path) as (fd, chunk_size):
+                offset = 0
+                while True:
+                    # every chunk is a new bytes object, so the workers can use it without copying
+                    chunk = fd.read(chunk_size)
+                    if not chunk:
+                        break
+                    for chunk_queue in chunk_queues:
+                        chunk_queue.put(("data", chunk, None))
+                    offset += len(chunk)
+                    self.read_options.chunks_consumed(fd, offset, len(chunk))
+        finally:
+            # the workers close their files in any case, a failed read is raised below
+            for chunk_queue in chunk_queues:
+                chunk_queue.put(("close", None, None))
+
+        # results are collected in order, so the first failing worker raises its exception
+        for future in writer_futures:
+            future.result()
+        for destination_path in destination_paths:
+            shutil.copystat(source_path, destination_path)
+        return {hash_format: future.result() for hash_format, future in zip(self.hash_formats, hasher_futures)}
+
+    def close(self):
+        for chunk_queue in self._writer_queues + self._hasher_queues:
+            chunk_queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+
+def _write_chunks(chunk_queue: queue.Queue):
+    file = None
+    future = None
+    error = None
+    while True:
+        message = chunk_queue.get()
+        if message is None:
+            return
+        action, value, new_future = message
+        if action == "open":
+            future, error = new_future, None
+            try:
+                file = open(value, "wb", buffering=0)
+            except OSError as open_error:
+                error = open_error
+        elif action == "data":
+            # after an error the remaining chunks of the file are discarded
+            if error is None:
+                try:
+                    data = memoryview(value)
+                    while data:
+                        data = data[file.write(data) :]
+                except OSError as write_error:
+                    error = write_error
+        elif action == "close":
+            if file is not None:
+                try:
+                    if error is None:
+                        os.fsync(file.fileno())
+                        _advise(file, 0, 0, "POSIX_FADV_DONTNEED")
+                except OSError as sync_error:
+                    error = sync_error
+                finally:
+                    file.close()
+                    file = None
+            if error is None:
+                future.set_result(None)
+            else:
+                future.set_exception(error)
+
+
+def _hash_chunks(chunk_queue: queue.Queue, hash_format: str):
+    hasher = new_hasher_for_hash_type(hash_format)
+    future = None
+    while True:
+        message = chunk_queue.get()
+        if message is None:
+            return
+        action, value, new_future = message
+        if action == "open":
+            future = new_future
+            hasher.reset()
+        elif action == "data":
+            hasher.update(value)
+        elif action == "close":
+            future.set_result(hasher.digest())
@@ -0,0 +1,167 @@
+"""
+__author__ = "Patrick Renner, Alexander Sahm"
+__copyright__ = "Copyright 2024, Pomfort GmbH"
+
+__license__ = "MIT"
+__maintainer__ = "Patrick Renner, Alexander Sahm"
+__email__ = "opensource@pomfort.com"
+"""
+
+import json
+import math
+import os
+import threading
+from timeit import default_timer as timer
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+# kinds of progress events
+# enumerated -- files were found that will be hashed, the totals grew
+# hashed -- one or more files were hashed, file_path is the last of them
+# enumeration_finished -- all files to hash have been found, the totals are final
+# finished -- all files have been hashed
+progress_event_kinds = ["enumerated", "hashed", "enumeration_finished", "finished"]
+
+
+class ProgressEvent(NamedTuple):
+    kind: str
+    file_path: Optional[str]
+    files_done: int
+    files_total: int
+    bytes_done: int
+    bytes_total: int
+    # the totals only contain the files found so far until the enumeration is finished
+    enumeration_finished: bool
+    elapsed_seconds: float
+    # overall throughput since the start, and the current throughput of each worker
+    bytes_per_second: float
+    worker_bytes_per_second: Dict[str, float]
+    # estimated remaining time, None as long as nothing has been hashed
+    eta_seconds: Optional[float]
+
+    def as_json(self) -> str:
+        return json.dumps(self._asdict(), separators=(",", ":"))
+
+
+class ProgressTracker:
+    """
+    class for tracking the progress of hashing files and reporting it to callbacks
+
+    the callbacks are called with a ProgressEvent from the thread that reports the progress (e.g. a hashing worker)
+    while the tracker is locked, so events are received one at a time and in order. callbacks should return
+    quickly, they delay the reporting thread.
+
+    - public interface
+        * adding and removing callbacks
+        * reporting enumerated and hashed files, and the end of the enumeration and of the hashing
+    """
+
+    # time constant in seconds of the moving average of the per worker throughput
+    worker_rate_time_constant = 5.0
+
+    def __init__(self):
+        self.callbacks: List[Callable[[ProgressEvent], None]] = []
+        self.files_done = 0
+        self.files_total = 0
+        self.bytes_done = 0
+        self.bytes_total = 0
+        self.enumeration_finished = False
+        self.worker_bytes_per_second: Dict[str, float] = {}
+        self._start_time = None
+        self._lock = threading.Lock()
+
+    def add_callback(self, callback: Callable[[ProgressEvent], None]):
+        self.callbacks.append(callback)
+
+    def remove_callback(self, callback: Callable[[ProgressEvent], None]):
+        self.callbacks.remove(callback)
+
+    def files_enumerated(self, num_files: int, num_bytes: int):
+        with self._lock:
+            if self._start_time is None:
+                self._start_time = timer()
+            self.files_total += num_files
+            self.bytes_total += num_bytes
+            self._notify("enumerated")
+
+    def files_hashed(self, files: List[Tuple[str, int]], seconds: float, worker: str):
+        """
+        reports files that were hashed by a worker
+
+        arguments:
+        files -- (file path, file size) tuples of the hashed files
+        seconds -- time the worker spent hashing the files
+        worker -- name of the worker, e.g. the name of the thread
+        """
+        num_bytes = sum(file_size for _, file_size in files)
+        with self._lock:
+            if self._start_time is None:
+                self._start_time = timer()
+            self.files_done += len(files)
+            self.bytes_done += num_bytes
+            if seconds > 0:
+                # exponential moving average, weighted by the time the files took
+                weight = 1.0 - math.exp(-seconds / self.worker_rate_time_constant)
+                rate = self.worker_bytes_per_second.get(worker, num_bytes / seconds)
+                self.worker_bytes_per_second[worker] = rate + weight * (num_bytes / seconds - rate)
+            self._notify("hashed", files[-1][0] if files else None)
+
+    def finish_enumeration(self):
+        with self._lock:
+            self.enumeration_finished = True
+            self._notify("enumeration_finished")
+
+    def finish(self):
+        with self._lock:
+            self._notify("finished")
+
+    def _notify(self, kind: str, file_path: str = None):
+        if not self.callbacks:
+            return
+        elapsed_seconds = timer() - self._start_time if self._start_time is not None else 0.0
+        bytes_per_second = self.bytes_done / elapsed_seconds if elapsed_seconds > 0 else 0.0
+        eta_seconds = None
+        if bytes_per_second > 0:
+            eta_seconds = (self.bytes_total - self.bytes_done) / bytes_per_second
+        elif self.files_done == self.files_total and self.enumeration_finished:
+            eta_seconds = 0.0
+        event = ProgressEvent(
+            kind,
+            file_path,
+            self.files_done,
+            self.files_total,
+            self.bytes_done,
+            self.bytes_total,
+            self.enumeration_finished,
+            elapsed_seconds,
+            bytes_per_second,
+            dict(self.worker_bytes_per_second),
+            eta_seconds,
+        )
+        for callback in self.callbacks:
+            callback(event)
+
+
+class ProgressWriter:
+    """
+    callable that writes progress events as newline delimited JSON to a file descriptor
+
+    hashed events are written at most every min_interval seconds, all other events are always written.
+    """
+
+    def __init__(self, fd: int, min_interval: float = 0.5):
+        self.fd = fd
+        self.min_interval = min_interval
+        self._last_write_time = None
+
+    def __call__(self, event: ProgressEvent):
+        now = timer()
+        if (
+            event.kind == "hashed"
+            and self._last_write_time is not None
+            and now - self._last_write_time < self.min_interval
+        ):
+            return
+        self._last_write_time = now
+        data = (event.as_json() + "\n").encode("utf-8")
+        while data:
+            data = data[os.write(self.fd, data) :]
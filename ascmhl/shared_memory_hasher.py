@@ -0,0 +1,172 @@
+"""
+__author__ = "Patrick Renner, Alexander Sahm"
+__copyright__ = "Copyright 2024, Pomfort GmbH"
+
+__license__ = "MIT"
+__maintainer__ = "Patrick Renner, Alexander Sahm"
+__email__ = "opensource@pomfort.com"
+"""
+
+import multiprocessing
+from multiprocessing import shared_memory
+from typing import Dict
+
+from .hasher import ReadOptions, hash_strings_from_digests, new_hasher_for_hash_type
+
+# message types sent from the reading process to the worker processes
+_UPDATE = 0
+_DIGEST = 1
+_STOP = 2
+
+
+class SharedMemoryAggregateHasher:
+    """
+    Handles multiple hashing with one worker process per hash format to facilitate a read-once create-many
+    hashing paradigm for CPU-bound hash formats (e.g. md5, sha1 and c4 at the same time).
+
+    The calling process reads each chunk of a file once into a ring buffer in shared memory. The workers update their
+    hashers directly from the shared memory, so the chunks are never copied between processes and the throughput is
+    close to the throughput of the slowest hash format instead of the sum of all formats.
+
+    Worker processes are started on first use of a hash format and are reused for all subsequent files,
+    call close() (or use the hasher as a context manager) to stop them.
+    """
+
+    chunk_size: int
+    num_slots: int
+    read_options: ReadOptions
+
+    def __init__(self, chunk_size: int = 1024 * 1024, num_slots: int = 8, page_cache_mode: str = "default"):
+        # the read options align the chunk size for O_DIRECT, the shared memory itself is page aligned
+        self.read_options = ReadOptions(chunk_size, page_cache_mode=page_cache_mode)
+        chunk_size = self.read_options.chunk_size
+        self.chunk_size = chunk_size
+        self.num_slots = num_slots
+        # spawn instead of fork, the calling process might run multiple hashing threads
+        self._context = multiprocessing.get_context("spawn")
+        self._shared_memory = shared_memory.SharedMemory(create=True, size=chunk_size * num_slots)
+        # a worker releases the semaphore of a slot once it has hashed the chunk in that slot
+        self._slot_semaphores = [self._context.Semaphore(0) for _ in range(num_slots)]
+        # number of workers that still need to hash the chunk in a slot before it can be overwritten
+        self._pending_workers = [0] * num_slots
+        self._workers = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def hash_file(self, file_path: str, hash_formats: [str]) -> Dict[str, str]:
+        """
+        computes and returns new hash strings for a file
+
+        arguments:
+        file_path -- string value, path of file to generate hash for.
+        hash_formats -- array string values, each entry should be one of the supported hash formats, e.g. 'md5', 'xxh64'
+        """
+        return hash_strings_from_digests(self.hash_file_digests(file_path, hash_formats))
+
+    def hash_file_digests(self, file_path: str, hash_formats: [str]) -> Dict[str, bytes]:
+        """
+        computes and returns the raw digests for a file, see hash_file for the arguments
+        """
+        connections = {hash_format: self._connection_for_format(hash_format) for hash_format in hash_formats}
+        try:
+            with self.read_options.open_file(file_path) as (fd, _):
+                sequence_number = 0
+                # file offset of the end of the chunk in a slot
+                end_offsets = [0] * self.num_slots
+                file_offset = 0
+                while True:
+                    slot = sequence_number % self.num_slots
+                    if self._pending_workers[slot]:
+                        self._wait_for_slot(slot)
+                        self.read_options.chunks_consumed(fd, end_offsets[slot], self.chunk_size)
+                    offset = slot * self.chunk_size
+                    with self._shared_memory.buf[offset : offset + self.chunk_size] as chunk_buffer:
+                        length = fd.readinto(chunk_buffer)
+                    if not length:
+                        break
+                    for connection in connections.values():
+                        connection.send((_UPDATE, slot, length))
+                    self._pending_workers[slot] = len(connections)
+                    file_offset += length
+                    end_offsets[slot] = file_offset
+                    sequence_number += 1
+        finally:
+            # requesting the digest also resets the workers for the next file, even if reading failed
+            digest_lookup = {}
+            for hash_format, connection in connections.items():
+                connection.send((_DIGEST, 0, 0))
+            for hash_format, connection in connections.items():
+                digest_lookup[hash_format] = connection.recv()
+            for slot in range(self.num_slots):
+                self._wait_for_slot(slot)
+
+        return digest_lookup
+
+    def close(self):
+        """
+        stops all worker processes and frees the shared memory
+        """
+        for process, connection in self._workers.values():
+            connection.send((_STOP, 0, 0))
+            process.join()
+            connection.close()
+        self._workers = {}
+        if self._shared_memory is not None:
+            self._shared_memory.close()
+            self._shared_memory.unlink()
+            self._shared_memory = None
+
+    def _wait_for_slot(self, slot):
+        while self._pending_workers[slot] > 0:
+            self._slot_semaphores[slot].acquire()
+            self._pending_workers[slot] -= 1
+
+    def _connection_for_format(self, hash_format):
+        if hash_format not in self._workers:
+            # fail early in the calling process for unknown formats
+            new_hasher_for_hash_type(hash_format)
+            connection, worker_connection = self._context.Pipe()
+            process = self._context.Process(
+                target=_hash_worker,
+                args=(
+                    self._shared_memory.name,
+                    self.chunk_size,
+                    hash_format,
+                    worker_connection,
+                    self._slot_semaphores,
+                ),
+                daemon=True,
+            )
+            process.start()
+            worker_connection.close()
+            self._workers[hash_format] = (process, connection)
+        return self._workers[hash_format][1]
+
+
+def _hash_worker(shared_memory_name, chunk_size, hash_format, connection, slot_semaphores):
+    """
+    runs in a worker process, hashes the chunks it is told about until it is stopped
+    """
+    # the worker shares the resource tracker of the calling process, which unlinks the segment in close()
+    attached_memory = shared_memory.SharedMemory(name=shared_memory_name)
+    hasher = new_hasher_for_hash_type(hash_format)
+    try:
+        while True:
+            message_type, slot, length = connection.recv()
+            if message_type == _UPDATE:
+                offset = slot * chunk_size
+                with attached_memory.buf[offset : offset + length] as chunk:
+                    hasher.update(chunk)
+                slot_semaphores[slot].release()
+            elif message_type == _DIGEST:
+                connection.send(hasher.digest())
+                hasher.reset()
+            else:
+                break
+    finally:
+        attached_memory.close()
+        connection.close()
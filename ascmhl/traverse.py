@@ -7,44 +7,228 @@ __maintainer__ = "Jon Waggoner"
 __email__ = "opensource@jonwaggoner.com"
 """
 
-from os.path import join, isdir
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, NamedTuple, Optional, Set
 import os
 
 from . import logger
-import pathspec
 from .__version__ import ascmhl_folder_name
+from .ignore import MHLIgnoreMatcher
 
+# number of folder listings per listing thread that are read ahead of the traversal
+prefetched_folders_per_job = 4
+# number of entries of folders that are read ahead of the traversal, at most, the entries of the folders on the
+# path to the current folder are always kept, they are part of the output
+default_max_prefetched_entries = 100000
 
-def post_order_lexicographic(top: str, ignore_pathspec: pathspec.PathSpec = None):
+
+class TraversalEntry(NamedTuple):
+    name: str
+    is_dir: bool
+    # the stat result of the entry (following symlinks), None if it couldn't be taken, e.g. for a broken symlink
+    stat: Optional[os.stat_result]
+
+
+def post_order_lexicographic(
+    top: str,
+    ignore_matcher: MHLIgnoreMatcher = None,
+    jobs: int = 1,
+    max_prefetched_entries: int = default_max_prefetched_entries,
+    ignore_root: str = None,
+):
     """
     iterates a file system in the order necessary to generate composite tree hashes, bypassing ignored paths.
+    ignored directories are skipped with all their contents.
 
     :param top: the directory being iterated
-    :param ignore_pathspec: the pathspec of ignore patterns to match file exclusions against
+    :param ignore_matcher: the matcher of ignore patterns to match file exclusions against
+    :param jobs: the number of folders that are listed in parallel, e.g. on network file systems
+    :param max_prefetched_entries: the number of entries of folders that are listed ahead of the traversal with
+        more than one job, at most
+    :param ignore_root: the root of the history the ignore patterns are relative to, top if not given
     :return: yields results in folder chunks, in the order necessary for composite directory hashes
     """
-    # create a sorted list of our immediate children
-    names = os.listdir(top)
-    names.sort()
-
-    # list of tuples. each tuple contains the child name and whether the child is a directory.
-    children = []
-    for name in names:
-        file_path = os.path.join(top, name)
-        if ignore_pathspec and ignore_pathspec.match_file(file_path):
-            if os.path.basename(os.path.normpath(file_path)) != ascmhl_folder_name:
-                logger.verbose(f"ignoring filepath {file_path}")
+    lister = _FolderLister(ignore_matcher, ignore_root or top, False, jobs, max_prefetched_entries)
+    try:
+        for folder_path, _, entries in _post_order(top, None, lister):
+            yield folder_path, [(entry.name, entry.is_dir) for entry in entries]
+    finally:
+        lister.close()
+
+
+def post_order_lexicographic_entries(
+    top: str,
+    ignore_matcher: MHLIgnoreMatcher = None,
+    jobs: int = 1,
+    max_prefetched_entries: int = default_max_prefetched_entries,
+    ignore_root: str = None,
+):
+    """
+    iterates a file system like post_order_lexicographic, but with the stat results of the folders and their
+    children, so the file sizes and modification dates don't need to be queried again.
+
+    the directory is listed with os.scandir, the type of the children is taken from the directory entries and each
+    child that isn't ignored is stat'ed once.
+
+    :param top: the directory being iterated
+    :param ignore_matcher: the matcher of ignore patterns to match file exclusions against
+    :param jobs: the number of folders that are listed in parallel, e.g. on network file systems
+    :param max_prefetched_entries: the number of entries of folders that are listed ahead of the traversal with
+        more than one job, at most
+    :param ignore_root: the root of the history the ignore patterns are relative to, top if not given
+    :return: yields (folder_path, folder_stat, entries) tuples in the order necessary for composite directory
+        hashes, entries is the sorted list of TraversalEntry tuples of the children of the folder
+    """
+    lister = _FolderLister(ignore_matcher, ignore_root or top, True, jobs, max_prefetched_entries)
+    try:
+        yield from _post_order(top, os.stat(top), lister)
+    finally:
+        lister.close()
+
+
+def post_order_sort_key(relative_path: str):
+    """
+    returns a key for sorting paths relative to the top of a traversal in the order in which post_order_lexicographic
+    yields them as children of their folders: the children of a folder after all paths in its subfolders, and
+    sorted by name.
+    """
+    components = relative_path.split(os.sep)
+    # a folder sorts after all of its subfolders
+    folder_key = tuple((0, component) for component in components[:-1]) + ((1, ""),)
+    return folder_key, components[-1]
+
+
+def _post_order(top: str, top_stat: Optional[os.stat_result], lister: "_FolderLister"):
+    # the traversal keeps an explicit stack instead of recursing, so the depth of the folder hierarchy is neither
+    # limited by the recursion limit nor adds a generator per level that each yielded folder passes through.
+    # each item holds a folder, its stat result, its sorted children and an iterator over the subfolders left
+    stack = [_stack_item(top, top_stat, lister)]
+    while stack:
+        folder_path, folder_stat, entries, subfolders = stack[-1]
+        subfolder = next(subfolders, None)
+        if subfolder is not None:
+            # descend into the next subfolder, in lexicographic order
+            stack.append(_stack_item(os.path.join(folder_path, subfolder.name), subfolder.stat, lister))
             continue
-        path = join(top, name)
-        children.append((name, isdir(path)))
-
-    # if directory, yield children recursively in post order until exhausted.
-    for name, is_dir in children:
-        if is_dir:
-            path = join(top, name)
-            if not os.path.islink(path):
-                for x in post_order_lexicographic(path, ignore_pathspec):
-                    yield x
-
-    # now that all children have been traversed, yield the top (current) directory and all of it's sorted children.
-    yield top, children
+        # now that all children have been traversed, yield the current directory and all of it's sorted children.
+        stack.pop()
+        yield folder_path, folder_stat, entries
+
+
+def _stack_item(folder_path: str, folder_stat: Optional[os.stat_result], lister: "_FolderLister"):
+    entries, symlinks = lister.list_folder(folder_path)
+    subfolders = iter([entry for entry in entries if entry.is_dir and entry.name not in symlinks])
+    return folder_path, folder_stat, entries, subfolders
+
+
+class _FolderListing(NamedTuple):
+    entries: List[TraversalEntry]
+    # names of the children that are symlinks, they are not traversed
+    symlinks: Set[str]
+    ignored_paths: List[str]
+
+
+def _list_folder(
+    folder_path: str, relative_folder_path: str, ignore_matcher: MHLIgnoreMatcher, stat_entries: bool
+) -> _FolderListing:
+    entries = []
+    symlinks = set()
+    ignored_paths = []
+    with os.scandir(folder_path) as directory_entries:
+        for directory_entry in directory_entries:
+            file_path = os.path.join(folder_path, directory_entry.name)
+            if ignore_matcher is not None and ignore_matcher.match_child(
+                relative_folder_path, directory_entry.name, directory_entry.is_dir()
+            ):
+                if directory_entry.name != ascmhl_folder_name:
+                    ignored_paths.append(file_path)
+                continue
+            entry_stat = None
+            if stat_entries:
+                try:
+                    entry_stat = directory_entry.stat()
+                except OSError:
+                    pass
+            entries.append(TraversalEntry(directory_entry.name, directory_entry.is_dir(), entry_stat))
+            if directory_entry.is_symlink():
+                symlinks.add(directory_entry.name)
+    entries.sort(key=lambda entry: entry.name)
+    ignored_paths.sort()
+    return _FolderListing(entries, symlinks, ignored_paths)
+
+
+class _FolderLister:
+    """
+    lists the folders of a traversal, with more than one job the folders are listed ahead of the traversal
+
+    folders are read ahead in the order in which the traversal will reach them (the subfolders of the folder that
+    was listed last come first), at most jobs * prefetched_folders_per_job listings are pending or kept in memory.
+    no further folders are read ahead while the listings that are kept have max_prefetched_entries entries.
+    the traversal itself stays in the calling thread, so the output and the logging don't depend on the jobs.
+    """
+
+    def __init__(
+        self,
+        ignore_matcher: MHLIgnoreMatcher,
+        ignore_root: str,
+        stat_entries: bool,
+        jobs: int = 1,
+        max_prefetched_entries: int = default_max_prefetched_entries,
+    ):
+        self.ignore_matcher = ignore_matcher
+        self.ignore_root = ignore_root
+        self.stat_entries = stat_entries
+        self.max_prefetched_folders = jobs * prefetched_folders_per_job
+        self.max_prefetched_entries = max_prefetched_entries
+        self._executor = None
+        if jobs > 1:
+            self._executor = ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="ascmhl-list")
+        # listings that have been submitted, keyed by folder path
+        self._futures = {}
+        # folders that are known, but haven't been submitted yet, in the order the traversal reaches them
+        self._folders_to_prefetch = deque()
+
+    def list_folder(self, folder_path: str):
+        future = self._futures.pop(folder_path, None)
+        if future is not None:
+            listing = future.result()
+        else:
+            if self._folders_to_prefetch and self._folders_to_prefetch[0] == folder_path:
+                self._folders_to_prefetch.popleft()
+            listing = self._list_folder(folder_path)
+
+        if self._executor is not None:
+            subfolder_paths = [
+                os.path.join(folder_path, entry.name)
+                for entry in listing.entries
+                if entry.is_dir and entry.name not in listing.symlinks
+            ]
+            self._folders_to_prefetch.extendleft(reversed(subfolder_paths))
+            while (
+                self._folders_to_prefetch
+                and len(self._futures) < self.max_prefetched_folders
+                and self._num_prefetched_entries() < self.max_prefetched_entries
+            ):
+                path = self._folders_to_prefetch.popleft()
+                self._futures[path] = self._executor.submit(self._list_folder, path)
+
+        for ignored_path in listing.ignored_paths:
+            logger.verbose(f"ignoring filepath {ignored_path}")
+        return listing.entries, listing.symlinks
+
+    def _list_folder(self, folder_path: str) -> _FolderListing:
+        relative_folder_path = os.path.relpath(folder_path, self.ignore_root).replace(os.sep, "/")
+        return _list_folder(folder_path, relative_folder_path, self.ignore_matcher, self.stat_entries)
+
+    def _num_prefetched_entries(self) -> int:
+        return sum(
+            len(future.result().entries)
+            for future in self._futures.values()
+            if future.done() and future.exception() is None
+        )
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
@@ -13,9 +13,12 @@ from click.testing import CliRunner
 from os.path import abspath
 from pathlib import Path
 import ascmhl.commands
+import ascmhl.hasher
+import ascmhl.manifest_cache
 import os
 import time
 import platform
+import xxhash
 
 # this file is automatically loaded by pytest we setup various shared fixtures here
 
@@ -45,9 +48,28 @@ def setup_environment(monkeypatch):
         return "myHost.local"
 
     monkeypatch.setattr(platform, "node", fake_hostname)
+    # every test starts without hashed manifests and doesn't touch the manifest cache of the user
+    monkeypatch.setattr(ascmhl.manifest_cache, "shared_manifest_cache", ascmhl.manifest_cache.MHLManifestCache(None))
     # TODO: also patch ascmhl_tool_version ?
 
 
+class NullHasher(ascmhl.hasher.HexHasher):
+    # a hash format of a plugin, it generates the same hashes as xxh32
+    throughput = 100000
+
+    @staticmethod
+    def hashlib_type():
+        return xxhash.xxh32
+
+
+@pytest.fixture
+def null_hash_format():
+    # registers a hash format like a plugin would, and removes it again afterwards
+    ascmhl.hasher.register_hasher("null", NullHasher)
+    yield "null"
+    ascmhl.hasher._hasher_registrations.pop("null", None)
+
+
 @pytest.fixture
 @freeze_time("2020-01-15 13:00:00")
 def nested_mhl_histories(fs):
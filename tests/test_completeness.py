@@ -0,0 +1,46 @@
+"""
+__author__ = "Patrick Renner, Alexander Sahm"
+__copyright__ = "Copyright 2024, Pomfort GmbH"
+
+__license__ = "MIT"
+__maintainer__ = "Patrick Renner, Alexander Sahm"
+__email__ = "opensource@pomfort.com"
+"""
+
+import os
+from click.testing import CliRunner
+
+from ascmhl import ignore
+from ascmhl.completeness import MHLCompletenessCheck
+from ascmhl.history import MHLHistory
+from ascmhl.traverse import post_order_lexicographic, post_order_sort_key
+import ascmhl.commands
+
+
+def test_completeness_check(tmp_path):
+    for relative_path in ["A/A1.txt", "A/AA/AA1.txt", "A.txt", "B/B1.txt", "B1.txt"]:
+        os.makedirs(os.path.dirname(tmp_path / relative_path), exist_ok=True)
+        (tmp_path / relative_path).write_text(relative_path)
+    runner = CliRunner()
+    result = runner.invoke(ascmhl.commands.create, [str(tmp_path), "-h", "xxh64"])
+    assert result.exit_code == 0
+
+    # the sort key orders paths like the traversal
+    traversed_paths = [
+        os.path.relpath(os.path.join(folder_path, name), str(tmp_path))
+        for folder_path, children in post_order_lexicographic(str(tmp_path), ignore.MHLIgnoreSpec().get_matcher())
+        for name, _ in children
+    ]
+    assert sorted(reversed(traversed_paths), key=post_order_sort_key) == traversed_paths
+
+    os.remove(tmp_path / "A" / "AA" / "AA1.txt")
+    (tmp_path / "A" / "A2.txt").write_text("A2")
+    completeness_check = MHLCompletenessCheck(MHLHistory.load_from_path(str(tmp_path)), str(tmp_path))
+    new_paths = [
+        os.path.relpath(os.path.join(folder_path, name), str(tmp_path))
+        for folder_path, children in post_order_lexicographic(str(tmp_path), ignore.MHLIgnoreSpec().get_matcher())
+        for name, _ in children
+        if not completeness_check.visit(os.path.join(folder_path, name))
+    ]
+    assert new_paths == [os.path.join("A", "A2.txt")]
+    assert completeness_check.finish() == {str(tmp_path / "A" / "AA" / "AA1.txt")}
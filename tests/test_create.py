@@ -7,7 +7,9 @@ __maintainer__ = "Patrick Renner, Alexander Sahm"
 __email__ = "opensource@pomfort.com"
 """
 
+import json
 import os
+import pytest
 from freezegun import freeze_time
 from click.testing import CliRunner
 from .conftest import path_conversion_tests
@@ -16,6 +18,10 @@ from .conftest import abspath_conversion_tests
 from ascmhl import utils
 from ascmhl.history import MHLHistory
 import ascmhl.commands
+import ascmhl.engine
+from ascmhl.engine import HashingEngine
+from ascmhl.journal import MHLCreationJournal
+from ascmhl.traverse import post_order_lexicographic, post_order_lexicographic_entries
 
 scenario_output_path = "examples/scenarios/Output"
 fake_ref_path = "/ref"
@@ -376,3 +382,290 @@ def test_create_mulitple_hashformats_double_hashformat(fs, simple_mhl_history):
         print(result.output)
 
     assert result.exit_code == 0
+
+
+@freeze_time("2020-01-16 09:15:00")
+def test_create_parallel_jobs_creates_identical_generation(fs):
+    for folder in ["A", "B", "B/BA", "C"]:
+        for index in range(5):
+            fs.create_file(f"/root/{folder}/file{index}.txt", contents=f"{folder} {index}\n")
+
+    runner = CliRunner()
+    result = runner.invoke(ascmhl.commands.create, [abspath_conversion_tests("/root"), "-h", "xxh64", "-h", "md5"])
+    assert result.exit_code == 0
+    mhlfilepath = "/root/ascmhl/0001_root_2020-01-16_091500Z.mhl"
+    with open(mhlfilepath, "rb") as file:
+        serial_manifest = file.read()
+
+    os.rename("/root/ascmhl", "/serial_ascmhl")
+    result = runner.invoke(
+        ascmhl.commands.create, [abspath_conversion_tests("/root"), "-h", "xxh64", "-h", "md5", "-j", "4"]
+    )
+    assert result.exit_code == 0
+    with open(mhlfilepath, "rb") as file:
+        assert file.read() == serial_manifest
+
+
+def test_create_process_hash_backend(tmp_path):
+    # worker processes don't see the fake file system, so this test runs on the real one
+    (tmp_path / "A").mkdir()
+    (tmp_path / "A" / "A1.txt").write_text("A1\n")
+    (tmp_path / "Stuff.txt").write_text("stuff\n")
+
+    runner = CliRunner()
+    result = runner.invoke(
+        ascmhl.commands.create,
+        [str(tmp_path), "-v", "-h", "md5", "-h", "sha1", "-h", "c4", "-hb", "processes"],
+    )
+    assert result.exit_code == 0
+
+    assert f"{path_conversion_tests('A/A1.txt')}  md5: fe6975a937016c20b43b17540e6c6246" in result.output
+    assert f"{path_conversion_tests('A/A1.txt')}  sha1: 4a5b95edbea7de5ed2367432645df88cd4f1d1b6" in result.output
+
+    # with multiple jobs the small files are hashed in batches by a pool of worker processes
+    result = runner.invoke(
+        ascmhl.commands.create,
+        [str(tmp_path), "-v", "-h", "md5", "-h", "sha1", "-h", "c4", "-hb", "processes", "-j", "2"],
+    )
+    assert result.exit_code == 0
+    assert f"{path_conversion_tests('A/A1.txt')}  md5: OK" in result.output
+    assert f"{path_conversion_tests('A/A1.txt')}  sha1: OK" in result.output
+
+
+def test_create_read_size(fs):
+    fs.create_file("/root/Stuff.txt", contents="stuff\n")
+    fs.create_file("/root/A/A1.txt", contents="A1\n")
+
+    runner = CliRunner()
+    result = runner.invoke(ascmhl.commands.create, [abspath_conversion_tests("/root"), "-h", "md5", "-rs", "0.5"])
+    assert result.exit_code == 0
+    result = runner.invoke(ascmhl.commands.create, [abspath_conversion_tests("/root"), "-h", "md5", "-rs", "auto"])
+    assert result.exit_code == 0
+    result = runner.invoke(ascmhl.commands.create, [abspath_conversion_tests("/root"), "-h", "md5", "-rs", "large"])
+    assert result.exit_code == 2
+    assert "--read_size" in result.output
+
+
+@freeze_time("2020-01-16 09:15:00")
+def test_create_resume_creates_identical_generation(fs, mocker):
+    for folder in ["A", "B", "B/BA"]:
+        for index in range(3):
+            fs.create_file(f"/root/{folder}/file{index}.txt", contents=f"{folder} {index}\n")
+
+    runner = CliRunner()
+    result = runner.invoke(ascmhl.commands.create, [abspath_conversion_tests("/root"), "-h", "xxh64", "-h", "md5"])
+    assert result.exit_code == 0
+    mhlfilepath = "/root/ascmhl/0001_root_2020-01-16_091500Z.mhl"
+    with open(mhlfilepath, "rb") as file:
+        uninterrupted_manifest = file.read()
+    os.rename("/root/ascmhl", "/uninterrupted_ascmhl")
+
+    # a run that fails while files are hashed closes the journal and keeps it
+    close = mocker.spy(MHLCreationJournal, "close")
+    mocker.patch("ascmhl.commands.seal_file_path", side_effect=RuntimeError("failed"))
+    result = runner.invoke(ascmhl.commands.create, [abspath_conversion_tests("/root"), "-h", "xxh64", "-h", "md5"])
+    assert result.exception
+    mocker.stopall()
+    assert close.call_count == 1
+    with open("/root/ascmhl/ascmhl_journal.ndjson", "r") as file:
+        assert len(file.readlines()) == 2
+
+    # the first run is interrupted before the generation is written, only the journal is left behind
+    mocker.patch("ascmhl.commands.commit_session", side_effect=RuntimeError("interrupted"))
+    result = runner.invoke(ascmhl.commands.create, [abspath_conversion_tests("/root"), "-h", "xxh64", "-h", "md5"])
+    assert result.exception
+    mocker.stopall()
+    assert os.listdir("/root/ascmhl") == ["ascmhl_journal.ndjson"]
+
+    # files that changed after they were recorded in the journal are hashed again
+    with open("/root/B/file1.txt", "w") as file:
+        file.write("changed\n")
+    result = runner.invoke(
+        ascmhl.commands.create, [abspath_conversion_tests("/root"), "-h", "xxh64", "-h", "md5", "--resume", "-v"]
+    )
+    assert result.exit_code == 0
+    assert "resuming with 9 file(s) from the journal" in result.output
+    assert not os.path.exists("/root/ascmhl/ascmhl_journal.ndjson")
+    hash_list = MHLHistory.load_from_path(abspath_conversion_tests("/root")).hash_lists[0]
+    assert hash_list.find_media_hash_for_path("B/file1.txt").find_hash_entry_for_format("md5").hash_string == (
+        "ec1bebaea2c042beb68f7679ddd106a4"
+    )
+
+    # with the original content the resumed run creates the same generation as the uninterrupted one
+    with open("/root/B/file1.txt", "w") as file:
+        file.write("B 1\n")
+    os.rename("/root/ascmhl", "/resumed_ascmhl")
+    mocker.patch("ascmhl.commands.commit_session", side_effect=RuntimeError("interrupted"))
+    runner.invoke(ascmhl.commands.create, [abspath_conversion_tests("/root"), "-h", "xxh64", "-h", "md5"])
+    mocker.stopall()
+    result = runner.invoke(
+        ascmhl.commands.create, [abspath_conversion_tests("/root"), "-h", "xxh64", "-h", "md5", "--resume"]
+    )
+    assert result.exit_code == 0
+    with open(mhlfilepath, "rb") as file:
+        assert file.read() == uninterrupted_manifest
+
+
+def test_create_progress_fd(tmp_path):
+    (tmp_path / "A").mkdir()
+    (tmp_path / "A" / "A1.txt").write_text("A1\n")
+    (tmp_path / "A" / "A2.txt").write_text("A2 A2\n")
+    (tmp_path / "Stuff.txt").write_text("stuff\n")
+    progress_path = tmp_path.parent / f"{tmp_path.name}_progress.ndjson"
+
+    runner = CliRunner()
+    for jobs in ["1", "2"]:
+        with open(progress_path, "w") as progress_file:
+            result = runner.invoke(
+                ascmhl.commands.create,
+                [str(tmp_path), "-h", "xxh64", "-j", jobs, "--progress_fd", str(progress_file.fileno())],
+            )
+        assert result.exit_code == 0
+        with open(progress_path, "r") as progress_file:
+            events = [json.loads(line) for line in progress_file]
+        assert events[0]["kind"] == "enumerated"
+        assert events[-1]["kind"] == "finished"
+        assert events[-1]["files_done"] == events[-1]["files_total"] == 3
+        assert events[-1]["bytes_done"] == events[-1]["bytes_total"] == 15
+        assert events[-1]["enumeration_finished"]
+        assert events[-1]["eta_seconds"] == 0
+
+
+def test_create_trust_cache(tmp_path):
+    # SQLite doesn't see the fake file system, so this test runs on the real one
+    (tmp_path / "A").mkdir()
+    (tmp_path / "A" / "A1.txt").write_text("A1\n")
+    (tmp_path / "Stuff.txt").write_text("stuff\n")
+
+    runner = CliRunner()
+    result = runner.invoke(ascmhl.commands.create, [str(tmp_path), "-v", "-h", "xxh64", "-h", "md5", "-tc"])
+    assert result.exit_code == 0
+    assert "hash cache: 0 hit(s), 2 miss(es)" in result.output
+    assert os.path.exists(tmp_path / "ascmhl" / "ascmhl_hash_cache.db")
+
+    # unchanged files are taken from the cache, changed files are hashed again
+    (tmp_path / "Stuff.txt").write_text("changed stuff\n")
+    result = runner.invoke(ascmhl.commands.create, [str(tmp_path), "-v", "-h", "xxh64", "-h", "md5", "-tc"])
+    assert result.exit_code == 11
+    assert "hash cache: 1 hit(s), 1 miss(es)" in result.output
+    assert f"{path_conversion_tests('A/A1.txt')}  xxh64: OK" in result.output
+
+    # the stat results of the traversal are used for the cache, the files aren't stat'ed again
+    stat = os.stat
+    stated_file_paths = []
+
+    def record_stat(path, *args, **kwargs):
+        if os.fspath(path).endswith(".txt"):
+            stated_file_paths.append(path)
+        return stat(path, *args, **kwargs)
+
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(os, "stat", record_stat)
+        result = runner.invoke(ascmhl.commands.create, [str(tmp_path), "-v", "-h", "xxh64", "-h", "md5", "-tc"])
+    assert result.exit_code == 11
+    assert "hash cache: 2 hit(s), 0 miss(es)" in result.output
+    assert stated_file_paths == []
+
+    # the cache is only used with --trust_cache
+    result = runner.invoke(ascmhl.commands.create, [str(tmp_path), "-v", "-h", "xxh64", "-hc", "cache.db"])
+    assert result.exit_code == 2
+
+
+@freeze_time("2020-01-16 09:15:00")
+def test_create_schedules_files_per_device(fs, monkeypatch):
+    # the fake file systems of the mount points have their own device ids
+    fs.add_mount_point("/root/HDD")
+    fs.add_mount_point("/root/SSD")
+    for folder in ["HDD", "HDD/A", "SSD", "SSD/B"]:
+        for index in range(3):
+            fs.create_file(f"/root/{folder}/file{index}.txt", contents=f"{folder} {index}\n")
+    hdd_device = os.stat("/root/HDD").st_dev
+    monkeypatch.setattr(ascmhl.engine, "is_rotational_device", lambda device: device == hdd_device)
+
+    runner = CliRunner()
+    result = runner.invoke(ascmhl.commands.create, [abspath_conversion_tests("/root"), "-h", "xxh64"])
+    assert result.exit_code == 0
+    mhlfilepath = "/root/ascmhl/0001_root_2020-01-16_091500Z.mhl"
+    with open(mhlfilepath, "rb") as file:
+        serial_manifest = file.read()
+    os.rename("/root/ascmhl", "/serial_ascmhl")
+
+    workers = set()
+    engine = HashingEngine(4, rotational_jobs=1)
+    engine.add_progress_callback(lambda event: workers.update(event.worker_bytes_per_second.keys()))
+    assert engine.jobs_for_device(hdd_device) == 1
+    assert engine.jobs_for_device(os.stat("/root/SSD").st_dev) == 4
+    for _ in engine.hash_folders(
+        post_order_lexicographic_entries(abspath_conversion_tests("/root")), lambda path, file_stat: ["md5"]
+    ):
+        pass
+    assert {worker.split("_")[0] for worker in workers} == {
+        f"ascmhl-hash-{ascmhl.engine._device_name(os.stat(path).st_dev)}" for path in ["/root/HDD", "/root/SSD"]
+    }
+
+    result = runner.invoke(
+        ascmhl.commands.create, [abspath_conversion_tests("/root"), "-h", "xxh64", "-j", "4", "-rj", "1"]
+    )
+    assert result.exit_code == 0
+    with open(mhlfilepath, "rb") as file:
+        assert file.read() == serial_manifest
+
+
+@freeze_time("2020-01-16 09:15:00")
+def test_create_layout_order(fs, monkeypatch):
+    for folder in ["A", "B", "B/BA"]:
+        for index in range(3):
+            fs.create_file(f"/root/{folder}/file{index}.txt", contents=f"{folder} {index}\n")
+
+    runner = CliRunner()
+    result = runner.invoke(ascmhl.commands.create, [abspath_conversion_tests("/root"), "-h", "xxh64"])
+    assert result.exit_code == 0
+    mhlfilepath = "/root/ascmhl/0001_root_2020-01-16_091500Z.mhl"
+    with open(mhlfilepath, "rb") as file:
+        traversal_order_manifest = file.read()
+    os.rename("/root/ascmhl", "/traversal_order_ascmhl")
+
+    # pretend the files are laid out on disk in the reverse order of their paths
+    file_paths = sorted(
+        abspath_conversion_tests(f"/root/{folder}/file{index}.txt")
+        for folder in ["A", "B", "B/BA"]
+        for index in range(3)
+    )
+    monkeypatch.setattr(ascmhl.engine, "physical_file_offset", lambda file_path: -file_paths.index(file_path))
+    hashed_file_paths = []
+    engine = HashingEngine(layout_order=True)
+    engine.add_progress_callback(lambda event: event.kind == "hashed" and hashed_file_paths.append(event.file_path))
+    folders = [
+        folder_path
+        for folder_path, _, _, _ in engine.hash_folders(
+            post_order_lexicographic_entries(abspath_conversion_tests("/root")), lambda file_path, file_stat: ["md5"]
+        )
+    ]
+    assert hashed_file_paths == list(reversed(file_paths))
+    assert folders == [folder_path for folder_path, _ in post_order_lexicographic(abspath_conversion_tests("/root"))]
+
+    for jobs in ["1", "3"]:
+        result = runner.invoke(
+            ascmhl.commands.create, [abspath_conversion_tests("/root"), "-h", "xxh64", "-lo", "-j", jobs]
+        )
+        assert result.exit_code == 0
+        with open(mhlfilepath, "rb") as file:
+            assert file.read() == traversal_order_manifest
+        os.rename("/root/ascmhl", f"/layout_order_{jobs}_ascmhl")
+
+
+def test_create_enumeration_jobs(tmp_path):
+    for folder_index in range(5):
+        for subfolder_index in range(3):
+            folder = tmp_path / f"F{folder_index}" / f"S{subfolder_index}"
+            folder.mkdir(parents=True)
+            (folder / "file.txt").write_text(f"{folder_index}{subfolder_index}\n")
+
+    runner = CliRunner()
+    result = runner.invoke(ascmhl.commands.create, [str(tmp_path), "-h", "xxh64", "-ej", "4"])
+    assert result.exit_code == 0
+    result = runner.invoke(ascmhl.commands.diff, [str(tmp_path), "-ej", "4"])
+    assert result.exit_code == 0
+    (tmp_path / "F3" / "S1" / "file.txt").unlink()
+    result = runner.invoke(ascmhl.commands.diff, [str(tmp_path), "-ej", "4"])
+    assert result.exit_code == 10
@@ -0,0 +1,69 @@
+"""
+__author__ = "Patrick Renner, Alexander Sahm"
+__copyright__ = "Copyright 2024, Pomfort GmbH"
+
+__license__ = "MIT"
+__maintainer__ = "Patrick Renner, Alexander Sahm"
+__email__ = "opensource@pomfort.com"
+"""
+
+import os
+import threading
+from .conftest import abspath_conversion_tests
+
+import ascmhl.engine
+from ascmhl.engine import HashingEngine
+from ascmhl.traverse import post_order_lexicographic_entries
+
+
+def test_layout_order_without_physical_offsets(fs, monkeypatch):
+    # files are created in the reverse order of their paths, so their inodes are in that order too
+    file_paths = [abspath_conversion_tests(f"/root/file{index}.txt") for index in reversed(range(5))]
+    for file_path in file_paths:
+        fs.create_file(file_path, contents=file_path)
+    folders = list(post_order_lexicographic_entries(abspath_conversion_tests("/root")))
+
+    # the inodes of the traversal are used, the files aren't stat'ed again
+    os_stat = os.stat
+    stated_file_paths = []
+
+    def stat(path, *args, **kwargs):
+        stated_file_paths.append(path)
+        return os_stat(path, *args, **kwargs)
+
+    monkeypatch.setattr(ascmhl.engine, "physical_file_offset", lambda file_path: None)
+    monkeypatch.setattr(os, "stat", stat)
+    hashed_file_paths = []
+    engine = HashingEngine(layout_order=True)
+    engine.add_progress_callback(lambda event: event.kind == "hashed" and hashed_file_paths.append(event.file_path))
+    for _ in engine.hash_folders(folders, lambda file_path, file_stat: ["md5"]):
+        pass
+    assert hashed_file_paths == file_paths
+    assert not any(file_path in stated_file_paths for file_path in file_paths)
+
+
+def test_physical_file_offset(tmp_path):
+    (tmp_path / "A1.txt").write_text("A1\n")
+    (tmp_path / "empty.txt").write_text("")
+
+    # not all file systems report extents, but they never fail
+    physical_offset = ascmhl.engine.physical_file_offset(str(tmp_path / "A1.txt"))
+    assert physical_offset is None or physical_offset >= 0
+    assert ascmhl.engine.physical_file_offset(str(tmp_path / "empty.txt")) is None
+    assert ascmhl.engine.physical_file_offset(str(tmp_path / "missing.txt")) is None
+
+
+def test_device_scheduling_without_major_minor_numbers(monkeypatch):
+    # e.g. on Windows, device numbers are used as they are
+    monkeypatch.delattr(os, "major", raising=False)
+    monkeypatch.delattr(os, "minor", raising=False)
+    device = os.stat(".").st_dev
+    assert not ascmhl.engine.is_rotational_device(device)
+    executors = ascmhl.engine._DeviceExecutors(lambda device: 2)
+    assert (
+        executors.executor(device)
+        .submit(lambda: threading.current_thread().name)
+        .result()
+        .startswith(f"ascmhl-hash-{device}_")
+    )
+    executors.shutdown()
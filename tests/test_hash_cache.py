@@ -0,0 +1,49 @@
+"""
+__author__ = "Patrick Renner, Alexander Sahm"
+__copyright__ = "Copyright 2024, Pomfort GmbH"
+
+__license__ = "MIT"
+__maintainer__ = "Patrick Renner, Alexander Sahm"
+__email__ = "opensource@pomfort.com"
+"""
+
+import os
+
+import pytest
+
+from ascmhl.hash_cache import MHLHashCache
+
+
+def test_hash_cache_eviction(tmp_path):
+    file_stats = []
+    for index in range(3):
+        (tmp_path / f"file{index}.txt").write_text(f"{index}\n")
+        file_stats.append(os.stat(tmp_path / f"file{index}.txt"))
+
+    with MHLHashCache(str(tmp_path / "cache.db"), max_entries=2) as hash_cache:
+        for index, file_stat in enumerate(file_stats):
+            hash_cache.store(file_stat, {"md5": bytes([index]) * 16})
+        assert hash_cache.lookup(file_stats[0], ["md5"]) == {"md5": bytes(16)}
+        assert hash_cache.lookup(file_stats[0], ["md5", "sha1"]) is None
+    assert (hash_cache.hits, hash_cache.misses, hash_cache.evictions) == (1, 1, 1)
+
+    with MHLHashCache(str(tmp_path / "cache.db"), max_entries=2) as hash_cache:
+        assert len([file_stat for file_stat in file_stats if hash_cache.lookup(file_stat, ["md5"])]) == 2
+
+
+def test_hash_cache_of_registered_hash_formats(tmp_path, null_hash_format):
+    (tmp_path / "file.txt").write_text("media-hash-list")
+    file_stat = os.stat(tmp_path / "file.txt")
+
+    with MHLHashCache(str(tmp_path / "cache.db")) as hash_cache:
+        hash_cache.store(file_stat, {"null": bytes.fromhex("f67c5a4f")})
+        assert hash_cache.lookup(file_stat, ["null"]) == {"null": bytes.fromhex("f67c5a4f")}
+        # digests are checked against the digest size of their format
+        with pytest.raises(ValueError):
+            hash_cache.store(file_stat, {"md5": bytes.fromhex("f67c5a4f")})
+        with pytest.raises(KeyError):
+            hash_cache.lookup(file_stat, ["unknown"])
+
+        # e.g. the cached digest of a plugin that was replaced by another one with the same name
+        hash_cache.connection.execute("UPDATE file_digests SET digest = ?", (bytes(8),))
+        assert hash_cache.lookup(file_stat, ["null"]) is None
@@ -7,8 +7,16 @@ __maintainer__ = "Patrick Renner, Alexander Sahm"
 __email__ = "opensource@pomfort.com"
 """
 
+import errno
+import hashlib
+import os
+
 import pytest
+
+import ascmhl.hasher
 from ascmhl.hasher import *
+from ascmhl.shared_memory_hasher import SharedMemoryAggregateHasher
+from .conftest import NullHasher
 
 
 def test_cannot_instantiate_abstract_classes():
@@ -149,3 +157,303 @@ def test_hash_list_concat_equals_chunking():
         concat = hasher.bytes_from_string_digest("".join(hash_list))
         h2 = hasher.hash_data(concat)
         assert h1 == h2  # assert that sequentially feeding hashes is same as concat then feeding hashes
+
+
+def test_shared_memory_aggregate_hasher(tmp_path):
+    # worker processes don't see the fake file system, so this test runs on the real one
+    file_path = tmp_path / "data-file.bin"
+    file_path.write_bytes(bytes(range(256)) * 1000)
+    hash_formats = ["md5", "sha1", "c4"]
+    expected_lookup = multiple_format_hash_file(str(file_path), hash_formats)
+
+    # use a small ring buffer so the slots are reused several times per file
+    with SharedMemoryAggregateHasher(chunk_size=1000, num_slots=4) as shared_memory_hasher:
+        assert shared_memory_hasher.hash_file(str(file_path), hash_formats) == expected_lookup
+        # the workers are reset after each file
+        assert shared_memory_hasher.hash_file(str(file_path), hash_formats) == expected_lookup
+        with pytest.raises(FileNotFoundError):
+            shared_memory_hasher.hash_file(str(tmp_path / "missing.bin"), hash_formats)
+        assert shared_memory_hasher.hash_file(str(file_path), ["md5"]) == {"md5": expected_lookup["md5"]}
+
+
+def test_concurrent_aggregate_hashing_of_file(fs):
+    # a file larger than one chunk, so concurrent hashing is also chosen automatically
+    file = "/data-file.bin"
+    fs.create_file(file, contents=bytes(range(256)) * 10000)
+    hash_formats = ["md5", "sha1", "xxh64", "c4"]
+
+    serial_hash_lookup = multiple_format_hash_file(file, hash_formats, concurrent=False)
+    assert multiple_format_hash_file(file, hash_formats, concurrent=True) == serial_hash_lookup
+    assert multiple_format_hash_file(file, hash_formats) == serial_hash_lookup
+
+
+def test_read_options_produce_identical_hashes(tmp_path):
+    # memory mapping doesn't work on the fake file system, so this test runs on the real one
+    file_path = tmp_path / "data-file.bin"
+    file_path.write_bytes(bytes(range(256)) * 1000)
+    empty_file_path = tmp_path / "empty-file.bin"
+    empty_file_path.write_bytes(b"")
+    hash_formats = ["md5", "sha1", "xxh64", "c4"]
+
+    for path in [str(file_path), str(empty_file_path)]:
+        expected_lookup = {hash_format: hash_data(file_path_data(path), hash_format) for hash_format in hash_formats}
+        # a small chunk size reuses the buffers several times per file
+        for read_options in [
+            ReadOptions(),
+            ReadOptions(chunk_size=1000),
+            ReadOptions(use_mmap=True),
+            ReadOptions(chunk_size=1000, use_mmap=True),
+        ]:
+            for hash_format in hash_formats:
+                assert hash_file(path, hash_format, read_options) == expected_lookup[hash_format]
+            for concurrent in [False, True]:
+                assert multiple_format_hash_file(path, hash_formats, concurrent, read_options) == expected_lookup
+
+
+def file_path_data(path):
+    with open(path, "rb") as fd:
+        return fd.read()
+
+
+def test_read_size_tuner_chooses_fastest_size_per_device():
+    tuner = ReadSizeTuner()
+    megabyte = 1024 * 1024
+    large_file_size = max(ReadSizeTuner.candidate_sizes) * ReadSizeTuner.min_chunks_per_probe_file
+
+    # small files are read with the default size and don't count as probes
+    assert tuner.chunk_size_for_file(1, 1000) == megabyte
+    tuner.add_measurement(1, megabyte, 1000, 1.0)
+
+    # the candidates are probed in turn, 16MB is the fastest one on device 1
+    for _ in range(ReadSizeTuner.probe_files_per_size):
+        for _ in ReadSizeTuner.candidate_sizes:
+            chunk_size = tuner.chunk_size_for_file(1, large_file_size)
+            tuner.add_measurement(1, chunk_size, large_file_size, 1.0 if chunk_size == 16 * megabyte else 2.0)
+    assert tuner.chosen_sizes() == {1: 16 * megabyte}
+    assert tuner.chunk_size_for_file(1, 1000) == 16 * megabyte
+
+    # other devices are probed independently
+    assert 2 not in tuner.chosen_sizes()
+    assert tuner.chunk_size_for_file(2, 1000) == megabyte
+
+
+def test_auto_tuned_read_size_produces_identical_hashes(fs):
+    file = "/data-file.bin"
+    fs.create_file(file, contents=bytes(range(256)) * 10000)
+    hash_formats = ["md5", "xxh64"]
+    expected_lookup = multiple_format_hash_file(file, hash_formats)
+
+    read_options = ReadOptions(auto_tune_read_size=True)
+    read_options.read_size_tuner.candidate_sizes = [1000, 4000, 16000]
+    for _ in range(10):
+        assert multiple_format_hash_file(file, hash_formats, read_options=read_options) == expected_lookup
+        assert hash_file(file, "md5", read_options) == expected_lookup["md5"]
+    assert len(read_options.read_size_tuner.chosen_sizes()) == 1
+
+
+def test_page_cache_modes_produce_identical_hashes(tmp_path):
+    # fadvise and O_DIRECT need real file descriptors, so this test runs on the real file system
+    file_path = tmp_path / "data-file.bin"
+    file_path.write_bytes(bytes(range(256)) * 1000 + b"unaligned tail")
+    hash_formats = ["md5", "sha1", "xxh64", "c4"]
+    expected_lookup = multiple_format_hash_file(str(file_path), hash_formats)
+
+    for page_cache_mode in page_cache_modes:
+        for read_options in [
+            ReadOptions(page_cache_mode=page_cache_mode),
+            ReadOptions(chunk_size=5000, page_cache_mode=page_cache_mode),
+        ]:
+            for hash_format in hash_formats:
+                assert hash_file(str(file_path), hash_format, read_options) == expected_lookup[hash_format]
+            for concurrent in [False, True]:
+                assert (
+                    multiple_format_hash_file(str(file_path), hash_formats, concurrent, read_options) == expected_lookup
+                )
+        with SharedMemoryAggregateHasher(chunk_size=5000, page_cache_mode=page_cache_mode) as shared_memory_hasher:
+            assert shared_memory_hasher.hash_file(str(file_path), hash_formats) == expected_lookup
+
+    # buffers for O_DIRECT are aligned
+    assert ReadOptions(chunk_size=5000, page_cache_mode="direct").chunk_size == 8192
+    with pytest.raises(ValueError):
+        ReadOptions(use_mmap=True, page_cache_mode="bypass")
+
+
+@pytest.mark.skipif(not hasattr(os, "O_DIRECT"), reason="O_DIRECT is not supported on this platform")
+def test_direct_mode_falls_back_to_bypass(tmp_path, monkeypatch):
+    file_path = tmp_path / "data-file.bin"
+    file_path.write_bytes(bytes(range(256)) * 1000)
+    expected_hash_string = hash_file(str(file_path), "md5")
+
+    # simulates a file system that doesn't support O_DIRECT
+    os_open = os.open
+
+    def open_without_direct(path, flags, *args, **kwargs):
+        if flags & os.O_DIRECT:
+            raise OSError(errno.EINVAL, "Invalid argument", path)
+        return os_open(path, flags, *args, **kwargs)
+
+    advices = []
+    monkeypatch.setattr(os, "open", open_without_direct)
+    monkeypatch.setattr("ascmhl.hasher._advise", lambda fd, offset, length, advice: advices.append(advice))
+
+    read_options = ReadOptions(chunk_size=5000, page_cache_mode="direct")
+    assert hash_file(str(file_path), "md5", read_options) == expected_hash_string
+    assert "POSIX_FADV_DONTNEED" in advices
+
+
+def legacy_c4_string_digest(digest: bytes) -> str:
+    # the original C4 encoding, kept to verify the table driven codec
+    hash_value = int(digest.hex(), 16)
+    c4_string = ""
+    while hash_value != 0:
+        modulo = hash_value % 58
+        hash_value = hash_value // 58
+        c4_string = C4.charset[modulo] + c4_string
+    return "c4" + c4_string.rjust(88, "1")
+
+
+def legacy_c4_bytes_from_string_digest(hash_string: str) -> bytes:
+    result = 0
+    for i in range(2, 90):
+        result = result * 58 + C4.charset.index(hash_string[i])
+    return result.to_bytes(64, byteorder="big")
+
+
+def test_c4_codec_matches_legacy_implementation():
+    import random
+
+    generator = random.Random(4)
+    digests = [bytes(64), b"\xff" * 64, bytes(63) + b"\x01", b"\x01" + bytes(63)]
+    digests += [bytes(generator.getrandbits(8) for _ in range(64)) for _ in range(1000)]
+    digests += [bytes(index) + bytes(generator.getrandbits(8) for _ in range(64 - index)) for index in range(64)]
+
+    hash_strings = C4.string_digests_from_bytes(digests)
+    for digest, hash_string in zip(digests, hash_strings):
+        assert hash_string == legacy_c4_string_digest(digest)
+        assert C4.string_digest_from_bytes(digest) == hash_string
+        assert legacy_c4_bytes_from_string_digest(hash_string) == digest
+        assert C4.bytes_from_string_digest(hash_string) == digest
+    assert C4.bytes_from_string_digests(hash_strings) == digests
+
+    with pytest.raises(ValueError):
+        C4.bytes_from_string_digest(hash_strings[0][:-1])
+    with pytest.raises(ValueError):
+        C4.bytes_from_string_digest(hash_strings[0][:-1] + "0")
+
+
+def test_directory_hash_context_digests_match_hash_strings():
+    children = [(f"file{index}.txt", f"content {index}".encode("utf8")) for index in range(20)]
+    for hash_type in HashType:
+        hash_format = hash_type.name
+        string_context = DirectoryHashContext(hash_format)
+        digest_context = DirectoryHashContext(hash_format)
+        for name, data in children:
+            hasher = new_hasher_for_hash_type(hash_format)
+            hasher.update(data)
+            string_context.append_file_hash(name, hasher.string_digest())
+            digest_context.append_file_digest(name, hasher.digest())
+        sub_folder_context = DirectoryHashContext(hash_format)
+        string_context.append_directory_hashes(
+            "folder", sub_folder_context.final_content_hash_str(), sub_folder_context.final_structure_hash_str()
+        )
+        digest_context.append_directory_digests(
+            "folder", sub_folder_context.final_content_digest(), sub_folder_context.final_structure_digest()
+        )
+
+        # the sorted digests give the same directory hashes as the sorted hash strings
+        content_hash_strings = [new_hasher_for_hash_type(hash_format).hash_data(data) for _, data in children]
+        content_hash_strings.append(sub_folder_context.final_content_hash_str())
+        expected_content_hash = hash_of_hash_list(content_hash_strings, hash_format)
+        assert string_context.final_content_hash_str() == expected_content_hash
+        assert digest_context.final_content_hash_str() == expected_content_hash
+        assert digest_context.final_structure_hash_str() == string_context.final_structure_hash_str()
+        # the final hashes can be computed repeatedly with the reused hasher
+        assert digest_context.final_content_hash_str() == expected_content_hash
+
+
+def test_internal_hash_formats_are_registered():
+    data = b"media-hash-list"
+    assert hash_data(data, "sha256") == hashlib.sha256(data).hexdigest()
+    assert hash_data(data, "blake2b") == hashlib.blake2b(data).hexdigest()
+    assert "blake2b" in registered_hash_formats()
+    assert "blake2b" not in registered_hash_formats(in_specification_only=True)
+    assert set(registered_hash_formats(in_specification_only=True)) == {hash_type.name for hash_type in HashType}
+    assert fastest_hash_format(["md5", "xxh64", "sha1"]) == "xxh64"
+    assert fastest_hash_format(["md5", "c4"]) == "c4"
+
+
+def test_hasher_plugins_are_loaded_from_entry_points(monkeypatch):
+    class EntryPoint:
+        name = "null"
+
+        @staticmethod
+        def load():
+            return NullHasher
+
+    def entry_points(group):
+        assert group == hasher_plugin_entry_point_group
+        return [EntryPoint()]
+
+    monkeypatch.setattr("ascmhl.hasher.entry_points", entry_points)
+    monkeypatch.setattr("ascmhl.hasher._hasher_plugins_loaded", False)
+    try:
+        assert hash_data(b"media-hash-list", "null") == "f67c5a4f"
+        assert not hasher_registration("null").in_specification
+        assert fastest_hash_format(["md5", "null"]) == "null"
+        # formats can't be registered twice with different hashers
+        with pytest.raises(ValueError):
+            register_hasher("md5", NullHasher)
+        with pytest.raises(KeyError):
+            new_hasher_for_hash_type("unknown")
+    finally:
+        ascmhl.hasher._hasher_registrations.pop("null", None)
+
+
+def test_registered_hash_formats_are_used_for_hashing(fs, null_hash_format):
+    fs.create_file("/small.txt", contents=b"media-hash-list")
+    expected_lookup = {
+        "md5": hash_data(b"media-hash-list", "md5"),
+        "null": "f67c5a4f",
+        "blake2b": hashlib.blake2b(b"media-hash-list").hexdigest(),
+    }
+    hash_formats = sorted(expected_lookup)
+
+    for concurrent in [False, True]:
+        assert multiple_format_hash_file("/small.txt", hash_formats, concurrent) == expected_lookup
+    digest_lookup = multiple_format_hash_small_files([("/small.txt", 15, hash_formats)])[0]
+    assert hash_strings_from_digests(digest_lookup) == expected_lookup
+    assert digests_from_hash_strings(expected_lookup) == digest_lookup
+    assert hasher_registration("null").digest_size == 4
+    with pytest.raises(KeyError):
+        multiple_format_hash_file("/small.txt", ["unknown"])
+
+
+def test_small_file_batch_hashing(fs):
+    files = {"/small.txt": b"media-hash-list", "/empty.txt": b"", "/grown.bin": bytes(range(256)) * 10000}
+    for path, data in files.items():
+        fs.create_file(path, contents=data)
+    hash_formats = ["md5", "xxh64", "c4"]
+
+    # the size of grown.bin is given too small, as if the file had grown since it was listed
+    batch = [("/small.txt", 15, hash_formats), ("/empty.txt", 0, ["md5"]), ("/grown.bin", 100, hash_formats)]
+    results = multiple_format_hash_small_files(batch)
+
+    assert hash_strings_from_digests(results[0]) == multiple_format_hash_data(files["/small.txt"], hash_formats)
+    assert hash_strings_from_digests(results[1]) == {"md5": hash_data(b"", "md5")}
+    assert hash_strings_from_digests(results[2]) == multiple_format_hash_data(files["/grown.bin"], hash_formats)
+    with pytest.raises(FileNotFoundError):
+        multiple_format_hash_small_files([("/missing.txt", 0, ["md5"])])
+
+
+def test_small_file_batch_hashing_ignores_rejected_advice(tmp_path, monkeypatch):
+    file_path = tmp_path / "small.txt"
+    file_path.write_bytes(b"media-hash-list")
+
+    def posix_fadvise(fd, offset, length, advice):
+        raise OSError(errno.ESPIPE, "Illegal seek")
+
+    # e.g. file systems that don't support the advice
+    monkeypatch.setattr(os, "posix_fadvise", posix_fadvise, raising=False)
+    monkeypatch.setattr(os, "POSIX_FADV_DONTNEED", 4, raising=False)
+    results = multiple_format_hash_small_files([(str(file_path), 15, ["md5"])], drop_from_page_cache=True)
+    assert hash_strings_from_digests(results[0]) == {"md5": hash_data(b"media-hash-list", "md5")}
@@ -15,6 +15,7 @@ from click.testing import CliRunner
 from lxml import etree
 from testfixtures import TempDirectory
 import ascmhl.commands
+from ascmhl.ignore import MHLIgnoreSpec
 
 
 XML_IGNORE_TAG = "pattern"
@@ -229,3 +230,60 @@ def test_ignore_on_nested_histories(temp_tree):
 
     result = runner.invoke(ascmhl.commands.verify, [root_dir])
     assert not result.exception
+
+
+def test_ignore_matcher():
+    """
+    tests that the compiled matcher matches relative paths like a pathspec with the same patterns
+    """
+    patterns = [".DS_Store", "ascmhl", "ascmhl/", "cache/", "/Proxies", "Clips/render", "*.tmp", "A???.mov", "#x"]
+    ignore_spec = MHLIgnoreSpec(patterns)
+    matcher = ignore_spec.get_matcher()
+    assert ignore_spec.get_matcher() is matcher
+    path_spec = ignore_spec.get_path_spec()
+
+    for relative_path, is_dir in [
+        ("a.txt", False),
+        ("1/.DS_Store", False),
+        ("ascmhl", True),
+        ("cache", True),
+        ("cache", False),
+        ("1/cache/c.txt", False),
+        ("Proxies/p.mov", False),
+        ("1/Proxies/p.mov", False),
+        ("Clips/render", True),
+        ("1/Clips/render/r.exr", False),
+        ("x.tmp", False),
+        ("1/A001.mov", False),
+        ("1/A0001.mov", False),
+        ("#x", False),
+    ]:
+        expected = path_spec.match_file(relative_path + "/" if is_dir else relative_path)
+        assert matcher.match(relative_path, is_dir) == expected, relative_path
+        # while traversing, only the children of directories that aren't ignored are matched
+        parent_path, _, name = relative_path.rpartition("/")
+        if not parent_path or not matcher.match(parent_path, True):
+            assert matcher.match_child(parent_path or ".", name, is_dir) == expected, relative_path
+
+    # negated patterns are matched in order
+    matcher = MHLIgnoreSpec(["*.tmp", "!keep.tmp"]).get_matcher()
+    assert matcher.match("1/x.tmp")
+    assert not matcher.match("1/keep.tmp")
+
+    # patterns are only compiled again when they change
+    ignore_spec.set_patterns(patterns, ["*.mov"])
+    assert ignore_spec.get_matcher() is not matcher
+    assert ignore_spec.get_pattern_list() == patterns + ["*.mov"]
+
+
+def test_ignore_prunes_directories(temp_tree):
+    """
+    tests that ignored directories are skipped with their contents and anchored patterns match relative to the root
+    """
+    runner = CliRunner()
+    root_dir, mhl_dir = f"{temp_tree.path}", f"{os.path.join(temp_tree.path,'ascmhl')}"
+
+    assert runner.invoke(ascmhl.commands.create, [root_dir, "-i", "11/", "-i", "/2/12"]).exit_code == 0
+    gen_1_paths = paths_from_mhl_file(mhl_file_for_gen(mhl_dir, 1))
+    assert {"1", "1/c.txt", "1/12/e.txt", "2"} <= set(gen_1_paths)
+    assert not {"1/11", "1/11/d.txt", "2/11", "2/11/f.txt", "2/12", "2/12/g.txt"} & set(gen_1_paths)
@@ -0,0 +1,35 @@
+"""
+__author__ = "Patrick Renner, Alexander Sahm"
+__copyright__ = "Copyright 2024, Pomfort GmbH"
+
+__license__ = "MIT"
+__maintainer__ = "Patrick Renner, Alexander Sahm"
+__email__ = "opensource@pomfort.com"
+"""
+
+import os
+
+import pytest
+
+import ascmhl.hasher
+from ascmhl.manifest_cache import MHLManifestCache
+
+
+def test_manifest_cache_of_registered_hash_formats(tmp_path, null_hash_format):
+    manifest_path = str(tmp_path / "0001_root_2020-01-15_130000Z.mhl")
+    with open(manifest_path, "w") as manifest_file:
+        manifest_file.write("media-hash-list")
+    cache_file_path = str(tmp_path / "cache.ndjson")
+
+    cache = MHLManifestCache(cache_file_path)
+    assert cache.hash_file(manifest_path, "null") == "f67c5a4f"
+    assert cache.hash_file(manifest_path, "md5") == ascmhl.hasher.hash_file(manifest_path, "md5")
+    with pytest.raises(KeyError):
+        cache.lookup(manifest_path, os.stat(manifest_path), "unknown")
+
+    # hashes of formats that aren't registered any more are dropped when the cache file is loaded
+    ascmhl.hasher._hasher_registrations.pop("null")
+    cache = MHLManifestCache(cache_file_path)
+    assert cache.lookup(manifest_path, os.stat(manifest_path), "md5") is not None
+    ascmhl.hasher.register_hasher(null_hash_format, ascmhl.hasher.hasher_registration("xxh32").hasher_class)
+    assert cache.lookup(manifest_path, os.stat(manifest_path), "null") is None
@@ -9,17 +9,24 @@ __email__ = "opensource@pomfort.com"
 
 import os
 import re
+import pytest
 from .conftest import abspath_conversion_tests
 
 from freezegun import freeze_time
+from lxml import etree
 from click.testing import CliRunner
 from .conftest import path_conversion_tests
 
 from ascmhl import hashlist_xml_parser
 from ascmhl import utils
+from ascmhl.errors import ModifiedMHLManifestFileException
+from ascmhl.hasher import hash_file
 from ascmhl.__version__ import ascmhl_file_extension
 from ascmhl.history import MHLHistory
+from ascmhl.manifest_loader import MHLManifestLoader
 import ascmhl.commands
+import ascmhl.manifest_cache
+import ascmhl.manifest_loader
 
 
 def test_simple_parsing():
@@ -28,6 +35,49 @@ def test_simple_parsing():
     assert len(hash_list.media_hashes) > 0
 
 
+def test_parsing_with_hashing(tmp_path):
+    path = "examples/scenarios/Output/scenario_01/travel_01/A002R2EC/ascmhl/0001_A002R2EC_2020-01-16_091500Z.mhl"
+    expected_hash_list = hashlist_xml_parser.parse(path)
+    expected_hash_string = hash_file(path, "c4")
+
+    hash_list, hash_string, file_stat = hashlist_xml_parser.parse_and_hash(path, "c4", expected_hash_string)
+    assert hash_string == expected_hash_string
+    assert file_stat.st_size == os.path.getsize(path)
+
+    def media_hash_values(parsed_hash_list):
+        return [
+            (
+                media_hash.path,
+                media_hash.file_size,
+                [(entry.hash_format, entry.hash_string) for entry in media_hash.hash_entries],
+            )
+            for media_hash in parsed_hash_list.media_hashes
+        ]
+
+    assert media_hash_values(hash_list) == media_hash_values(expected_hash_list)
+    assert hash_list.creator_info.host_name == expected_hash_list.creator_info.host_name
+    assert hash_list.process_info.root_media_hash is not None
+
+    # a modified manifest is reported as modified, even if it can't be parsed any more
+    modified_path = tmp_path / "0001_A002R2EC_2020-01-16_091500Z.mhl"
+    with open(path, "rb") as mhl_file:
+        modified_path.write_bytes(mhl_file.read() + b"changed content")
+    with pytest.raises(ModifiedMHLManifestFileException):
+        hashlist_xml_parser.parse_and_hash(str(modified_path), "c4", expected_hash_string)
+    with pytest.raises(etree.XMLSyntaxError):
+        hashlist_xml_parser.parse_and_hash(str(modified_path), "c4")
+
+    # also if the modified manifest is well-formed XML, but has invalid values
+    with open(path, "rb") as mhl_file:
+        content = mhl_file.read()
+    assert b'size="' in content
+    modified_path.write_bytes(content.replace(b'size="', b'size="3x', 1))
+    with pytest.raises(ModifiedMHLManifestFileException):
+        hashlist_xml_parser.parse_and_hash(str(modified_path), "c4", expected_hash_string)
+    with pytest.raises(ValueError):
+        hashlist_xml_parser.parse_and_hash(str(modified_path), "c4")
+
+
 @freeze_time("2020-01-16 09:15:00")
 def test_child_history_parsing(fs, nested_mhl_histories):
     """ """
@@ -229,3 +279,64 @@ def test_hash_list_name_parsing():
     _test_regex("0001_AA_2020-01-16_091500.xml", False)
     _test_regex("AA_2020-01-16_091500_0002.mhl", False)
     _test_regex("0003_.mhl", False)
+
+
+def test_parallel_history_parsing(tmp_path, monkeypatch):
+    root_path = tmp_path / "root"
+    (root_path / "A" / "AA").mkdir(parents=True)
+    (root_path / "Stuff.txt").write_text("stuff\n")
+    (root_path / "A" / "AA" / "AA1.txt").write_text("AA1\n")
+    runner = CliRunner()
+    result = runner.invoke(ascmhl.commands.create, [str(root_path / "A" / "AA"), "-h", "xxh64"])
+    assert result.exit_code == 0
+    result = runner.invoke(ascmhl.commands.create, [str(root_path), "-h", "xxh64"])
+    assert result.exit_code == 0
+    (root_path / "A" / "A1.txt").write_text("A1\n")
+    result = runner.invoke(ascmhl.commands.create, [str(root_path), "-h", "md5"])
+    assert result.exit_code == 0
+
+    def hash_list_values(history):
+        return [
+            (
+                hash_list.generation_number,
+                hash_list.get_file_name(),
+                hash_list.process_info.process,
+                hash_list.process_info.root_media_hash.hash_entries[0].hash_string,
+                [(reference.path, reference.reference_hash) for reference in hash_list.hash_list_references],
+                [(media_hash.path, media_hash.is_directory) for media_hash in hash_list.media_hashes],
+                [
+                    [(entry.hash_format, entry.hash_string, entry.hash_date) for entry in media_hash.hash_entries]
+                    for media_hash in hash_list.media_hashes
+                ],
+            )
+            for hash_list in history.hash_lists
+        ]
+
+    history = MHLHistory.load_from_path(str(root_path))
+
+    # the manifests are parsed in worker processes, independent of their size
+    monkeypatch.setattr(MHLManifestLoader, "min_parallel_bytes", 0)
+    monkeypatch.setattr(ascmhl.manifest_cache, "shared_manifest_cache", ascmhl.manifest_cache.MHLManifestCache(None))
+    parsed_in_workers = []
+    hash_list_from_compact = ascmhl.manifest_loader._hash_list_from_compact
+
+    def record_hash_list_from_compact(compact_hash_list):
+        parsed_in_workers.append(compact_hash_list[0])
+        return hash_list_from_compact(compact_hash_list)
+
+    monkeypatch.setattr(ascmhl.manifest_loader, "_hash_list_from_compact", record_hash_list_from_compact)
+    parallel_history = MHLHistory.load_from_path(str(root_path), jobs=2)
+    assert len(parsed_in_workers) == 5
+    assert hash_list_values(parallel_history) == hash_list_values(history)
+    assert hash_list_values(parallel_history.child_histories[0]) == hash_list_values(history.child_histories[0])
+    assert len(parallel_history.hash_lists[0].referenced_hash_lists) == 1
+    # the hashes of the manifests are cached in the calling process
+    assert ascmhl.manifest_cache.shared_manifest_cache.misses == 5
+
+    # errors are raised as without worker processes
+    monkeypatch.setattr(ascmhl.manifest_cache, "shared_manifest_cache", ascmhl.manifest_cache.MHLManifestCache(None))
+    manifest_path = sorted((root_path / "ascmhl").glob("*.mhl"))[0]
+    with open(manifest_path, "a") as mhl_file:
+        mhl_file.write("changed content")
+    with pytest.raises(ModifiedMHLManifestFileException):
+        MHLHistory.load_from_path(str(root_path), jobs=2)
@@ -8,6 +8,7 @@ __email__ = "opensource@pomfort.com"
 """
 
 import os
+import pytest
 from .conftest import abspath_conversion_tests
 from .conftest import path_conversion_tests
 
@@ -15,6 +16,9 @@ from click.testing import CliRunner
 from freezegun import freeze_time
 
 import ascmhl
+import ascmhl.manifest_cache
+from ascmhl.errors import ModifiedMHLManifestFileException
+from ascmhl.history import MHLHistory
 
 
 @freeze_time("2020-01-16 09:15:00")
@@ -197,3 +201,47 @@ def test_create_nested_mhl_chain_missing(fs):
     result = runner.invoke(ascmhl.commands.diff, [abspath_conversion_tests("/root")])
     assert result.exception
     assert result.exit_code == 32
+
+
+@freeze_time("2020-01-16 09:15:00")
+def test_manifest_cache(fs, nested_mhl_histories, monkeypatch):
+    # a second generation of the root history references the new generations of the child histories
+    runner = CliRunner()
+    result = runner.invoke(ascmhl.commands.create, [abspath_conversion_tests("/root"), "-h", "xxh64"])
+    assert result.exit_code == 0
+    num_manifests = sum(len([name for name in names if name.endswith(".mhl")]) for _, _, names in os.walk("/root"))
+
+    cache_file_path = "/cache/ascmhl_manifest_cache.ndjson"
+    cache = ascmhl.manifest_cache.MHLManifestCache(cache_file_path)
+    monkeypatch.setattr(ascmhl.manifest_cache, "shared_manifest_cache", cache)
+    MHLHistory.load_from_path(abspath_conversion_tests("/root"))
+    # the referenced manifests are hashed for their chain and for the references of the root history only once
+    assert cache.misses == num_manifests
+    assert cache.hits == 3
+
+    # a later run takes all hashes from the cache file
+    def fail_hash_file(file_path, hash_format):
+        raise AssertionError(f"{file_path} was hashed again")
+
+    hash_file = ascmhl.manifest_cache.hash_file
+    monkeypatch.setattr(ascmhl.manifest_cache, "hash_file", fail_hash_file)
+    cache = ascmhl.manifest_cache.MHLManifestCache(cache_file_path)
+    monkeypatch.setattr(ascmhl.manifest_cache, "shared_manifest_cache", cache)
+    MHLHistory.load_from_path(abspath_conversion_tests("/root"))
+    assert cache.misses == 0
+    monkeypatch.setattr(ascmhl.manifest_cache, "hash_file", hash_file)
+
+    # in paranoid mode the cache file is ignored
+    cache = ascmhl.manifest_cache.MHLManifestCache(cache_file_path)
+    cache.paranoid = True
+    monkeypatch.setattr(ascmhl.manifest_cache, "shared_manifest_cache", cache)
+    MHLHistory.load_from_path(abspath_conversion_tests("/root"))
+    assert cache.misses == num_manifests
+
+    # a modified manifest is hashed again
+    with open("/root/B/ascmhl/0001_B_2020-01-15_130000Z.mhl", "a") as mhl_file:
+        mhl_file.write("changed content")
+    cache = ascmhl.manifest_cache.MHLManifestCache(cache_file_path)
+    monkeypatch.setattr(ascmhl.manifest_cache, "shared_manifest_cache", cache)
+    with pytest.raises(ModifiedMHLManifestFileException):
+        MHLHistory.load_from_path(abspath_conversion_tests("/root"))
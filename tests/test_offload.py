@@ -0,0 +1,112 @@
+"""
+__author__ = "Patrick Renner, Alexander Sahm"
+__copyright__ = "Copyright 2024, Pomfort GmbH"
+
+__license__ = "MIT"
+__maintainer__ = "Patrick Renner, Alexander Sahm"
+__email__ = "opensource@pomfort.com"
+"""
+
+import os
+from freezegun import freeze_time
+from click.testing import CliRunner
+from .conftest import abspath_conversion_tests
+from .conftest import path_conversion_tests
+
+from ascmhl.hasher import ReadOptions
+from ascmhl.history import MHLHistory
+from ascmhl.offload import StreamingCopier
+import ascmhl.commands
+
+
+@freeze_time("2020-01-16 09:15:00")
+def test_offload_to_multiple_destinations(fs):
+    fs.create_file("/card/Stuff.txt", contents="stuff\n")
+    fs.create_file("/card/A/A1.txt", contents="A1\n")
+    fs.create_file("/card/A/A2.txt", contents="A2" * 100000)
+
+    runner = CliRunner()
+    result = runner.invoke(
+        ascmhl.commands.offload,
+        [abspath_conversion_tests("/card"), "/dst1", "/dst2", "-h", "xxh64", "-h", "md5", "-v"],
+    )
+    assert result.exit_code == 0
+    assert (
+        f"copied {path_conversion_tests('A/A1.txt')}  md5: fe6975a937016c20b43b17540e6c6246, xxh64: 95e230e90be29dd6"
+        in result.output
+    )
+
+    for destination in ["/dst1", "/dst2"]:
+        with open(f"{destination}/card/A/A2.txt", "r") as file:
+            assert file.read() == "A2" * 100000
+        hash_list = MHLHistory.load_from_path(abspath_conversion_tests(f"{destination}/card")).hash_lists[0]
+        assert hash_list.process_info.process == "transfer"
+        assert hash_list.find_media_hash_for_path("A/A1.txt").find_hash_entry_for_format("xxh64").hash_string == (
+            "95e230e90be29dd6"
+        )
+        assert hash_list.find_media_hash_for_path("A").is_directory
+
+    # the source isn't changed and existing copies aren't overwritten
+    assert not os.path.exists("/card/ascmhl")
+    result = runner.invoke(ascmhl.commands.offload, [abspath_conversion_tests("/card"), "/dst2"])
+    assert result.exit_code == 40
+
+
+@freeze_time("2020-01-16 09:15:00")
+def test_offload_copies_history(fs, simple_mhl_history):
+    runner = CliRunner()
+    result = runner.invoke(ascmhl.commands.offload, [abspath_conversion_tests("/root"), "/dst", "-h", "xxh64"])
+    assert result.exit_code == 0
+
+    history = MHLHistory.load_from_path(abspath_conversion_tests("/dst/root"))
+    assert len(history.hash_lists) == 2
+    assert history.hash_lists[1].find_media_hash_for_path("Stuff.txt").hash_entries[0].action == "verified"
+
+
+@freeze_time("2020-01-16 09:15:00")
+def test_offload_fails_for_corrupted_copy(fs, mocker):
+    fs.create_file("/card/Stuff.txt", contents="stuff\n")
+    fs.create_file("/card/A/A1.txt", contents="A1\n")
+
+    copy_file = StreamingCopier.copy_file
+
+    def corrupting_copy_file(copier, source_path, destination_paths):
+        digest_lookup = copy_file(copier, source_path, destination_paths)
+        if source_path.endswith("A1.txt"):
+            with open(destination_paths[1], "w") as file:
+                file.write("A2\n")
+        return digest_lookup
+
+    mocker.patch.object(StreamingCopier, "copy_file", corrupting_copy_file)
+    runner = CliRunner()
+    result = runner.invoke(ascmhl.commands.offload, [abspath_conversion_tests("/card"), "/dst1", "/dst2", "-h", "md5"])
+    assert result.exit_code == 11
+    assert f"ERROR: copy of {path_conversion_tests('A/A1.txt')} in " in result.output
+    assert os.path.exists("/dst1/card/ascmhl/ascmhl_chain.xml")
+    assert not os.path.exists("/dst2/card/ascmhl")
+
+
+def test_offload_drops_copied_chunks(fs, mocker):
+    fs.create_file("/card/A2.txt", contents="A2" * 10000)
+
+    consumed_offsets = []
+    mocker.patch.object(
+        ReadOptions, "chunks_consumed", lambda read_options, fd, offset, chunk_size: consumed_offsets.append(offset)
+    )
+    with StreamingCopier(1, ["md5"], ReadOptions(chunk_size=4096)) as copier:
+        copier.copy_file("/card/A2.txt", ["/A2.txt"])
+    # the offset is the end of the copied data, so the chunk that was just copied is dropped too
+    assert consumed_offsets == [4096, 8192, 12288, 16384, 20000]
+
+
+@freeze_time("2020-01-16 09:15:00")
+def test_offload_fails_for_symlinked_folder(fs):
+    fs.create_file("/card/A/A1.txt", contents="A1\n")
+    fs.create_symlink("/card/LinkToA", "A")
+
+    runner = CliRunner()
+    result = runner.invoke(ascmhl.commands.offload, [abspath_conversion_tests("/card"), "/dst1", "/dst2"])
+    assert result.exit_code == 41
+    assert f"found one at path {abspath_conversion_tests('/card/LinkToA')}" in result.output
+    assert not os.path.exists("/dst1/card/ascmhl")
+    assert not os.path.exists("/dst2/card/ascmhl")
@@ -0,0 +1,30 @@
+"""
+__author__ = "Patrick Renner, Alexander Sahm"
+__copyright__ = "Copyright 2024, Pomfort GmbH"
+
+__license__ = "MIT"
+__maintainer__ = "Patrick Renner, Alexander Sahm"
+__email__ = "opensource@pomfort.com"
+"""
+
+from ascmhl.progress import ProgressTracker
+
+
+def test_progress_tracker_events():
+    events = []
+    tracker = ProgressTracker()
+    tracker.add_callback(events.append)
+    tracker.files_enumerated(2, 300)
+    tracker.files_hashed([("/root/A1.txt", 100)], 1.0, "worker-1")
+    tracker.finish_enumeration()
+    tracker.files_hashed([("/root/A2.txt", 200)], 1.0, "worker-2")
+    tracker.finish()
+
+    assert [event.kind for event in events] == ["enumerated", "hashed", "enumeration_finished", "hashed", "finished"]
+    assert events[1].file_path == "/root/A1.txt"
+    assert (events[1].files_done, events[1].bytes_done, events[1].bytes_total) == (1, 100, 300)
+    assert events[1].worker_bytes_per_second == {"worker-1": 100.0}
+    assert events[1].eta_seconds > 0
+    assert not events[1].enumeration_finished
+    assert events[-1].worker_bytes_per_second == {"worker-1": 100.0, "worker-2": 200.0}
+    assert events[-1].eta_seconds == 0
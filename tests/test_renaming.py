@@ -15,6 +15,8 @@ from freezegun import freeze_time
 
 import ascmhl
 from ascmhl import hasher
+from ascmhl.hashlist import MHLHashEntry, MHLHashList, MHLMediaHash
+from ascmhl.history import MHLHistory
 
 
 @freeze_time("2020-01-16 09:15:00")
@@ -264,3 +266,46 @@ def test_detect_renamed_folders(fs):
     result = runner.invoke(ascmhl.commands.create, [abspath_conversion_tests("/root"), "-h", "xxh64", "-v", "-dr"])
     assert "a renamed" not in result.output
     assert not result.exception
+
+
+def test_history_path_index():
+    def hash_list_with_media_hashes(generation_number, media_hashes):
+        hash_list = MHLHashList()
+        hash_list.generation_number = generation_number
+        for path, previous_path, hash_entries in media_hashes:
+            media_hash = MHLMediaHash()
+            media_hash.path = path
+            media_hash.previous_path = previous_path
+            for hash_format, hash_string, action in hash_entries:
+                media_hash.append_hash_entry(MHLHashEntry(hash_format, hash_string, action))
+            hash_list.append_hash(media_hash)
+        return hash_list
+
+    history = MHLHistory()
+    history.append_hash_list(
+        hash_list_with_media_hashes(1, [("A.txt", None, [("md5", "a1", "original")]), ("C.txt", None, [])])
+    )
+    history.append_hash_list(
+        hash_list_with_media_hashes(
+            2, [("B.txt", "A.txt", [("md5", "a1", "verified"), ("xxh64", "a2", "new")]), ("C.txt", None, [])]
+        )
+    )
+    assert history.find_original_hash_entry_for_path("A.txt").hash_string == "a1"
+    # the previous path finds the renamed file as well
+    assert history.find_existing_hash_formats_for_path("A.txt") == ["md5", "xxh64"]
+    assert history.find_existing_hash_formats_for_path("B.txt") == ["md5", "xxh64"]
+    assert history.find_first_hash_entry_for_path("B.txt").action == "verified"
+    assert history.find_first_hash_entry_for_path("B.txt", "xxh64").hash_string == "a2"
+    assert history.find_first_hash_entry_for_path("C.txt") is None
+    assert history.find_first_hash_entry_for_path("D.txt") is None
+    assert history.find_previous_path_for_path("B.txt") == "A.txt"
+    assert history.find_previous_path_for_path("A.txt") == "A.txt"
+
+    # hash lists that are appended after the first query are added to the index
+    history.append_hash_list(
+        hash_list_with_media_hashes(3, [("D.txt", "B.txt", [("md5", "a1", "verified")]), ("C.txt", None, [])])
+    )
+    assert history.find_previous_path_for_path("D.txt") == "B.txt"
+    assert history.find_existing_hash_formats_for_path("B.txt") == ["md5", "xxh64"]
+    assert history.find_first_hash_entry_for_path("D.txt").action == "verified"
+    assert history.find_directory_hash_entries_for_path("C.txt") == []
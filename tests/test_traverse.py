@@ -0,0 +1,81 @@
+"""
+__author__ = "Patrick Renner, Alexander Sahm"
+__copyright__ = "Copyright 2024, Pomfort GmbH"
+
+__license__ = "MIT"
+__maintainer__ = "Patrick Renner, Alexander Sahm"
+__email__ = "opensource@pomfort.com"
+"""
+
+import os
+import sys
+
+from ascmhl import ignore
+from ascmhl.traverse import post_order_lexicographic, post_order_lexicographic_entries
+
+
+def test_traversal_entries(tmp_path):
+    (tmp_path / "A").mkdir()
+    (tmp_path / "A" / "A1.txt").write_text("A1\n")
+    (tmp_path / "B.txt").write_text("B\n")
+    (tmp_path / "ignored.txt").write_text("ignored\n")
+    os.symlink(tmp_path / "A", tmp_path / "linked")
+    ignore_spec = ignore.MHLIgnoreSpec(None, ["ignored.txt"])
+
+    folders = list(post_order_lexicographic_entries(str(tmp_path), ignore_spec.get_matcher()))
+    # the symlinked folder is listed as a folder, but not traversed
+    assert [folder_path for folder_path, _, _ in folders] == [str(tmp_path / "A"), str(tmp_path)]
+    assert [(entry.name, entry.is_dir) for entry in folders[1][2]] == [("A", True), ("B.txt", False), ("linked", True)]
+    assert folders == [
+        (
+            folder_path,
+            os.stat(folder_path),
+            [(name, is_dir, os.stat(os.path.join(folder_path, name))) for name, is_dir in children],
+        )
+        for folder_path, children in post_order_lexicographic(str(tmp_path), ignore_spec.get_matcher())
+    ]
+
+
+def test_traversal_with_enumeration_jobs(tmp_path):
+    for folder_index in range(5):
+        for subfolder_index in range(3):
+            folder = tmp_path / f"F{folder_index}" / f"S{subfolder_index}"
+            folder.mkdir(parents=True)
+            (folder / "file.txt").write_text(f"{folder_index}{subfolder_index}\n")
+            (folder / "ignored.txt").write_text("ignored\n")
+    ignore_spec = ignore.MHLIgnoreSpec(None, ["ignored.txt", "S2"])
+
+    # folders are listed ahead of the traversal, the output is the same as with one job
+    for jobs in [2, 8]:
+        assert list(post_order_lexicographic(str(tmp_path), ignore_spec.get_matcher(), jobs)) == list(
+            post_order_lexicographic(str(tmp_path), ignore_spec.get_matcher())
+        )
+        assert list(post_order_lexicographic_entries(str(tmp_path), ignore_spec.get_matcher(), jobs)) == list(
+            post_order_lexicographic_entries(str(tmp_path), ignore_spec.get_matcher())
+        )
+
+
+def test_traversal_of_deep_tree(tmp_path):
+    # deeper than the recursion limit, the traversal keeps its own stack
+    depth = sys.getrecursionlimit() + 100
+    folder_path = str(tmp_path / "deep")
+    os.mkdir(folder_path)
+    for _ in range(depth):
+        folder_path = os.path.join(folder_path, "d")
+        os.mkdir(folder_path)
+    with open(os.path.join(folder_path, "file.txt"), "w") as file:
+        file.write("deep\n")
+
+    folders = list(post_order_lexicographic(str(tmp_path / "deep")))
+    assert len(folders) == depth + 1
+    assert folders[0] == (folder_path, [("file.txt", False)])
+    assert folders[-1] == (str(tmp_path / "deep"), [("d", True)])
+    # with a memory cap of a single entry the folders are listed ahead one at a time
+    assert list(post_order_lexicographic(str(tmp_path / "deep"), jobs=4, max_prefetched_entries=1)) == folders
+
+    # shutil.rmtree (used to clean up tmp_path) recurses per level, the folders are removed in post order
+    for folder_path, children in folders:
+        for name, is_dir in children:
+            if not is_dir:
+                os.remove(os.path.join(folder_path, name))
+        os.rmdir(folder_path)
@@ -122,3 +122,51 @@ def test_verify_single_file(fs, simple_mhl_history):
         ascmhl.commands.verify, ["-v", "-sf", str(path_conversion_tests("A/A1.txt")), abspath_conversion_tests("/root")]
     )
     assert result.exit_code == 11
+
+
+@freeze_time("2020-01-16 09:15:00")
+def test_verify_parallel_jobs(fs, simple_mhl_history):
+    runner = CliRunner()
+    result = runner.invoke(ascmhl.commands.verify, ["-v", "-j", "3", abspath_conversion_tests("/root")])
+    assert result.exit_code == 0
+    assert f"verification (xxh64) of file {str(path_conversion_tests('A/A1.txt'))}: OK\n" in result.output
+
+    with open("/root/A/A1.txt", "a") as file:
+        file.write("!!")
+    result = runner.invoke(ascmhl.commands.verify, ["-j", "3", abspath_conversion_tests("/root")])
+    assert result.exit_code == 11
+
+    result = runner.invoke(ascmhl.commands.verify, ["-v", "-dh", "-j", "3", abspath_conversion_tests("/root")])
+    assert "ERROR: content hash mismatch" in result.output
+    assert result.exit_code == 12
+
+
+def test_verify_trust_cache(tmp_path):
+    # SQLite doesn't see the fake file system, so this test runs on the real one
+    (tmp_path / "A").mkdir()
+    (tmp_path / "A" / "A1.txt").write_text("A1\n")
+    (tmp_path / "Stuff.txt").write_text("stuff\n")
+
+    runner = CliRunner()
+    result = runner.invoke(ascmhl.commands.create, [str(tmp_path), "-h", "xxh64"])
+    assert result.exit_code == 0
+
+    cache_path = str(tmp_path.parent / f"{tmp_path.name}_cache.db")
+    result = runner.invoke(ascmhl.commands.verify, [str(tmp_path), "-v", "-tc", "-hc", cache_path])
+    assert result.exit_code == 0
+    assert "hash cache: 0 hit(s), 2 miss(es)" in result.output
+
+    result = runner.invoke(ascmhl.commands.verify, [str(tmp_path), "-v", "-tc", "-hc", cache_path])
+    assert result.exit_code == 0
+    assert "hash cache: 2 hit(s), 0 miss(es)" in result.output
+    assert f"verification (xxh64) of file {path_conversion_tests('A/A1.txt')}: OK" in result.output
+
+
+def test_verify_trust_cache_without_history(tmp_path):
+    (tmp_path / "Stuff.txt").write_text("stuff\n")
+
+    runner = CliRunner()
+    result = runner.invoke(ascmhl.commands.verify, [str(tmp_path), "-tc"])
+    assert result.exit_code == 30
+    # the default hash cache isn't created for a folder without a history
+    assert not (tmp_path / "ascmhl").exists()